@@ -2,3 +2,5 @@ class BDPException(Exception):
     pass
 class TimeShiftError(Exception):
     pass
+class TaskWriterError(Exception):
+    pass
@@ -3,8 +3,13 @@
 # built in imports
 import os
 import re
+import time
+import hashlib
+import traceback
 from operator import xor
 from ConfigParser import SafeConfigParser
+from multiprocessing import Process, Manager
+from Queue import Empty
 
 # I use this for debugging in IPython if available.
 #try:
@@ -20,6 +25,8 @@ import tables
 import warnings
 from scipy.io import loadmat
 
+from bdpexceptions import TaskWriterError
+
 # I name my array nodes with a string of numbers which causes PyTables natural
 # naming scheme not to work. This ignores those errors.
 warnings.filterwarnings('ignore', category=tables.NaturalNameWarning)
@@ -46,6 +53,10 @@ class DataSet(object):
             Path to the directory containing the the raw calibration h5 files.
         pathToCorruption : string, optional
             The path to the data corruption csv file.
+        precision : string, optional
+            The default floating point precision of the runs loaded from the
+            data set, 'float64' or 'float32', see `Run`. The default is
+            'float64'.
 
         Notes
         -----
@@ -65,6 +76,8 @@ class DataSet(object):
             else:
                 setattr(self, k, config.get('data', k))
 
+        self.precision = kwargs.get('precision', 'float64')
+
         # This class has the ability to load data from mat files or h5 files.
         # The preference is mat files.
         if self.pathToRunMat is not None:
@@ -122,6 +135,18 @@ class DataSet(object):
             RunID = tables.Int32Col(dflt=0)
             StdSpeed = tables.Float32Col(dflt=0.)
             Tau = tables.Float32Col(dflt=0.)
+            # the task is the slice [TaskStart:TaskEnd] of the computed
+            # signals stored in /computedData
+            TaskStart = tables.Int32Col(dflt=0)
+            TaskEnd = tables.Int32Col(dflt=0)
+            # the data and code the task signals were computed with, see
+            # task_dependencies, the names of the calibrated sensors are
+            # stored in the CalibratedSensors attribute of the run's task
+            # group
+            CalibrationIDs = tables.StringCol(32)
+            CalibrationHash = tables.StringCol(32)
+            CorruptionHash = tables.StringCol(32)
+            CodeVersion = tables.StringCol(32)
 
         return TaskTable
 
@@ -355,10 +380,11 @@ class DataSet(object):
         # delete any arrays that may be there too
         self.close()
         self.open(mode='a')
-        try:
-            self.database.root.taskData._f_remove(recursive=True)
-        except tables.NoSuchNodeError:
-            pass
+        for group in ['taskData', 'computedData']:
+            try:
+                self.database.root._f_getChild(group)._f_remove(recursive=True)
+            except tables.NoSuchNodeError:
+                pass
         self.close()
 
     def sync_data(self, directory='exports/'):
@@ -723,7 +749,7 @@ class DataSet(object):
 
         self.close()
 
-    def add_task_signals(self, taskSignals, meta):
+    def add_task_signals(self, taskSignals, meta, computedSignals=None):
         """Writes processed task signals to the data base.
 
         Parameters
@@ -732,6 +758,30 @@ class DataSet(object):
             A dictionary of Signal objects.
         meta : dictionary
             The should contain the RunID, Tau, Duration, MeanSpeed, StdSpeed.
+            If `computedSignals` is supplied it also needs the TaskStart and
+            TaskEnd indices of the task in the computed signals. The entries
+            that aren't columns of the task table, e.g. CalibratedSensors,
+            are stored as attributes of the run's task group.
+        computedSignals : dictionary, optional
+            A dictionary of the computed Signal objects the task signals were
+            sliced from. If supplied the computed signals are stored and only
+            the task signals that are not in `computedSignals` are stored as
+            arrays, the rest are referenced by the task indices.
+
+        """
+        self.add_task_signals_many([(taskSignals, meta, computedSignals)])
+
+    def add_task_signals_many(self, tasks):
+        """Writes the processed task signals of several runs to the database
+        with a single open/close of the file.
+
+        Parameters
+        ----------
+        tasks : list
+            A list of (taskSignals, meta) or (taskSignals, meta,
+            computedSignals) tuples, see `add_task_signals`. The signals can
+            also be given as (array, attributes) pairs as produced by
+            `split_task_signals`.
 
         """
         self.close()
@@ -739,39 +789,288 @@ class DataSet(object):
 
         taskTable = self.database.root.taskTable
 
-        try:
-            taskData = self.database.root.taskData
-        except tables.NoSuchNodeError:
-            taskData = self.database.createGroup('/', 'taskData')
-
-        # if the run isn't in the table, then append it, if it is then overwite
-        # it
-        if meta['RunID'] in taskTable.cols.RunID:
-            for row in taskTable.where('RunID == {}'.format(str(int(meta['RunID'])))):
+        groups = {}
+        for group in ['taskData', 'computedData']:
+            try:
+                groups[group] = self.database.root._f_getChild(group)
+            except tables.NoSuchNodeError:
+                groups[group] = self.database.createGroup('/', group)
+
+        # read the stored run ids once instead of scanning the column for
+        # every run
+        storedRuns = set(taskTable.col('RunID'))
+        columns = set(taskTable.colnames)
+
+        def write_arrays(where, runID, signals):
+            """Replaces the run's group with arrays of the signals and returns
+            the group."""
+            try:
+                where._f_getChild(run_id_string(runID))._f_remove(
+                    recursive=True)
+            except tables.NoSuchNodeError:
+                pass
+            runGroup = self.database.createGroup(where, run_id_string(runID))
+            for name, (sig, attrs) in signals.items():
+                arr = self.database.createArray(runGroup, name, sig)
+                for k, v in attrs.items():
+                    arr._f_setAttr(k, v)
+            return runGroup
+
+        for task in tasks:
+            taskSignals, meta = task[:2]
+            try:
+                computedSignals = task[2]
+            except IndexError:
+                computedSignals = None
+
+            runID = int(meta['RunID'])
+            # the metadata that isn't in the table is stored with the arrays
+            groupAttrs = {k: v for k, v in meta.items() if k not in columns}
+            meta = {k: v for k, v in meta.items() if k in columns}
+            # if the run isn't in the table, then append it, if it is then
+            # overwite it
+            if runID in storedRuns:
+                for row in taskTable.where('RunID == {}'.format(str(runID))):
+                    for k, v in meta.items():
+                        row[k] = v
+                    row.update()
+            else:
                 for k, v in meta.items():
-                    row[k] = v
-                row.update()
-            runGroup = taskData._f_getChild(run_id_string(meta['RunID']))
-            for name, sig in taskSignals.items():
-                timeSeries = runGroup._f_getChild(name)
-                timeSeries[:] = sig
-                for attr in ['units', 'name', 'runid', 'sampleRate', 'source']:
-                    timeSeries._f_setAttr(attr, getattr(sig, attr))
+                    taskTable.row[k] = v
+                taskTable.row.append()
+                storedRuns.add(runID)
+
+            taskSignals = split_task_signals(taskSignals)
+            if computedSignals is not None:
+                # the task signals that are slices of the computed signals
+                # are only stored once
+                computedSignals = split_task_signals(computedSignals)
+                write_arrays(groups['computedData'], runID, computedSignals)
+                taskSignals = {k: v for k, v in taskSignals.items()
+                               if k not in computedSignals}
+            runGroup = write_arrays(groups['taskData'], runID, taskSignals)
+            for k, v in groupAttrs.items():
+                runGroup._f_setAttr(k, v)
+
+        taskTable.flush()
+
+        self.close()
+
+    def read_signal(self, runid, name, t0=None, t1=None, stage='raw',
+            inSamples=False):
+        """Returns a single signal of a run, reading only the samples in the
+        given window from the database.
+
+        Parameters
+        ----------
+        runid : int or str
+            The run id.
+        name : str
+            The name of the signal.
+        t0 : float, optional
+            The start of the window in seconds on the time base of the stage.
+            If None the window starts at the first sample.
+        t1 : float, optional
+            The end of the window in seconds on the time base of the stage, the
+            sample at t1 is included. If None the window ends at the last
+            sample.
+        stage : string, optional, {'raw', 'computed', 'task'}
+            The stage of the stored signal.
+        inSamples : boolean, optional
+            If true, t0 and t1 are sample indices instead of times, e.g. the
+            slice signal[t0:t1].
+
+        Returns
+        -------
+        signal : Signal
+            The windowed signal, or a RawSignal for the raw stage. The offset
+            of the signal is the time of its first sample.
+
+        """
+        runid = run_id_string(runid)
+
+        if stage not in ['raw', 'computed', 'task']:
+            raise ValueError('{} is not a valid stage.'.format(stage))
+
+        self.open()
+
+        try:
+            signal = self._read_signal(runid, name, t0, t1, stage, inSamples)
+        finally:
+            self.close()
+
+        return signal
+
+    def _read_signal(self, runid, name, t0, t1, stage, inSamples):
+        """Reads the windowed signal from the open database, see
+        `read_signal`."""
+        from main import Signal, RawSignal
+        from signalprocessing import time_window
+
+        if stage == 'raw':
+            runTable = self.database.root.runTable
+            signalTable = self.database.root.signalTable
+            source = [row['source'] for row in
+                    signalTable.where('signal == name')][0]
+            if source == 'NI':
+                sampleRate = get_cell(runTable, 'NISampleRate',
+                        get_row_num(runid, runTable))
+            else:
+                sampleRate = get_cell(runTable, 'VNavSampleRate',
+                        get_row_num(runid, runTable))
+            start = 0
+            stop = self.database.getNode('/rawData/' + runid,
+                    name=name).shape[0]
         else:
-            for k, v in meta.items():
-                taskTable.row[k] = v
-            taskTable.row.append()
-
-            # store all of the task signals as arrays
-            taskGroup = self.database.createGroup(self.database.root.taskData,
-                    run_id_string(meta['RunID']))
-            for name, sig in taskSignals.items():
-                arr = self.database.createArray(taskGroup, name, sig)
-                for attr in ['units', 'name', 'runid', 'sampleRate', 'source']:
-                    arr._f_setAttr(attr, getattr(sig, attr))
-            taskTable.flush()
+            taskTable = self.database.root.taskTable
+            start, stop = 0, None
+            try:
+                node = self.database.getNode('/' + stage + 'Data/' + runid,
+                        name=name)
+            except tables.NoSuchNodeError:
+                if stage == 'task':
+                    # the task signal is a slice of the computed signal
+                    node = self.database.getNode('/computedData/' + runid,
+                            name=name)
+                    rownum = get_row_num(runid, taskTable)
+                    start = taskTable.cols.TaskStart[rownum]
+                    stop = taskTable.cols.TaskEnd[rownum]
+                else:
+                    raise
+            if stop is None:
+                stop = node.shape[0]
+
+            meta = {k : node._f_getAttr(k) for k in ['units', 'name', 'runid',
+                'sampleRate', 'source']}
+            sampleRate = meta['sampleRate']
+
+        if inSamples:
+            first = 0 if t0 is None else min(max(t0, 0), stop - start)
+            last = stop - start if t1 is None else min(max(t1, first),
+                    stop - start)
+        else:
+            first, last = time_window(t0, t1, sampleRate, stop - start)
+
+        if stage == 'raw':
+            # RawSignal takes the window as the times of its first and last
+            # samples, which time_window maps back to the same indices
+            signal = RawSignal(runid, name, self.database,
+                    window=(first / float(sampleRate),
+                        (last - 1) / float(sampleRate)))
+        else:
+            meta['offset'] = first / float(sampleRate)
+            signal = Signal(node.read(start + first, start + last), meta)
+
+        return signal
+
+    def stale_runs(self):
+        """Returns the runs which have stored task signals that were computed
+        with calibration data, data corruption records or processing code that
+        has since changed.
+
+        Returns
+        -------
+        stale : list
+            The five digit run id strings of the stale runs.
+
+        """
+        from main import Sensor, matlab_date_to_object
+
+        corruption = self.load_corruption_data()
 
         self.close()
+        self.open()
+
+        taskTable = self.database.root.taskTable
+        taskData = self.database.root.taskData
+        runTable = self.database.root.runTable
+        calibrationTable = self.database.root.calibrationTable
+
+        dependencies = ['CalibrationIDs', 'CalibrationHash', 'CorruptionHash',
+                'CodeVersion']
+
+        sensors = {}
+        stale = []
+        for row in taskTable.iterrows():
+            runID = row['RunID']
+            try:
+                stored = {k: row[k] for k in dependencies}
+                sensorNames = taskData._f_getChild(
+                    run_id_string(runID))._f_getAttr('CalibratedSensors')
+            except (KeyError, AttributeError, tables.NoSuchNodeError):
+                # the task data is older than the dependency tracking
+                stale.append(run_id_string(runID))
+                continue
+
+            # find the calibrations the run would use now
+            runDate = matlab_date_to_object(get_cell(runTable, 'DateTime',
+                get_row_num(runID, runTable)))
+            calibrations = {}
+            try:
+                for name in sensorNames.split(';'):
+                    if name:
+                        if name not in sensors:
+                            sensors[name] = Sensor(name, calibrationTable)
+                        calibrations[name] = \
+                            sensors[name].get_data_for_date(runDate)
+            except KeyError:
+                # a sensor is no longer in the calibration table
+                stale.append(run_id_string(runID))
+                continue
+
+            current = task_dependencies(runID, calibrations, corruption)
+            if {k: current[k] for k in dependencies} != stored:
+                stale.append(run_id_string(runID))
+
+        self.close()
+
+        return stale
+
+    def reprocess_stale(self, pathToParameterData=None, store=True):
+        """Recomputes and stores the task signals of the stale runs.
+
+        Parameters
+        ----------
+        pathToParameterData : string, optional
+            The path to a data directory for the BicycleParameters package.
+        store : boolean or TaskSignalWriter, optional
+            Where the recomputed task signals should be stored, see `Run`.
+
+        Returns
+        -------
+        reprocessed : list
+            The run ids that were successfully recomputed.
+
+        """
+        from main import Run
+
+        stale = self.stale_runs()
+
+        # the runs are reprocessed with the filter frequency they were stored
+        # with
+        self.open()
+        filterFreqs = {}
+        for row in self.database.root.taskTable.iterrows():
+            filterFreqs[run_id_string(row['RunID'])] = row['FilterFrequency']
+        self.close()
+
+        reprocessed = []
+        for runID in stale:
+            print('Reprocessing stale run {}.'.format(runID))
+            filterFreq = filterFreqs.get(runID, np.nan)
+            if np.isnan(filterFreq):
+                filterFreq = None
+            else:
+                filterFreq = float(filterFreq)
+            try:
+                Run(runID, self, pathToParameterData, forceRecalc=True,
+                        filterFreq=filterFreq, store=store)
+            except Exception as e:
+                print('Run {} could not be reprocessed: {}'.format(runID, e))
+            else:
+                reprocessed.append(runID)
+
+        return reprocessed
 
     def load_corruption_data(self):
         """Returns a dictionary containing the contents of the provided data
@@ -847,6 +1146,292 @@ class DataSet(object):
         self.close()
 
 
+class TaskSignalWriter(object):
+    """A single writer process that collects task signals submitted by any
+    number of workers and writes them to the database in batches.
+
+    Examples
+    --------
+    The writer should be started before the workers and closed after all of
+    the runs have been submitted::
+
+        >>> writer = TaskSignalWriter(dataset)
+        >>> writer.start()
+        >>> run = Run('00105', dataset, store=writer)
+        >>> writer.close()
+
+    """
+
+    def __init__(self, dataset, batchSize=20, flushInterval=30.):
+        """Sets up the queue for the writer.
+
+        Parameters
+        ----------
+        dataset : DataSet
+            The data set which the task signals will be written to.
+        batchSize : integer, optional
+            The writer flushes the queued runs to the database after this many
+            have been submitted.
+        flushInterval : float, optional
+            The maximum number of seconds a submitted run will wait in the
+            queue before it is written.
+
+        """
+        self.dataset = dataset
+        self.batchSize = batchSize
+        self.flushInterval = flushInterval
+
+        # a managed queue can be passed to worker pools as an argument
+        self._manager = Manager()
+        self.queue = self._manager.Queue()
+        self._written = self._manager.Value('i', 0)
+        self._error = self._manager.Value('c', '')
+        self.process = None
+
+    def __getstate__(self):
+        # the workers only need the queue to submit task signals
+        state = self.__dict__.copy()
+        for k in ['_manager', 'process', 'dataset']:
+            state[k] = None
+        return state
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def written(self):
+        """The number of runs that have been written to the database."""
+        return self._written.value
+
+    def start(self):
+        """Starts the writer process."""
+        self.process = Process(target=self._serve)
+        self.process.start()
+
+    def submit(self, taskSignals, meta, computedSignals=None):
+        """Queues the task signals of a run for writing. See
+        `DataSet.add_task_signals` for the arguments."""
+        if computedSignals is not None:
+            computedSignals = split_task_signals(computedSignals)
+        self.queue.put((split_task_signals(taskSignals), meta,
+            computedSignals))
+
+    def close(self):
+        """Writes any remaining task signals and stops the writer process.
+
+        Raises
+        ------
+        TaskWriterError
+            If the writer process failed. The runs in the failed batch and any
+            submitted after it have not been written.
+
+        """
+        self.queue.put(None)
+        self.process.join()
+        if self.process.exitcode != 0:
+            raise TaskWriterError(('The task signal writer exited with code ' +
+                '{} after writing {} runs:\n{}').format(self.process.exitcode,
+                    self.written, self._error.value))
+
+    def _serve(self):
+        """Collects the queued task signals and writes them in batches until
+        the stop signal is received."""
+
+        batch = []
+        lastFlush = time.time()
+        stop = False
+
+        while not stop:
+            timeLeft = self.flushInterval - (time.time() - lastFlush)
+            try:
+                item = self.queue.get(timeout=max(timeLeft, 0.01))
+            except Empty:
+                pass
+            else:
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+
+            full = len(batch) >= self.batchSize
+            late = time.time() - lastFlush >= self.flushInterval
+            if batch and (stop or full or late):
+                try:
+                    self.dataset.add_task_signals_many(batch)
+                except Exception:
+                    # the traceback is reported by close in the parent
+                    self._error.value = traceback.format_exc()
+                    raise
+                self._written.value += len(batch)
+                print('Wrote {} runs to the database, {} total.'.format(
+                    len(batch), self._written.value))
+                batch = []
+            if full or late:
+                lastFlush = time.time()
+
+class RunArrayCache(object):
+    """Reads the array nodes of a run from the database at most once.
+
+    The supply voltage channels (e.g. FiveVolts) are needed by every
+    ratiometric sensor in a run and are also loaded as raw signals
+    themselves. Sharing one cache between all of the RawSignals of a run means
+    each node is only read from the file once per load.
+
+    Notes
+    -----
+    The cached arrays are shared by the signals that read them, so they are
+    read only and modifying one in place raises a ValueError. Copy the array
+    to modify it.
+
+    """
+
+    def __init__(self, database):
+        """
+        Parameters
+        ----------
+        database : pytables object
+            The open hdf5 database for the instrumented bicycle.
+
+        """
+        self.database = database
+        self.readCounts = {}
+        self._arrays = {}
+
+    def node(self, where, name):
+        """Returns the node without reading its data."""
+        return self.database.getNode(where, name=name)
+
+    def read(self, where, name, start=0, stop=None):
+        """Returns the samples [start:stop] of an array node.
+
+        Parameters
+        ----------
+        where : string
+            The path to the group, e.g. '/rawData/00105'.
+        name : string
+            The name of the array node in the group.
+        start : integer, optional
+            The first sample to read.
+        stop : integer, optional
+            One past the last sample to read, all samples if None.
+
+        Returns
+        -------
+        array : ndarray
+            The read only data, this is the same object for repeated reads.
+
+        """
+        path = where + '/' + name
+        key = (path, start, stop)
+        try:
+            return self._arrays[key]
+        except KeyError:
+            array = np.asarray(self.node(where, name).read(start, stop))
+            array.flags.writeable = False
+            self._arrays[key] = array
+            self.readCounts[path] = self.readCounts.get(path, 0) + 1
+            return array
+
+    def clear(self):
+        """Drops the cached arrays, the read counts are kept."""
+        self._arrays = {}
+
+# the version of the signal processing, increase it when a change to the
+# processing code changes the task signals so that the stored runs are stale
+processingVersion = 1
+
+def processing_version():
+    """Returns the version of the code that processes the signals.
+
+    Returns
+    -------
+    version : string
+        The `processingVersion` of the package.
+
+    """
+    return str(processingVersion)
+
+def task_dependencies(runID, calibrations, corruption):
+    """Returns a record of the data and code the task signals of a run depend
+    on.
+
+    Parameters
+    ----------
+    runID : int or str
+        The run id.
+    calibrations : dictionary
+        The calibration data (a row of the calibration table as a dictionary)
+        used for each scaled signal in the run, keyed by the sensor name.
+    corruption : dictionary
+        The data corruption records as returned by
+        `DataSet.load_corruption_data`.
+
+    Returns
+    -------
+    dependencies : dictionary
+        The CalibrationIDs (an md5 hex digest of the sensor names and their
+        calibration ids), CalibrationHash, CorruptionHash and CodeVersion
+        columns of the task table and the CalibratedSensors, the sensor names
+        joined by semicolons.
+
+    """
+    calibrationColumns = ['calibrationID', 'slope', 'bias', 'offset',
+            'calibrationSupplyVoltage', 'runSupplyVoltage',
+            'runSupplyVoltageSource', 'timeStamp']
+
+    names = sorted(calibrations.keys())
+
+    calibrationIDs = ';'.join(['{}:{}'.format(name,
+        calibrations[name]['calibrationID']) for name in names])
+
+    calibrationHash = hashlib.md5()
+    for name in names:
+        calibrationHash.update(name + repr([calibrations[name][col] for col in
+            calibrationColumns]))
+
+    runID = int(runID)
+    if runID in corruption['runid']:
+        index = corruption['runid'].index(runID)
+        record = [corruption[col][index] for col in ['corrupt', 'warning',
+            'knee', 'handlebar', 'trailer']]
+    else:
+        record = None
+
+    return {'CalibrationIDs': hashlib.md5(calibrationIDs).hexdigest(),
+            'CalibratedSensors': ';'.join(names),
+            'CalibrationHash': calibrationHash.hexdigest(),
+            'CorruptionHash': hashlib.md5(repr(record)).hexdigest(),
+            'CodeVersion': processing_version()}
+
+def split_task_signals(taskSignals):
+    """Returns the task signals as plain arrays and their attributes.
+
+    Parameters
+    ----------
+    taskSignals : dictionary
+        A dictionary of Signal objects or (array, attributes) tuples.
+
+    Returns
+    -------
+    split : dictionary
+        A dictionary mapping the signal names to (array, attributes) tuples
+        where the attributes are the metadata stored with each array.
+
+    """
+    split = {}
+    for name, sig in taskSignals.items():
+        if isinstance(sig, tuple):
+            split[name] = sig
+        else:
+            attrs = {k: getattr(sig, k) for k in ['units', 'name', 'runid',
+                'sampleRate', 'source']}
+            split[name] = (np.asarray(sig), attrs)
+    return split
+
 def get_cell(datatable, colname, rownum):
     '''
     Returns the contents of a cell in a pytable. Apply unsize_vector correctly
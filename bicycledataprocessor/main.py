@@ -3,7 +3,11 @@
 # built in imports
 import os
 import datetime
-from math import pi
+import hashlib
+import cPickle
+from collections import OrderedDict
+from functools import partial
+from timeit import default_timer
 from warnings import warn
 from ConfigParser import SafeConfigParser
 
@@ -18,19 +22,19 @@ from ConfigParser import SafeConfigParser
 # dependencies
 import numpy as np
 from scipy import io
-from scipy.integrate import cumtrapz
-from scipy.optimize import curve_fit
 import matplotlib.pyplot as plt
 from tables import NoSuchNodeError
 
 import dtk.process as process
-from dtk.bicycle import front_contact, benchmark_to_moore
+from dtk.bicycle import benchmark_to_moore
 import bicycleparameters as bp
 
 # local dependencies
-from database import get_row_num, get_cell, pad_with_zeros, run_id_string
+from database import (get_row_num, get_cell, pad_with_zeros, run_id_string,
+                      task_dependencies, RunArrayCache)
 import signalprocessing as sigpro
 from bdpexceptions import TimeShiftError
+from units import Quantity, conversion_factor
 
 config = SafeConfigParser()
 config.read(os.path.join(os.path.dirname(__file__), '..', 'defaults.cfg'))
@@ -41,8 +45,6 @@ class Signal(np.ndarray):
 
     Attributes
     ----------
-    conversions : dictionary
-        A mapping for unit conversions.
     name : str
         The name of the signal. Should be CamelCase.
     runid : str
@@ -57,7 +59,9 @@ class Signal(np.ndarray):
         The physcial units of the signal. These should be specified
         as lowercase complete words using only multiplication and
         division symbols (e.g. 'meter/second/second').
-        Signal.conversions will show the avialable options.
+        `units.registry` has the available units.
+    offset : float
+        The time in seconds of the first sample.
 
     Methods
     -------
@@ -72,23 +76,22 @@ class Signal(np.ndarray):
     truncate(tau)
         Interpolates and truncates the signal the based on the time shift,
         `tau`, and the signal source.
+    window(t0, t1)
+        Returns a view of the signal between two times.
+    nan_segments()
+        Returns the runs of valid and nan values in the signal.
+    spline()
+        Returns the signal with the nan values filled by splines.
     as_dictionary
         Returns a dictionary of the metadata of the signal.
     convert_units(units)
-        Returns a signal with different units. `conversions` specifies the
-        available options.
+        Returns a signal with different units.
+    in_units(units)
+        Returns the signal in different units with the conversion factor
+        applied lazily.
 
     """
 
-    # define some basic unit converions
-    conversions = {'degree->radian': pi / 180.,
-                   'degree/second->radian/second': pi / 180.,
-                   'degree/second/second->radian/second/second': pi / 180.,
-                   'inch*pound->newton*meter': 25.4 / 1000. * 4.44822162,
-                   'pound->newton': 4.44822162,
-                   'feet/second->meter/second': 12. * 2.54 / 100.,
-                   'mile/hour->meter/second': 0.00254 * 12. / 5280. / 3600.}
-
     def __new__(cls, inputArray, metadata):
         """
         Returns an instance of the Signal class with the additional signal
@@ -115,7 +118,9 @@ class Signal(np.ndarray):
                     The physcial units of the signal. These should be specified
                     as lowercase complete words using only multiplication and
                     division symbols (e.g. 'meter/second/second').
-                    Signal.conversions will show the avialable options.
+                    `units.registry` has the available units.
+                offset : float, optional
+                    The time in seconds of the first sample, default is zero.
 
         Raises
         ------
@@ -133,6 +138,7 @@ class Signal(np.ndarray):
         obj.sampleRate = metadata['sampleRate']
         obj.source = metadata['source']
         obj.units = metadata['units']
+        obj.offset = metadata.get('offset', 0.)
         return obj
 
     def __array_finalize__(self, obj):
@@ -142,15 +148,51 @@ class Signal(np.ndarray):
         self.sampleRate = getattr(obj, 'sampleRate', None)
         self.source = getattr(obj, 'source', None)
         self.units = getattr(obj, 'units', None)
-
-    def __array_wrap__(self, outputArray, context=None):
-        # doesn't support these things in basic ufunc calls...maybe one day
-        # That means anytime you add, subtract, multiply, divide, etc, the
-        # following are not retained.
-        outputArray.name = None
-        outputArray.source = None
-        outputArray.units = None
-        return np.ndarray.__array_wrap__(self, outputArray, context)
+        self.offset = getattr(obj, 'offset', 0.)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        # Ufuncs are computed on plain arrays and the metadata of the result
+        # is set from the signals in the inputs, see `ufunc_metadata`.
+        # Reductions (mean, max, etc.), comparisons and the other ufunc
+        # methods return plain arrays.
+        args = [x.view(np.ndarray) if isinstance(x, Signal) else x for x in
+                inputs]
+        outputs = kwargs.get('out', ())
+        if outputs:
+            kwargs['out'] = tuple(x.view(np.ndarray) if isinstance(x, Signal)
+                    else x for x in outputs)
+
+        isCall = (method == '__call__' and
+                any(isinstance(x, Signal) for x in inputs))
+        if isCall:
+            # check the sample rates before computing anything
+            metadata = ufunc_metadata(ufunc, inputs)
+
+        results = getattr(ufunc, method)(*args, **kwargs)
+
+        if ufunc.nout == 1:
+            results = (results,)
+
+        wrapped = []
+        for i, result in enumerate(results):
+            if i < len(outputs) and isinstance(outputs[i], Signal):
+                # the output buffer is returned
+                result = outputs[i]
+            if (not isCall or not isinstance(result, np.ndarray) or
+                    result.ndim != 1 or result.dtype == np.bool_):
+                # scalars, booleans and arrays of other shapes aren't signals
+                wrapped.append(result)
+                continue
+            if not isinstance(result, Signal):
+                result = result.view(Signal)
+            for k, v in metadata.items():
+                setattr(result, k, v)
+            wrapped.append(result)
+
+        if ufunc.nout == 1:
+            return wrapped[0]
+        else:
+            return tuple(wrapped)
 
     def as_dictionary(self):
         '''Returns the signal metadata as a dictionary.'''
@@ -158,7 +200,8 @@ class Signal(np.ndarray):
                 'name': self.name,
                 'units': self.units,
                 'source': self.source,
-                'sampleRate': self.sampleRate}
+                'sampleRate': self.sampleRate,
+                'offset': self.offset}
         return data
 
     def convert_units(self, units):
@@ -168,8 +211,9 @@ class Signal(np.ndarray):
         Parameters
         ----------
         units : str
-            The units to convert the signal to. The mapping must be in the
-            attribute `conversions`.
+            The units to convert the signal to. The units must have the same
+            dimensions as the signal's units and be made of units in
+            `units.registry`.
 
         Returns
         -------
@@ -177,52 +221,66 @@ class Signal(np.ndarray):
             The signal with the desired units.
 
         """
-        if units == self.units:
-            return self
-        else:
-            try:
-                conversion = self.units + '->' + units
-                newSig = self * self.conversions[conversion]
-            except KeyError:
-                try:
-                    conversion = units + '->' + self.units
-                    newSig = self / self.conversions[conversion]
-                except KeyError:
-                    raise KeyError(('Conversion from {0} to {1} is not ' +
-                        'possible or not defined.').format(self.units, units))
-            # make the new signal
-            newSig = Signal(newSig, self.as_dictionary())
-            newSig.units = units
+        return self.in_units(units).value()
+
+    def in_units(self, units):
+        """
+        Returns the signal in the specified units without scaling the data.
+
+        Parameters
+        ----------
+        units : str
+            The units to convert the signal to, see `convert_units`.
 
-            return newSig
+        Returns
+        -------
+        quantity : Quantity
+            The signal and the conversion factor. The factor is applied when
+            the quantity is used in arithmetic with an array or when
+            `value()` is called, and multiplying or dividing it by a number
+            only changes the factor.
+
+        """
+        if units == self.units:
+            return Quantity(self, 1., units)
+        try:
+            factor = conversion_factor(self.units, units)
+        except KeyError:
+            raise KeyError(('Conversion from {0} to {1} is not ' +
+                'possible or not defined.').format(self.units, units))
+        return Quantity(self, factor, units)
 
     def filter(self, frequency):
         """Returns the signal filtered by a low pass Butterworth at the given
         frequency."""
-        filteredArray = process.butterworth(self.spline(), frequency, self.sampleRate)
+        filteredArray = sigpro.filter_many(self.spline(), frequency,
+                self.sampleRate)
         return Signal(filteredArray, self.as_dictionary())
 
     def frequency(self):
         """Returns the frequency content of the signal."""
         return process.freq_spectrum(self.spline(), self.sampleRate)
 
-    def integrate(self, initialCondition=0., detrend=False):
-        """Integrates the signal using the trapezoidal rule."""
-        time = self.time()
-        # integrate using trapz and adjust with the initial condition
-        grated = np.hstack((0., cumtrapz(self, x=time))) + initialCondition
+    def integrate(self, initialCondition=0., detrend=False, order=2,
+            fullOutput=False):
+        """Integrates the signal using the trapezoidal rule. If `detrend` is
+        true a polynomial of the given order is fit to the integral and
+        subtracted. If `fullOutput` is true the coefficients of the
+        polynomial are returned too, see
+        `signalprocessing.integrate_many`."""
         # this tries to characterize the drift in the integrated signal. It
         # works well for signals from straight line tracking but not
         # necessarily for lange change.
-        if detrend is True:
-            def line(x, a, b, c):
-                return a * x**2 + b * x + c
-            popt, pcov = curve_fit(line, time, grated)
-            grated = grated - line(time, popt[0], popt[1], popt[2])
+        grated, coefficients = sigpro.integrate_many(self, self.sampleRate,
+                initialCondition=initialCondition, detrend=detrend,
+                order=order, offset=self.offset)
         grated = Signal(grated, self.as_dictionary())
         grated.units = self.units + '*second'
         grated.name = self.name + 'Int'
-        return grated
+        if fullOutput:
+            return grated, coefficients
+        else:
+            return grated
 
     def plot(self, show=True):
         """Plots and returns the signal versus time."""
@@ -236,23 +294,38 @@ class Signal(np.ndarray):
         return line
 
     def spline(self):
-        """Returns the signal with nans replaced by the results of a cubic
-        spline."""
-        splined = process.spline_over_nan(self.time(), self)
-        return Signal(splined, self.as_dictionary())
+        """Returns the signal with nans replaced by the results of cubic
+        splines fit around each gap. The signal itself is returned if it
+        doesn't have any nans."""
+        # the samples are evenly spaced, so the splines can be fit against
+        # the sample index instead of the time
+        data = self.view(np.ndarray)
+        filled = sigpro.fill_nan_gaps(data, segments=self.nan_segments())
+        if filled is data:
+            return self
+        else:
+            return Signal(filled, self.as_dictionary())
+
+    def nan_segments(self):
+        """Returns the start and stop indices of the runs of valid and nan
+        values in the signal and whether each run is nan, see
+        `signalprocessing.nan_segments`."""
+        return sigpro.nan_segments(self.view(np.ndarray))
 
     def subtract_mean(self):
         """Returns the mean subtracted data."""
-        return Signal(process.subtract_mean(self), self.as_dictionary())
+        return process.subtract_mean(self)
 
     def time(self):
-        """Returns the time vector of the signal."""
-        return sigpro.time_vector(len(self), self.sampleRate)
+        """Returns the time vector of the signal. The vector is read only and
+        shared by all signals with the same length, sample rate and
+        offset."""
+        return sigpro.time_base(len(self), self.sampleRate, offset=self.offset)
 
     def time_derivative(self):
         """Returns the time derivative of the signal."""
         # caluculate the numerical time derivative
-        dsdt = process.derivative(self.time(), self, method='combination')
+        dsdt = sigpro.derivative_many(self, self.sampleRate)
         # map the metadata from self onto the derivative
         dsdt = Signal(dsdt, self.as_dictionary())
         dsdt.name = dsdt.name + 'Dot'
@@ -265,6 +338,16 @@ class Signal(np.ndarray):
         # this is now an ndarray instead of a Signal
         return Signal(sigpro.truncate_data(self, tau), self.as_dictionary())
 
+    def window(self, t0, t1):
+        """Returns a view of the signal with the samples between the times t0
+        and t1 (inclusive) in seconds. Either can be None to leave that end
+        open."""
+        start, stop = sigpro.time_window(t0, t1, self.sampleRate, len(self),
+                offset=self.offset)
+        windowed = self[start:stop]
+        windowed.offset = self.offset + start / float(self.sampleRate)
+        return windowed
+
 class RawSignal(Signal):
     """
     A subclass of Signal for collecting the data for a single raw signal in
@@ -285,7 +368,7 @@ class RawSignal(Signal):
 
     """
 
-    def __new__(cls, runid, signalName, database):
+    def __new__(cls, runid, signalName, database, window=None, cache=None):
         """
         Returns an instance of the RawSignal class with the additional signal
         metadata.
@@ -299,6 +382,13 @@ class RawSignal(Signal):
             by BicycleDAQ_.
         database : pytables object
             The hdf5 database for the instrumented bicycle.
+        window : tuple, optional
+            A (t0, t1) time window in seconds. Only the samples in the window
+            are read from the database.
+        cache : RunArrayCache, optional
+            A cache of the arrays already read for this run. The RawSignals of
+            a run should share one so that the supply voltage channels are
+            only read once.
 
         .. _BicycleDAQ: https://github.com/moorepants/BicycleDAQ
 
@@ -309,20 +399,45 @@ class RawSignal(Signal):
         sTab = database.root.signalTable
         cTab = database.root.calibrationTable
 
+        if cache is None:
+            cache = RunArrayCache(database)
+
         # get the row number for this particular run id
         rownum = get_row_num(runid, rTab)
-        signal = database.getNode('/rawData/' + runid, name=signalName).read()
+        runGroup = '/rawData/' + runid
+        node = cache.node(runGroup, signalName)
+
+        calibrationType, units, source = [(row['calibration'],
+            row['units'], row['source'])
+            for row in sTab.where('signal == signalName')][0]
+
+        # get the appropriate sample rate
+        if source == 'NI':
+            sampRateCol = 'NISampleRate'
+        elif source == 'VN':
+            sampRateCol = 'VNavSampleRate'
+        else:
+            raise ValueError('{0} is not a valid source.'.format(source))
+
+        sampleRate = rTab[rownum][rTab.colnames.index(sampRateCol)]
+
+        if window is None:
+            start, stop = 0, node.shape[0]
+        else:
+            start, stop = sigpro.time_window(window[0], window[1], sampleRate,
+                    node.shape[0])
 
         # cast the input array into my subclass of ndarray
-        obj = np.asarray(signal).view(cls)
+        obj = cache.read(runGroup, signalName, start, stop).view(cls)
 
         obj.runid = runid
         obj.timeStamp = matlab_date_to_object(get_cell(rTab, 'DateTime',
             rownum))
-        obj.calibrationType, obj.units, obj.source = [(row['calibration'],
-            row['units'], row['source'])
-            for row in sTab.where('signal == signalName')][0]
+        obj.calibrationType, obj.units, obj.source = (calibrationType, units,
+            source)
         obj.name = signalName
+        obj.sampleRate = sampleRate
+        obj.offset = start / float(sampleRate)
 
         try:
             obj.sensor = Sensor(obj.name, cTab)
@@ -341,23 +456,12 @@ class RawSignal(Signal):
                 obj.supply = [row['runSupplyVoltage']
                                for row in cTab.where('name == signalName')][0]
             else:
-                obj.supply = database.getNode('/rawData/' + runid,
-                        name=supplySource).read()
+                obj.supply = cache.read(runGroup, supplySource, start, stop)
         except IndexError:
             pass
             #print "{0} does not have a supply voltage.".format(signalName)
             #print "-" * 79
 
-        # get the appropriate sample rate
-        if obj.source == 'NI':
-            sampRateCol = 'NISampleRate'
-        elif obj.source == 'VN':
-            sampRateCol = 'VNavSampleRate'
-        else:
-            raise ValueError('{0} is not a valid source.'.format(obj.source))
-
-        obj.sampleRate = rTab[rownum][rTab.colnames.index(sampRateCol)]
-
         return obj
 
     def __array_finalize__(self, obj):
@@ -370,25 +474,27 @@ class RawSignal(Signal):
         self.source = getattr(obj, 'source', None)
         self.units = getattr(obj, 'units', None)
         self.timeStamp = getattr(obj, 'timeStamp', None)
-
-    def __array_wrap__(self, outputArray, context=None):
-        # doesn't support these things in basic ufunc calls...maybe one day
-        outputArray.calibrationType = None
-        outputArray.name = None
-        outputArray.sensor = None
-        outputArray.source = None
-        outputArray.units = None
-        return np.ndarray.__array_wrap__(self, outputArray, context)
-
-    def scale(self):
+        self.offset = getattr(obj, 'offset', 0.)
+
+    def window(self, t0, t1):
+        """Returns a view of the raw signal between the times t0 and t1
+        (inclusive) in seconds."""
+        windowed = Signal.window(self, t0, t1)
+        if isinstance(getattr(self, 'supply', None), np.ndarray):
+            start = int(round((windowed.offset - self.offset) *
+                self.sampleRate))
+            windowed.supply = self.supply[start:start + len(windowed)]
+        return windowed
+
+    def calibration_data(self):
         """
-        Returns the scaled signal based on the calibration data for the
-        supplied date.
+        Returns the calibration data used to scale the signal.
 
         Returns
         -------
-        : ndarray (n,)
-            Scaled signal.
+        calibData : dictionary or None
+            The calibration data for the most recent calibration of the sensor
+            before the run. None if the signal is not scaled.
 
         """
         try:
@@ -401,45 +507,30 @@ class RawSignal(Signal):
                       'HipPotentiometer',
                       'TwistPotentiometer']
         if self.calibrationType in ['none', 'matrix'] or self.name in doNotScale:
-            #print "Not scaling {0}".format(self.name)
-            return self
+            return None
         else:
-            pass
-            #print "Scaling {0}".format(self.name)
-
             # pick the largest calibration date without surpassing the run date
-            calibData = self.sensor.get_data_for_date(self.timeStamp)
-
-            slope = calibData['slope']
-            bias = calibData['bias']
-            intercept = calibData['offset']
-            calibrationSupplyVoltage = calibData['calibrationSupplyVoltage']
-
-            #print "slope {0}, bias {1}, intercept {2}".format(slope, bias,
-                    #intercept)
-
-            if self.calibrationType == 'interceptStar':
-                # this is for potentiometers, where the slope is ratiometric
-                # and zero degrees is always zero volts
-                calibratedSignal = (calibrationSupplyVoltage / self.supply *
-                                    slope * self + intercept)
-            elif self.calibrationType == 'intercept':
-                # this is the typical calibration that I use for all the
-                # sensors that I calibrate myself
-                calibratedSignal = (calibrationSupplyVoltage / self.supply *
-                                    (slope * self + intercept))
-            elif self.calibrationType == 'bias':
-                # this is for the accelerometers and rate gyros that are
-                # "ratiometric", but I'm still not sure this is correct
-                calibratedSignal = (slope * (self - self.supply /
-                                    calibrationSupplyVoltage * bias))
-            else:
-                raise StandardError("None of the calibration equations worked.")
-            calibratedSignal.name = calibData['signal']
-            calibratedSignal.units = calibData['units']
-            calibratedSignal.source = self.source
+            return self.sensor.get_data_for_date(self.timeStamp)
 
-            return calibratedSignal.view(Signal)
+    def scale(self, dtype=None):
+        """
+        Returns the scaled signal based on the calibration data for the
+        supplied date, see `calibrate_many`.
+
+        Parameters
+        ----------
+        dtype : string or dtype, optional
+            The floating point type to scale the signal in, e.g. 'float32'.
+            The default is the type of the raw signal.
+
+        Returns
+        -------
+        : ndarray (n,)
+            Scaled signal.
+
+        """
+        calibrated, calibData = calibrate_many([self], dtype=dtype)
+        return calibrated[0]
 
     def plot_scaled(self, show=True):
         '''Plots and returns the scaled signal versus time.'''
@@ -454,6 +545,666 @@ class RawSignal(Signal):
             plt.show()
         return line
 
+class SignalBundle(object):
+    """
+    A container for the equal length signals of one stage of a run. The data
+    is stored in the rows of a single 2D array and the metadata that differs
+    between the signals is stored in columns, so the stage can be
+    transformed with one array operation instead of a loop over the signals.
+
+    Attributes
+    ----------
+    names : list
+        The names of the signals in row order.
+    units : list
+        The units of the signals in row order.
+    sources : list
+        The sources of the signals in row order.
+    runid : str
+        The run id shared by the signals.
+    sampleRate : float
+        The sample rate in hertz shared by the signals.
+    offset : float
+        The time in seconds of the first sample shared by the signals.
+
+    Methods
+    -------
+    filter(frequency)
+        Returns the low passed filter of the bundle.
+    integrate()
+        Returns the bundle of the integrals of the signals.
+    time_derivative()
+        Returns the bundle of the time derivatives of the signals.
+    convert_units(units)
+        Returns a bundle with the units of some signals changed.
+    slice(start, stop)
+        Returns a bundle with a view of the samples between two indices.
+    window(t0, t1)
+        Returns a bundle with a view of the samples between two times.
+    time()
+        Returns the time vector shared by the signals.
+    truncated(signals, tau)
+        Returns a bundle of the truncated signals, see `Signal.truncate`.
+
+    Notes
+    -----
+    The bundle behaves like a dictionary of Signals. Indexing with a signal
+    name returns a Signal that is a view of its row, so modifying it in place
+    modifies the bundle, but setting its attributes doesn't change the
+    metadata stored in the bundle. Assigning a signal copies its data into the
+    row. The rows are allocated with spare room, so adding signals doesn't
+    move the existing data very often.
+
+    """
+
+    def __init__(self, signals=None, runid=None, sampleRate=None, offset=0.):
+        """
+        Returns a bundle of the given signals.
+
+        Parameters
+        ----------
+        signals : dictionary, optional
+            The Signals, or plain arrays, to store in the bundle. They must
+            all have the same length.
+        runid : str, optional
+            The run id of the signals, it is taken from the first Signal if
+            not given.
+        sampleRate : float, optional
+            The sample rate of the signals, it is taken from the first Signal
+            if not given.
+        offset : float, optional
+            The time of the first sample of the signals, it is taken from the
+            first Signal if not given.
+
+        """
+        self.names = []
+        self.units = []
+        self.sources = []
+        self.runid = runid
+        self.sampleRate = sampleRate
+        self.offset = offset
+        self._rows = {}
+        self._data = None
+        if signals is not None:
+            self.update(signals)
+
+    @classmethod
+    def _from_data(cls, data, names, units, sources, runid, sampleRate,
+            offset):
+        """Returns a bundle that stores `data` without copying it."""
+        bundle = cls(runid=runid, sampleRate=sampleRate, offset=offset)
+        bundle.names = list(names)
+        bundle.units = list(units)
+        bundle.sources = list(sources)
+        bundle._rows = dict((name, i) for i, name in enumerate(names))
+        bundle._data = data
+        return bundle
+
+    @classmethod
+    def truncated(cls, signals, tau):
+        """
+        Returns a bundle of the signals shifted and truncated based on the
+        time shift between the NI and VN data.
+
+        Parameters
+        ----------
+        signals : dictionary
+            The calibrated Signals of a run.
+        tau : float
+            The time shift in seconds.
+
+        Returns
+        -------
+        bundle : SignalBundle
+            The truncated signals with the nans filled by splines.
+
+        Raises
+        ------
+        ValueError
+            If the signals have different sample rates or lengths, they can
+            only be truncated one at a time with `Signal.truncate`.
+
+        """
+        names = signals.keys()
+        first = signals[names[0]]
+        sampleRates = set(signals[k].sampleRate for k in names)
+        if len(sampleRates) > 1:
+            raise ValueError('The signals have different sample rates: ' +
+                    '{0}'.format(sorted(sampleRates)))
+        lengths = set(len(signals[k]) for k in names)
+        if len(lengths) > 1:
+            raise ValueError('The signals have different lengths: ' +
+                    '{0}'.format(sorted(lengths)))
+        sources = [signals[k].source for k in names]
+        # the NI signals are interpolated with one set of weights and the VN
+        # signals are sliced
+        data = sigpro.truncate_many(np.vstack([signals[k] for k in names]),
+                sources, first.sampleRate, tau)
+        bundle = cls._from_data(data, names, [signals[k].units for k in
+            names], sources, first.runid, first.sampleRate, 0.)
+        bundle._fill_nans()
+        return bundle
+
+    def _fill_nans(self):
+        """Fills the nans in every row in place with splines."""
+        data = self.data
+        for i in np.nonzero(np.isnan(data).any(axis=1))[0]:
+            data[i] = sigpro.fill_nan_gaps(data[i])
+
+    @property
+    def data(self):
+        """The 2D array of the signals, one per row."""
+        if self._data is None:
+            return np.zeros((0, 0))
+        else:
+            return self._data[:len(self.names)]
+
+    @property
+    def nbytes(self):
+        """The number of bytes of the array that stores the signals,
+        including the room for more signals."""
+        if self._data is None:
+            return 0
+        else:
+            return self._data.nbytes
+
+    @property
+    def numSamples(self):
+        """The number of samples in each signal."""
+        if self._data is None:
+            return 0
+        else:
+            return self._data.shape[1]
+
+    def _metadata(self, i):
+        return {'name': self.names[i],
+                'runid': self.runid,
+                'sampleRate': self.sampleRate,
+                'source': self.sources[i],
+                'units': self.units[i],
+                'offset': self.offset}
+
+    def __getitem__(self, name):
+        i = self._rows[name]
+        return Signal(self._data[i], self._metadata(i))
+
+    def __setitem__(self, name, signal):
+        array = np.asarray(signal)
+        if array.ndim != 1:
+            raise ValueError('Signals must be arrays of one dimension.')
+        if isinstance(signal, Signal):
+            units, source = signal.units, signal.source
+            sampleRate = signal.sampleRate
+        else:
+            units, source, sampleRate = None, 'NA', None
+
+        if self._data is None:
+            if self.runid is None:
+                self.runid = getattr(signal, 'runid', None)
+            if self.sampleRate is None:
+                self.sampleRate = sampleRate
+            if isinstance(signal, Signal):
+                self.offset = signal.offset
+            self._data = np.empty((8, len(array)),
+                    dtype=sigpro.float_dtype(array))
+        elif len(array) != self.numSamples:
+            raise ValueError(('{0} has {1} samples but the signals in the ' +
+                'bundle have {2}.').format(name, len(array),
+                    self.numSamples))
+        if (sampleRate is not None and self.sampleRate is not None and
+                sampleRate != self.sampleRate):
+            raise ValueError(('{0} has a sample rate of {1} but the signals ' +
+                'in the bundle have {2}.').format(name, sampleRate,
+                    self.sampleRate))
+
+        try:
+            i = self._rows[name]
+        except KeyError:
+            i = len(self.names)
+            if i == self._data.shape[0]:
+                # double the room for rows
+                data = np.empty((2 * i, self.numSamples),
+                        dtype=self._data.dtype)
+                data[:i] = self._data[:i]
+                self._data = data
+            self._rows[name] = i
+            self.names.append(name)
+            self.units.append(units)
+            self.sources.append(source)
+        else:
+            self.units[i] = units
+            self.sources[i] = source
+        self._data[i] = array
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    def __iter__(self):
+        return iter(list(self.names))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return 'SignalBundle({0} signals, {1} samples)'.format(len(self),
+                self.numSamples)
+
+    def keys(self):
+        return list(self.names)
+
+    def values(self):
+        return [self[k] for k in self.names]
+
+    def items(self):
+        return [(k, self[k]) for k in self.names]
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def update(self, signals):
+        """Adds the signals in a dictionary or bundle to the bundle."""
+        for name, sig in signals.items():
+            self[name] = sig
+
+    def copy(self):
+        """Returns a copy of the bundle."""
+        return self._from_data(self.data.copy(), self.names, self.units,
+                self.sources, self.runid, self.sampleRate, self.offset)
+
+    def astype(self, dtype):
+        """Returns a copy of the bundle with the given floating point
+        type."""
+        return self._from_data(self.data.astype(dtype), self.names,
+                self.units, self.sources, self.runid, self.sampleRate,
+                self.offset)
+
+    def to_dict(self):
+        """Returns a dictionary of Signals that are views of the rows."""
+        return dict(self.items())
+
+    def convert_units(self, units):
+        """
+        Returns a bundle with the units of some of the signals changed.
+
+        Parameters
+        ----------
+        units : dictionary
+            A mapping of signal names to the new units, see
+            `Signal.convert_units`.
+
+        Returns
+        -------
+        bundle : SignalBundle
+            The bundle with all of the signals, the converted ones have new
+            data.
+
+        """
+        factors = np.ones(len(self))
+        newUnits = list(self.units)
+        for name, new in units.items():
+            i = self._rows[name]
+            old = self.units[i]
+            if new == old:
+                continue
+            try:
+                factors[i] = conversion_factor(old, new)
+            except KeyError:
+                raise KeyError(('Conversion from {0} to {1} is not ' +
+                    'possible or not defined.').format(old, new))
+            newUnits[i] = new
+        factors = factors.astype(self.data.dtype)
+        return self._from_data(self.data * factors[:, np.newaxis],
+                self.names, newUnits, self.sources, self.runid,
+                self.sampleRate, self.offset)
+
+    def filter(self, frequency):
+        """Returns the bundle filtered by a low pass Butterworth at the given
+        frequency. The nans are filled with splines first."""
+        data = self.data
+        if np.isnan(data).any():
+            data = data.copy()
+            filled = self._from_data(data, self.names, self.units,
+                    self.sources, self.runid, self.sampleRate, self.offset)
+            filled._fill_nans()
+        filtered = sigpro.filter_many(data, frequency, self.sampleRate,
+                axis=1)
+        return self._from_data(filtered, self.names, self.units,
+                self.sources, self.runid, self.sampleRate, self.offset)
+
+    def time_derivative(self):
+        """Returns a bundle of the time derivatives of the signals, see
+        `signalprocessing.derivative_many`."""
+        dsdt = sigpro.derivative_many(self.data, self.sampleRate)
+        names = [name + 'Dot' for name in self.names]
+        units = [None if u is None else u + '/second' for u in self.units]
+        return self._from_data(dsdt, names, units, self.sources, self.runid,
+                self.sampleRate, self.offset)
+
+    def integrate(self, initialCondition=0., detrend=False, order=2):
+        """Returns a bundle of the integrals of the signals and the
+        coefficients of the drift polynomials, see
+        `signalprocessing.integrate_many`."""
+        grated, coefficients = sigpro.integrate_many(self.data,
+                self.sampleRate, initialCondition=initialCondition,
+                detrend=detrend, order=order, offset=self.offset)
+        names = [name + 'Int' for name in self.names]
+        units = [None if u is None else u + '*second' for u in self.units]
+        return self._from_data(grated, names, units, self.sources,
+                self.runid, self.sampleRate, self.offset), coefficients
+
+    def slice(self, start, stop):
+        """Returns a bundle with a view of the samples from start to stop.
+        Like slicing a Signal, the offset is not changed."""
+        return self._from_data(self.data[:, start:stop], self.names,
+                self.units, self.sources, self.runid, self.sampleRate,
+                self.offset)
+
+    def time(self):
+        """Returns the read only time vector of the signals."""
+        return sigpro.time_base(self.numSamples, self.sampleRate,
+                offset=self.offset)
+
+    def window(self, t0, t1):
+        """Returns a bundle with a view of the samples between the times t0
+        and t1 (inclusive) in seconds. Either can be None to leave that end
+        open."""
+        start, stop = sigpro.time_window(t0, t1, self.sampleRate,
+                self.numSamples, offset=self.offset)
+        windowed = self.slice(start, stop)
+        windowed.offset = self.offset + start / float(self.sampleRate)
+        return windowed
+
+class SignalNode(object):
+    """A node in the dependency graph of a LazySignals stage.
+
+    Attributes
+    ----------
+    label : str
+        The name of the node, usually the name of the function.
+    function : callable
+        A function without arguments that computes the outputs and stores
+        them in the stage.
+    outputs : list
+        The names of the signals the function stores in the stage.
+    inputs : list
+        The signals the function uses given as 'stage.Name', e.g.
+        'truncated.AngularRateX'.
+
+    """
+
+    def __init__(self, label, function, outputs, inputs):
+        self.label = label
+        self.function = function
+        self.outputs = list(outputs)
+        self.inputs = list(inputs)
+
+    def __repr__(self):
+        return 'SignalNode({0}: {1} -> {2})'.format(self.label,
+                self.inputs, self.outputs)
+
+class LazySignals(object):
+    """
+    A stage of signals that are computed when they are first accessed.
+
+    Each signal is the output of a node in a dependency graph. Indexing with
+    a signal name evaluates the node that outputs it, which evaluates the
+    nodes of its inputs as they are accessed, and the results are stored in
+    a SignalBundle so each node is evaluated only once.
+
+    Attributes
+    ----------
+    stage : str
+        The name of the stage, e.g. 'computed'.
+    nodes : list
+        The SignalNodes of the stage.
+    signals : SignalBundle
+        The signals that have been computed.
+    timings : OrderedDict
+        The labels of the nodes that have been evaluated in the order they
+        were evaluated and the time in seconds each took, excluding the time
+        to evaluate their inputs and any other nodes they evaluated, so the
+        times add up to the total.
+    skipped : OrderedDict
+        The labels of the nodes that were not evaluated because some of their
+        inputs are not available and the list of the missing inputs.
+    filterFreq : float
+        If not None, the signals are low pass filtered at this frequency as
+        they are computed, see `filter`.
+    upstream : dictionary
+        The signals of the other stages that the inputs refer to, used to
+        check that the inputs are available and to report the complete
+        dependencies.
+
+    Notes
+    -----
+    Accessing all of the signals, e.g. with `items()` or `bundle()`, evaluates
+    every node. A node with a missing input, e.g. a signal that wasn't
+    recorded in the run, is skipped along with the nodes that depend on its
+    outputs, and its outputs are not in the stage.
+
+    """
+
+    def __init__(self, stage, nodes, upstream=None):
+        self.stage = stage
+        self.nodes = list(nodes)
+        self.signals = SignalBundle()
+        self.timings = OrderedDict()
+        self.skipped = OrderedDict()
+        self.filterFreq = None
+        self._running = set()
+        # the time spent in nested node evaluations of each running node
+        self._nested = []
+        if upstream is None:
+            upstream = {}
+        self.upstream = upstream
+        self._producers = OrderedDict()
+        for node in self.nodes:
+            for name in node.outputs:
+                self._producers[name] = node
+
+    def __getattr__(self, attr):
+        # the other bundle attributes and methods (sampleRate, filter,
+        # window, etc.) need all of the signals
+        if attr.startswith('_') or attr in ['stage', 'nodes', 'signals',
+                'timings', 'skipped', 'upstream', 'filterFreq']:
+            raise AttributeError(attr)
+        return getattr(self.bundle(), attr)
+
+    def __getitem__(self, name):
+        if name not in self.signals:
+            self.evaluate(name)
+        return self.signals[name]
+
+    def __setitem__(self, name, signal):
+        if self.filterFreq is not None:
+            signal = signal.filter(self.filterFreq)
+        self.signals[name] = signal
+
+    def __contains__(self, name):
+        return name in self.keys()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __repr__(self):
+        return 'LazySignals({0}, {1} of {2} nodes evaluated)'.format(
+                self.stage, len(self.timings), len(self.nodes))
+
+    def evaluate(self, name):
+        """Evaluates the node that outputs the signal.
+
+        Raises
+        ------
+        KeyError
+            If no node outputs the signal or the node didn't compute it.
+
+        """
+        node = self._producers[name]
+        self._evaluate_node(node)
+        if name not in self.signals:
+            raise KeyError('{0} was not computed by {1}.'.format(name,
+                node.label))
+
+    def _missing_inputs(self, node):
+        """Returns the inputs of a node that can't be computed or aren't in
+        their stage. The inputs of stages that aren't known are assumed to be
+        available."""
+        missing = []
+        for x in node.inputs:
+            stage, name = x.split('.', 1)
+            if stage == self.stage:
+                stageSignals = self
+            else:
+                stageSignals = self.upstream.get(stage)
+            if isinstance(stageSignals, LazySignals):
+                try:
+                    stageSignals[name]
+                except KeyError:
+                    missing.append(x)
+            elif stageSignals is not None and name not in stageSignals:
+                missing.append(x)
+        return missing
+
+    def _evaluate_node(self, node):
+        if node.label in self.timings or node.label in self.skipped:
+            return
+        if node.label in self._running:
+            raise KeyError('{0} depends on its own outputs.'.format(
+                node.label))
+        self._running.add(node.label)
+        try:
+            # the inputs are evaluated before the clock starts
+            missing = self._missing_inputs(node)
+            if len(missing) > 0:
+                print('{0} is not available. {1} was not computed.'.format(
+                    ', '.join(missing), ', '.join(node.outputs)))
+                self.skipped[node.label] = missing
+            else:
+                self._nested.append(0.)
+                start = default_timer()
+                try:
+                    node.function()
+                finally:
+                    duration = default_timer() - start
+                    nested = self._nested.pop()
+                    if self._nested:
+                        self._nested[-1] += duration
+                self.timings[node.label] = duration - nested
+        finally:
+            self._running.discard(node.label)
+
+    def _computable(self, node, visiting=()):
+        """Returns true if the inputs of a node that hasn't been evaluated
+        are available, following the inputs in the stage without evaluating
+        any nodes."""
+        if node.label in self.skipped or node.label in visiting:
+            return False
+        for x in node.inputs:
+            stage, name = x.split('.', 1)
+            if stage == self.stage:
+                if name in self.signals:
+                    continue
+                producer = self._producers.get(name)
+                if producer is None or (producer.label not in self.timings
+                        and not self._computable(producer,
+                            visiting + (node.label,))):
+                    return False
+            else:
+                stageSignals = self.upstream.get(stage)
+                if stageSignals is not None and name not in stageSignals:
+                    return False
+        return True
+
+    def filter(self, frequency):
+        """Filters the signals with a low pass Butterworth at the given
+        frequency as they are computed, the signals that have already been
+        computed are filtered now. Returns the stage."""
+        self.filterFreq = frequency
+        if len(self.signals) > 0:
+            self.signals = self.signals.filter(frequency)
+        return self
+
+    def evaluate_all(self):
+        """Evaluates every node that hasn't been evaluated."""
+        for node in self.nodes:
+            self._evaluate_node(node)
+
+    def bundle(self):
+        """Returns the SignalBundle of all of the signals."""
+        self.evaluate_all()
+        return self.signals
+
+    def keys(self):
+        """Returns the names of the signals that have been computed and of
+        the signals of the nodes that haven't been evaluated yet and whose
+        inputs are available. No nodes are evaluated."""
+        names = list(self.signals.names)
+        names += [k for k, node in self._producers.items() if k not in
+                self.signals and node.label not in self.timings and
+                self._computable(node)]
+        return names
+
+    def values(self):
+        return self.bundle().values()
+
+    def items(self):
+        return self.bundle().items()
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    @property
+    def nbytes(self):
+        """The number of bytes of the signals that have been computed."""
+        return self.signals.nbytes
+
+    @property
+    def computed(self):
+        """The labels of the nodes that have been evaluated."""
+        return list(self.timings.keys())
+
+    def dependencies(self, name):
+        """Returns the set of signals, as 'stage.Name', that a signal
+        depends on, following the inputs into the upstream stages."""
+        dependencies = set()
+        unvisited = [self.stage + '.' + name]
+        while unvisited:
+            stage, signal = unvisited.pop().split('.', 1)
+            if stage == self.stage:
+                stageSignals = self
+            else:
+                stageSignals = self.upstream.get(stage)
+            try:
+                node = stageSignals._producers[signal]
+            except (AttributeError, KeyError):
+                # signals of eager stages have no inputs
+                continue
+            for x in node.inputs:
+                if x not in dependencies:
+                    dependencies.add(x)
+                    unvisited.append(x)
+        return dependencies
+
+    def report(self):
+        """Returns a string with the evaluated nodes and their timings."""
+        lines = ['{0} signals, {1} of {2} nodes evaluated'.format(
+            self.stage, len(self.timings), len(self.nodes))]
+        for label, duration in self.timings.items():
+            lines.append('{0:<50} {1:8.4f} s'.format(label, duration))
+        for label, missing in self.skipped.items():
+            lines.append('{0:<50} skipped, missing {1}'.format(label,
+                ', '.join(missing)))
+        return '\n'.join(lines)
+
 class Sensor():
     """This class is a container for calibration data for a sensor."""
 
@@ -537,7 +1288,9 @@ class Run():
     """The fluppin fundamental class for a run."""
 
     def __init__(self, runid, dataset, pathToParameterData=None,
-            forceRecalc=False, filterFreq=None, store=True):
+            forceRecalc=False, filterFreq=None, store=True, window=None,
+            timeShiftMethod='landscape', keep=None, precision=None,
+            pathToParameterCache=None):
         """Loads the raw and processed data for a run if available otherwise it
         generates the processed data from the raw data.
 
@@ -554,20 +1307,79 @@ class Run():
         forceRecalc : boolean, optional, default = False
             If true then it will force a recalculation of all the processed
             data.
-        filterSigs : float, optional, default = None
-            If true all of the processed signals will be low pass filtered with
-            a second order Butterworth filter at the given filter frequency.
-        store : boolean, optional, default = True
+        filterFreq : float, optional, default = None
+            If given the processed signals will be low pass filtered with a
+            second order Butterworth filter at the given filter frequency. The
+            computed signals are filtered over the whole run and the task
+            signals are derived from them. The filtered task signals are
+            stored with the frequency and are only loaded from the database
+            by a Run with the same frequency.
+        store : boolean or TaskSignalWriter, optional, default = True
             If true the resulting task signals will be stored in the database.
+            If a TaskSignalWriter is given the task signals are submitted to
+            the writer instead. Storing evaluates all of the computed and task
+            signals, otherwise they are only computed when they are accessed.
+        window : tuple, optional, default = None
+            A (t0, t1) time window in seconds. If given, each stage only holds
+            the samples between t0 and t1 of its own time base. If the task
+            signals are in the database only the window is read from disk,
+            otherwise the complete run is processed (the time synchronization
+            needs the whole run) and then windowed.
+        timeShiftMethod : string, optional, default = 'landscape'
+            The method used to find the time shift between the NI and VN
+            data, 'landscape', 'xcorr' or 'multires', see
+            `signalprocessing.find_timeshift`.
+        keep : sequence of strings, optional, default = None
+            The stages to keep, e.g. ('task',), from 'raw', 'calibrated',
+            'truncated', 'computed' and 'task'. The other stages are deleted
+            as soon as the stages that depend on them are built, which limits
+            the memory used by the run. The top stage is always kept. If None
+            all of the stages are kept. See `nbytes` for the memory used by
+            each stage. Releasing the truncated stage evaluates all of the
+            computed and task signals.
+        precision : string, optional, default = None
+            'float64' or 'float32', the floating point precision of the
+            signals. In single precision the calibration, truncation,
+            filtering and kinematics are computed and stored in float32, but
+            the time synchronization and the integrals are computed in
+            float64. Single precision task signals are not stored in the
+            database. If None the precision of the DataSet is used.
+        pathToParameterCache : string or False, optional, default = None
+            A directory where the derived bicycle and rider parameters are
+            cached, see `bicycle_rider_parameters`. If None the
+            pathToParameterCache in defaults.cfg is used, if there is one. If
+            False the parameters are only cached in this process.
 
         """
 
+        if precision is None:
+            precision = getattr(dataset, 'precision', 'float64')
+        if precision not in ['float64', 'float32']:
+            raise ValueError("The precision must be 'float64' or 'float32'.")
+        self.precision = precision
+
+        if keep is not None:
+            keep = tuple(keep)
+            for stage in keep:
+                if stage not in self.stages:
+                    raise ValueError('{0} is not a stage, the stages are {1}.'
+                            .format(stage, self.stages))
+        self.keep = keep
+
         if pathToParameterData is None:
             pathToParameterData = config.get('data', 'pathToParameters')
 
+        if pathToParameterCache is None:
+            if config.has_option('data', 'pathToParameterCache'):
+                pathToParameterCache = config.get('data',
+                        'pathToParameterCache')
+        elif pathToParameterCache is False:
+            pathToParameterCache = None
+
         print "Initializing the run object."
 
         self.filterFreq = filterFreq
+        self.timeShiftMethod = timeShiftMethod
 
         dataset.open()
         dataTable = dataset.database.root.runTable
@@ -595,17 +1407,8 @@ class Run():
             if col not in (rawDataCols + computedCols):
                 self.metadata[col] = get_cell(dataTable, col, rownum)
 
-        print "Loading the raw signals from the database."
-        for col in rawDataCols:
-            # rawDataCols includes all possible raw signals, but every run
-            # doesn't have all the signals, so skip the ones that aren't there
-            try:
-                self.rawSignals[col] = RawSignal(runid, col, dataset.database)
-            except NoSuchNodeError:
-                pass
-
         if self.metadata['Rider'] != 'None':
-            self.load_rider(pathToParameterData)
+            self.load_rider(pathToParameterData, pathToParameterCache)
 
         self.bumpLength = 1.0 # 1 meter
 
@@ -620,34 +1423,61 @@ class Run():
             forceRecalc = True
         else:
             # The filter frequency stored in the task table is either a nan
-            # value or a valid float. If the stored filter frequency is not the
-            # same as the the one passed to Run, then a recalculation should be
-            # forced.
+            # value (unfiltered) or a valid float. The stored signals are
+            # used as they are, so if they were filtered at a different
+            # frequency than the one passed to Run, then a recalculation
+            # should be forced.
             taskRowNum = get_row_num(runid, taskTable)
             storedFreq = taskTable.cols.FilterFrequency[taskRowNum]
-            self.taskSignals = {}
             if filterFreq is None:
-                newFilterFreq = np.nan
+                sameFilter = np.isnan(storedFreq)
             else:
-                newFilterFreq = filterFreq
-
-            if np.isnan(newFilterFreq) and np.isnan(storedFreq):
-                for node in runGroup._f_walkNodes():
-                    meta = {k : node._f_getAttr(k) for k in ['units', 'name',
-                        'runid', 'sampleRate', 'source']}
-                    self.taskSignals[node.name] = Signal(node[:], meta)
+                # the frequency is stored in single precision
+                sameFilter = abs(storedFreq - filterFreq) < 1e-6 * filterFreq
+
+            if sameFilter:
+                self.load_task_signals(dataset.database, runGroup,
+                        taskRowNum, window=window)
+                if self.precision != 'float64':
+                    for stage in ['computed', 'task']:
+                        try:
+                            signals = getattr(self, stage + 'Signals')
+                        except AttributeError:
+                            pass
+                        else:
+                            setattr(self, stage + 'Signals',
+                                    signals.astype(self.precision))
                 self.taskFromDatabase = True
-            elif np.isnan(newFilterFreq) or np.isnan(storedFreq):
-                forceRecalc = True
             else:
-                if abs(storedFreq - filterFreq) < 1e-10:
-                    for node in runGroup._f_walkNodes():
-                        meta = {k : node._f_getAttr(k) for k in ['units', 'name',
-                        'runid', 'sampleRate', 'source']}
-                        self.taskSignals[node.name] = Signal(node[:], meta)
-                    self.taskFromDatabase = True
-                else:
-                    forceRecalc = True
+                forceRecalc = True
+
+        # the complete raw signals are needed to process the run
+        if forceRecalc == True:
+            rawWindow = None
+        else:
+            rawWindow = window
+
+        # the raw signals aren't needed if they aren't kept and the task
+        # signals are loaded
+        if forceRecalc == True or keep is None or 'raw' in keep:
+            rawDataToLoad = rawDataCols
+        else:
+            rawDataToLoad = []
+
+        print "Loading the raw signals from the database."
+        # the supply voltage channels are shared by many signals, so each
+        # array node is read from the file only once
+        cache = RunArrayCache(dataset.database)
+        for col in rawDataToLoad:
+            # rawDataCols includes all possible raw signals, but every run
+            # doesn't have all the signals, so skip the ones that aren't there
+            try:
+                self.rawSignals[col] = RawSignal(runid, col, dataset.database,
+                        window=rawWindow, cache=cache)
+            except NoSuchNodeError:
+                pass
+        # the number of times each node was read from the file
+        self.readCounts = cache.readCounts
 
         dataset.close()
 
@@ -658,29 +1488,233 @@ class Run():
                 pass
             self.process_raw_signals()
 
-        # store the task signals in the database if they are newly computed
-        if (store == True and self.taskFromDatabase == False
-                and self.topSig == 'task'):
-            taskMeta = {
-                        'Duration' :
-                        self.taskSignals['ForwardSpeed'].time()[-1],
-                        'FilterFrequency' : self.filterFreq,
-                        'MeanSpeed' : self.taskSignals['ForwardSpeed'].mean(),
-                        'RunID' : self.metadata['RunID'],
-                        'StdSpeed' : self.taskSignals['ForwardSpeed'].std(),
-                        'Tau' : self.tau,
-                        }
-            dataset.add_task_signals(self.taskSignals, taskMeta)
+            # the signals are filtered as they are computed
+            if self.filterFreq is not None:
+                self.filter_top_signals(self.filterFreq)
+
+            # store the task signals in the database if they are newly
+            # computed, they are stored as they are returned along with the
+            # filter frequency
+            # only double precision task signals are stored, so every run
+            # loaded from the database has the full precision
+            if (store is not False and self.topSig == 'task' and
+                    self.precision == 'float64'):
+                # this also finds the task start and end
+                forwardSpeed = self.taskSignals['ForwardSpeed']
+                taskMeta = {
+                            'Duration' : forwardSpeed.time()[-1],
+                            'FilterFrequency' : (np.nan if self.filterFreq
+                                is None else self.filterFreq),
+                            'MeanSpeed' : forwardSpeed.mean(),
+                            'RunID' : self.metadata['RunID'],
+                            'StdSpeed' : forwardSpeed.std(),
+                            'Tau' : self.tau,
+                            'TaskStart' : self.taskStart,
+                            'TaskEnd' : self.taskEnd,
+                            }
+                # record what the task signals depend on so that they can be
+                # recomputed if it changes
+                taskMeta.update(task_dependencies(self.metadata['RunID'],
+                    self.calibrationData, dataset.load_corruption_data()))
+                if store is True:
+                    dataset.add_task_signals(self.taskSignals, taskMeta,
+                            self.computedSignals)
+                else:
+                    store.submit(self.taskSignals, taskMeta,
+                            self.computedSignals)
+
+            if window is not None:
+                self.apply_window(window)
+
+        # the computed and task signals are evaluated before the stages they
+        # depend on are released
+        self.release_stage('truncated')
+        self.release_stage('computed')
 
         # tell the user about the run
         print self
 
+    def load_task_signals(self, database, runGroup, taskRowNum, window=None):
+        """Loads the task signals from the database.
+
+        Parameters
+        ----------
+        database : pytables object
+            The open hdf5 database for the instrumented bicycle.
+        runGroup : pytables group
+            The group in /taskData for this run.
+        taskRowNum : integer
+            The row number of the run in the task table.
+        window : tuple, optional
+            A (t0, t1) time window in seconds on the task time base. Only the
+            samples in the window are read from the database.
+
+        Notes
+        -----
+        If the computed signals are stored for the run, they are loaded too and
+        the task signals that are slices of the computed signals are taken
+        from them. Both stages are SignalBundles that are views of one array:
+        the computed signals are its first rows, the task only signals, e.g.
+        YawAngle, are stored in the task range of the remaining rows and the
+        task signals are the task range of all of the rows. So the task slices
+        are not copied. The computed bundle ends at its last row, so adding a
+        signal to it moves its data rather than overwriting the task only
+        signals.
+
+        """
+
+        def metadata(node):
+            return dict((k, node._f_getAttr(k)) for k in ['units', 'name',
+                'runid', 'sampleRate', 'source'])
+
+        def load(node, start=0, stop=None):
+            meta = metadata(node)
+            meta['offset'] = start / float(meta['sampleRate'])
+            return Signal(node.read(start, stop), meta)
+
+        def task_window(node, numSamples):
+            if window is None:
+                return 0, numSamples
+            else:
+                return sigpro.time_window(window[0], window[1],
+                        node._f_getAttr('sampleRate'), numSamples)
+
+        taskNodes = list(runGroup._f_walkNodes('Array'))
+
+        try:
+            computedGroup = database.root.computedData._f_getChild(
+                runGroup._v_name)
+        except NoSuchNodeError:
+            computedNodes = []
+        else:
+            computedNodes = list(computedGroup._f_walkNodes('Array'))
+
+        if len(computedNodes) == 0:
+            self.taskSignals = SignalBundle()
+            for node in taskNodes:
+                start, stop = task_window(node, node.shape[0])
+                self.taskSignals[node.name] = load(node, start, stop)
+            self.topSig = 'task'
+            return
+
+        taskTable = database.root.taskTable
+        self.taskStart = taskTable.cols.TaskStart[taskRowNum]
+        self.taskEnd = taskTable.cols.TaskEnd[taskRowNum]
+        sampleRate = computedNodes[0]._f_getAttr('sampleRate')
+
+        # the samples of the computed signals that are read and the task range
+        # in them
+        start, stop = task_window(computedNodes[0],
+                self.taskEnd - self.taskStart)
+        if window is None:
+            first, last = 0, computedNodes[0].shape[0]
+            taskFirst, taskLast = self.taskStart, self.taskEnd
+        else:
+            # only the part of the computed signals in the task window
+            first, last = self.taskStart + start, self.taskStart + stop
+            taskFirst, taskLast = 0, stop - start
+
+        nodes = computedNodes + taskNodes
+        metas = [metadata(node) for node in nodes]
+        # the samples of the task only rows outside of the task range are
+        # never used
+        data = np.empty((len(nodes), last - first),
+                dtype=sigpro.float_dtype(*[node.dtype for node in nodes]))
+        for i, node in enumerate(computedNodes):
+            data[i] = node.read(first, last)
+        for i, node in enumerate(taskNodes, len(computedNodes)):
+            data[i, taskFirst:taskLast] = node.read(start, stop)
+
+        def bundle(rows, offset):
+            # the signals of the first rows
+            n = rows.shape[0]
+            return SignalBundle._from_data(rows, [node.name for node in
+                nodes[:n]], [m['units'] for m in metas[:n]], [m['source']
+                    for m in metas[:n]], metas[0]['runid'], sampleRate,
+                offset)
+
+        self.computedSignals = bundle(data[:len(computedNodes)],
+                first / float(sampleRate))
+        # like a slice of the computed bundle, the task signals start at the
+        # offset of the window
+        self.taskSignals = bundle(data[:, taskFirst:taskLast],
+                (0. if window is None else start / float(sampleRate)))
+
+        self.topSig = 'task'
+
+    def apply_window(self, window):
+        """Replaces the signals in every stage with views of the signals in
+        the given time window.
+
+        Parameters
+        ----------
+        window : tuple
+            A (t0, t1) time window in seconds. It is applied to each stage on
+            its own time base.
+
+        """
+        for stage in ['raw', 'calibrated', 'truncated', 'computed', 'task']:
+            try:
+                signals = getattr(self, stage + 'Signals')
+            except AttributeError:
+                pass
+            else:
+                if isinstance(signals, (SignalBundle, LazySignals)):
+                    setattr(self, stage + 'Signals',
+                            signals.window(window[0], window[1]))
+                else:
+                    for name, sig in signals.items():
+                        signals[name] = sig.window(window[0], window[1])
+
+    stages = ('raw', 'calibrated', 'truncated', 'computed', 'task')
+
+    def release_stage(self, stage):
+        """Deletes the signals of a stage unless the stage is the top stage
+        or is in `keep`. The lazy computed and task signals are evaluated
+        first, because they may depend on the stage."""
+        if self.keep is None or stage in self.keep or stage == self.topSig:
+            return
+        if stage in ['truncated', 'computed']:
+            for later in ['computed', 'task']:
+                signals = getattr(self, later + 'Signals', None)
+                if isinstance(signals, LazySignals):
+                    setattr(self, later + 'Signals', signals.bundle())
+        try:
+            delattr(self, stage + 'Signals')
+        except AttributeError:
+            pass
+
+    @property
+    def nbytes(self):
+        """A dictionary of the number of bytes of the arrays in each stage.
+        The arrays that share memory within a stage, e.g. the supply voltages
+        of the raw signals, are counted once per stage. The signals that
+        share memory between stages, e.g. raw signals that aren't scaled, are
+        counted in each stage."""
+        nbytes = {}
+        for stage in self.stages:
+            try:
+                signals = getattr(self, stage + 'Signals')
+            except AttributeError:
+                continue
+            if isinstance(signals, (SignalBundle, LazySignals)):
+                nbytes[stage] = signals.nbytes
+            else:
+                arrays = list(signals.values())
+                if stage == 'raw':
+                    # the supply voltages read from the file
+                    arrays += [sig.supply for sig in signals.values() if
+                        isinstance(getattr(sig, 'supply', None), np.ndarray)]
+                nbytes[stage] = buffer_nbytes(arrays)
+        return nbytes
+
     def process_raw_signals(self):
-        """Processes the raw signals as far as possible and filters the
-        result if a cutoff frequency was specified."""
+        """Processes the raw signals as far as possible. The top signals are
+        not filtered, use `filter_top_signals`."""
 
         print "Computing signals from raw data."
         self.calibrate_signals()
+        self.release_stage('raw')
 
         # the following maneuvers should never be calculated beyond the
         # calibrated signals
@@ -689,97 +1723,193 @@ class Run():
         con2 = maneuver != 'System Test'
         con3 = maneuver != 'Static Calibration'
         if con1 and con2 and con3:
-            self.compute_time_shift()
+            self.compute_time_shift(self.timeShiftMethod)
             self.check_time_shift(0.15)
             self.truncate_signals()
+            self.release_stage('calibrated')
             self.compute_signals()
             self.task_signals()
 
-        if self.filterFreq is not None:
-            self.filter_top_signals(self.filterFreq)
-
     def filter_top_signals(self, filterFreq):
-        """Filters the top most signals with a low pass filter."""
+        """Filters the top most signals with a low pass filter.
 
-        if self.topSig == 'task':
+        The task signals are derived from the computed signals, so if they
+        haven't been evaluated the computed signals are filtered over the
+        whole run instead, the task slices of them are filtered and the task
+        only signals, e.g. YawAngle, are computed from filtered signals.
+
+        """
+
+        if self.topSig == 'task' and isinstance(self.taskSignals,
+                LazySignals) and len(self.taskSignals.signals) == 0:
+            print('Filtering the computed signals.')
+            self.computedSignals = self.computedSignals.filter(filterFreq)
+            self.task_signals()
+        elif self.topSig == 'task':
             print('Filtering the task signals.')
-            for k, v in self.taskSignals.items():
-                self.taskSignals[k] = v.filter(filterFreq)
+            self.taskSignals = self.taskSignals.filter(filterFreq)
         elif self.topSig == 'computed':
             print('Filtering the computed signals.')
-            for k, v in self.computedSignals.items():
-                self.computedSignals[k] = v.filter(filterFreq)
+            self.computedSignals = self.computedSignals.filter(filterFreq)
         elif self.topSig == 'calibrated':
             print('Filtering the calibrated signals.')
-            for k, v in self.calibratedSignals.items():
-                self.calibratedSignals[k] = v.filter(filterFreq)
+            self.calibratedSignals.update(
+                filter_signals(self.calibratedSignals, filterFreq))
 
     def calibrate_signals(self):
         """Calibrates the raw signals."""
 
-        # calibrate the signals for the run
+        # calibrate the signals for the run and keep track of the calibration
+        # data that was used
         self.calibratedSignals = {}
-        for sig in self.rawSignals.values():
-            calibSig = sig.scale()
+        self.calibrationData = {}
+        rawSignals = self.rawSignals.values()
+        calibrated, calibrationData = calibrate_many(rawSignals,
+                dtype=self.precision)
+        for sig, calibSig, calibData in zip(rawSignals, calibrated,
+                calibrationData):
+            if calibData is not None:
+                self.calibrationData[sig.name] = calibData
             self.calibratedSignals[calibSig.name] = calibSig
 
         self.topSig = 'calibrated'
 
     def task_signals(self):
-        """Computes the task signals."""
-        print('Extracting the task portion from the data.')
-        self.extract_task()
-
-        # compute task specific variables
-        self.compute_yaw_angle()
-        self.compute_rear_wheel_contact_rates()
-        self.compute_rear_wheel_contact_points()
-        self.compute_front_wheel_contact_points()
-
+        """Sets up the task signals. They are computed when they are first
+        accessed, see `task_nodes`."""
+        self.taskSignals = LazySignals('task', self.task_nodes(),
+                upstream={'computed': self.computedSignals,
+                          'truncated': self.truncatedSignals})
         self.topSig = 'task'
 
-    def compute_signals(self):
-        """Computes the task independent quantities."""
-
-        self.computedSignals ={}
-        # transfer some of the signals to computed
-        noChange = ['FiveVolts',
-                    'PushButton',
-                    'RearWheelRate',
-                    'RollAngle',
-                    'SteerAngle',
-                    'ThreeVolts']
-        for sig in noChange:
-            if sig in ['RollAngle', 'SteerAngle']:
-                self.computedSignals[sig] =\
-                self.truncatedSignals[sig].convert_units('radian')
-            else:
-                self.computedSignals[sig] = self.truncatedSignals[sig]
+    def task_nodes(self):
+        """Returns the nodes of the dependency graph of the task signals."""
+        nodes = []
+        # the task portion of every computed signal, the nodes of the
+        # computed signals that can't be computed are skipped along with
+        # their extract nodes
+        for name in self.computedSignals.keys():
+            nodes.append(SignalNode('extract_task:' + name,
+                partial(self.extract_task_signal, name), [name],
+                ['computed.' + name, 'computed.ForwardSpeed',
+                 'truncated.AccelerometerAccelerationY']))
+
+        # task specific variables
+        nodes += [
+            SignalNode('compute_yaw_angle', self.compute_yaw_angle,
+                ['YawAngle'], ['task.YawRate']),
+            SignalNode('compute_rear_wheel_contact_rates',
+                self.compute_rear_wheel_contact_rates,
+                ['LongitudinalRearContactRate', 'LateralRearContactRate'],
+                ['task.YawAngle', 'task.RearWheelRate']),
+            SignalNode('compute_rear_wheel_contact_points',
+                self.compute_rear_wheel_contact_points,
+                ['LateralRearContact', 'LongitudinalRearContact'],
+                ['task.LateralRearContactRate',
+                 'task.LongitudinalRearContactRate']),
+            SignalNode('compute_front_wheel_contact_points',
+                self.compute_front_wheel_contact_points,
+                ['LongitudinalFrontContact', 'LateralFrontContact'],
+                ['task.LongitudinalRearContact', 'task.LateralRearContact',
+                 'task.YawAngle', 'task.RollAngle', 'task.SteerAngle']),
+            ]
+
+        return nodes
 
-        # compute the quantities that aren't task specific
-        self.compute_pull_force()
-        self.compute_forward_speed()
-        self.compute_steer_rate()
-        self.compute_yaw_roll_pitch_rates()
-        self.compute_steer_torque()
+    def compute_signals(self):
+        """Sets up the task independent quantities. They are computed when
+        they are first accessed, see `computed_nodes`."""
+        self.computedSignals = LazySignals('computed',
+                self.computed_nodes(),
+                upstream={'truncated': self.truncatedSignals})
+
+    def computed_nodes(self):
+        """Returns the nodes of the dependency graph of the computed
+        signals."""
+        def truncated(*names):
+            return ['truncated.' + name for name in names]
+
+        nodes = [SignalNode('transfer_signal:' + name,
+            partial(self.transfer_signal, name), [name], truncated(name))
+            for name in self.transferredSignals]
+
+        nodes += [
+            SignalNode('compute_pull_force', self.compute_pull_force,
+                ['PullForce'], truncated('PullForce')),
+            SignalNode('compute_forward_speed', self.compute_forward_speed,
+                ['ForwardSpeed'], truncated('RearWheelRate')),
+            SignalNode('compute_steer_rate', self.compute_steer_rate,
+                ['SteerRate'], truncated('ForkRate', 'AngularRateZ')),
+            SignalNode('compute_yaw_roll_pitch_rates',
+                self.compute_yaw_roll_pitch_rates,
+                ['YawRate', 'RollRate', 'PitchRate'],
+                truncated('AngularRateX', 'AngularRateY', 'AngularRateZ',
+                    'RollAngle')),
+            SignalNode('compute_steer_torque', self.compute_steer_torque,
+                ['SteerTorque'],
+                truncated('AngularRateX', 'AngularRateY', 'AngularRateZ',
+                    'ForkRate', 'AccelerationX', 'AccelerationY',
+                    'AccelerationZ', 'SteerAngle', 'SteerTubeTorque')),
+            ]
+
+        return nodes
+
+    # the truncated signals that are copied to the computed signals, the
+    # angles are converted to radians
+    transferredSignals = ['FiveVolts',
+                          'PushButton',
+                          'RearWheelRate',
+                          'RollAngle',
+                          'SteerAngle',
+                          'ThreeVolts']
+
+    def transfer_signal(self, name):
+        """Transfers a truncated signal to the computed signals."""
+        # the angles are stored in radians, so they are converted here
+        if name in ['RollAngle', 'SteerAngle']:
+            self.computedSignals[name] =\
+            self.truncatedSignals[name].convert_units('radian')
+        else:
+            self.computedSignals[name] = self.truncatedSignals[name]
+
+    def evaluation_report(self):
+        """Returns a report of the computed and task signals that have been
+        evaluated and how long each took."""
+        reports = []
+        for stage in ['computed', 'task']:
+            signals = getattr(self, stage + 'Signals', None)
+            if isinstance(signals, LazySignals):
+                reports.append(signals.report())
+        return '\n'.join(reports)
 
     def truncate_signals(self):
         """Truncates the calibrated signals based on the time shift."""
 
-        self.truncatedSignals = {}
-        for name, sig in self.calibratedSignals.items():
-            self.truncatedSignals[name] = sig.truncate(self.tau).spline()
+        self.truncatedSignals = SignalBundle.truncated(self.calibratedSignals,
+                self.tau)
         self.topSig = 'truncated'
 
-    def compute_time_shift(self):
+    def compute_time_shift(self, method='landscape'):
         """Computes the time shift based on the vertical accelerometer
-        signals."""
+        signals.
+
+        Parameters
+        ----------
+        method : string, optional, {'landscape', 'xcorr', 'multires'}
+            The method passed to `signalprocessing.find_timeshift`. The
+            diagnostic information it returns is stored in timeShiftInfo.
 
-        self.tau = sigpro.find_timeshift(
-            self.calibratedSignals['AccelerometerAccelerationY'],
-            self.calibratedSignals['AccelerationZ'],
+        """
+
+        # the time synchronization is always done in double precision
+        niAcc = self.calibratedSignals['AccelerometerAccelerationY'].astype(
+                np.float64, copy=False)
+        vnAcc = self.calibratedSignals['AccelerationZ'].astype(np.float64,
+                copy=False)
+        self.tau, self.timeShiftInfo = sigpro.find_timeshift(niAcc, vnAcc,
             self.metadata['NISampleRate'],
-            self.metadata['Speed'], plotError=False)
+            self.metadata['Speed'], plotError=False, method=method,
+            fullOutput=True, vnSegments=vnAcc.nan_segments())
 
     def check_time_shift(self, maxNRMS):
         """Raises an error if the normalized root mean square of the shifted
@@ -788,8 +1918,10 @@ class Run():
         # Check to make sure the signals were actually good fits by
         # calculating the normalized root mean square. If it isn't very
         # low, raise an error.
-        niAcc = self.calibratedSignals['AccelerometerAccelerationY']
-        vnAcc = self.calibratedSignals['AccelerationZ']
+        niAcc = self.calibratedSignals['AccelerometerAccelerationY'].astype(
+                np.float64, copy=False)
+        vnAcc = self.calibratedSignals['AccelerationZ'].astype(np.float64,
+                copy=False)
         vnAcc = vnAcc.truncate(self.tau).spline()
         niAcc = niAcc.truncate(self.tau).spline()
         # todo: this should probably check the rms of the mean subtracted data
@@ -815,7 +1947,8 @@ class Run():
             print('At least one of the rates are not available. ' +
                   'The YawAngle was not computed.')
         else:
-            # convert to meters per second
+            # convert to meters per second, the computed rates are already in
+            # meters per second so these are views
             latRate = latRate.convert_units('meter/second')
             lonRate = lonRate.convert_units('meter/second')
             # integrate and try to account for the drift
@@ -839,14 +1972,17 @@ class Run():
         q4 = self.taskSignals['RollAngle']
         q7 = self.taskSignals['SteerAngle']
 
-        p = benchmark_to_moore(self.bicycleRiderParameters)
+        p = self.parameterBundle['moore']
 
-        f = np.vectorize(front_contact)
-        q9, q10 = f(q1, q2, q3, q4, q7, p['d1'], p['d2'], p['d3'], p['rr'],
-            p['rf'])
+        q9, q10 = sigpro.front_contact_many(q1, q2, q3, q4, q7, p['d1'],
+                p['d2'], p['d3'], p['rr'], p['rf'])
 
-        self.taskSignals['LongitudinalFrontContact'] = q9
-        self.taskSignals['LateralFrontContact'] = q10
+        for name, data in [('LongitudinalFrontContact', q9),
+                           ('LateralFrontContact', q10)]:
+            contact = Signal(data, q1.as_dictionary())
+            contact.name = name
+            contact.units = 'meter'
+            self.taskSignals[name] = contact
 
     def compute_rear_wheel_contact_rates(self):
         """Calculates the rates of the wheel contact points in the ground
@@ -861,8 +1997,10 @@ class Run():
                   'front wheel radius is not available. The ' +
                   'contact rates were not computed.')
         else:
+            # the sine and cosine need the angle itself in radians
             yawAngle = yawAngle.convert_units('radian')
-            rearWheelRate = rearWheelRate.convert_units('radian/second')
+            # the conversion factor is applied with the radius
+            rearWheelRate = rearWheelRate.in_units('radian/second')
 
             lon, lat = sigpro.rear_wheel_contact_rate(rR, rearWheelRate, yawAngle)
 
@@ -883,7 +2021,8 @@ class Run():
         except AttributeError:
             print('YawRate is not available. The YawAngle was not computed.')
         else:
-            # convert to radians per second
+            # convert to radians per second, the computed yaw rate is already
+            # in radians per second so this is a view
             yawRate = yawRate.convert_units('radian/second')
             # integrate and try to account for the drift
             yawAngle = yawRate.integrate(detrend=True)
@@ -903,52 +2042,52 @@ class Run():
 
         """
         # steer torque
-        frameAngRate = np.vstack((
+        # the derivatives of the rates are computed together
+        rates = np.vstack((
             self.truncatedSignals['AngularRateX'],
             self.truncatedSignals['AngularRateY'],
-            self.truncatedSignals['AngularRateZ']))
-        frameAngAccel = np.vstack((
-            self.truncatedSignals['AngularRateX'].time_derivative(),
-            self.truncatedSignals['AngularRateY'].time_derivative(),
-            self.truncatedSignals['AngularRateZ'].time_derivative()))
+            self.truncatedSignals['AngularRateZ'],
+            self.truncatedSignals['ForkRate']))
+        accels = sigpro.derivative_many(rates,
+                self.truncatedSignals.sampleRate)
+        frameAngRate = rates[:3]
+        frameAngAccel = accels[:3]
         frameAccel = np.vstack((
             self.truncatedSignals['AccelerationX'],
             self.truncatedSignals['AccelerationY'],
             self.truncatedSignals['AccelerationZ']))
-        handlebarAngRate = self.truncatedSignals['ForkRate']
-        handlebarAngAccel = self.truncatedSignals['ForkRate'].time_derivative()
+        handlebarAngRate = rates[3]
+        handlebarAngAccel = accels[3]
         steerAngle = self.truncatedSignals['SteerAngle']
+        # the conversion factor is applied as the torque is summed
         steerColumnTorque =\
-            self.truncatedSignals['SteerTubeTorque'].convert_units('newton*meter')
+            self.truncatedSignals['SteerTubeTorque'].in_units('newton*meter')
         handlebarMass = self.bicycleRiderParameters['mG']
-        handlebarInertia =\
-            self.bicycle.steer_assembly_moment_of_inertia(fork=False,
-                wheel=False, nominal=True)
+        handlebarInertia = self.parameterBundle['handlebarInertia']
         # this is the distance from the handlebar center of mass to the
         # steer axis
-        w = self.bicycleRiderParameters['w']
-        c = self.bicycleRiderParameters['c']
-        lam = self.bicycleRiderParameters['lam']
-        xG = self.bicycleRiderParameters['xG']
-        zG = self.bicycleRiderParameters['zG']
-        handlebarCoM = np.array([xG, 0., zG])
-        d = bp.geometry.distance_to_steer_axis(w, c, lam, handlebarCoM)
+        d = self.parameterBundle['handlebarDistance']
         # these are the distances from the point on the steer axis which is
         # aligned with the handlebar center of mass to the accelerometer on
         # the frame
-        ds1 = self.bicycle.parameters['Measured']['ds1']
-        ds3 = self.bicycle.parameters['Measured']['ds3']
+        ds1 = self.parameterBundle['measured']['ds1']
+        ds3 = self.parameterBundle['measured']['ds3']
         ds = np.array([ds1, 0., ds3]) # i measured these
         # damping and friction values come from Peter's work, I need to verify
         # them still
         damping = 0.3475
         friction = 0.0861
 
-        components = sigpro.steer_torque_components(
+        # the components are only needed for the plot
+        result = sigpro.fused_steer_torque(
             frameAngRate, frameAngAccel, frameAccel, handlebarAngRate,
-            handlebarAngAccel, steerAngle, steerColumnTorque,
-            handlebarMass, handlebarInertia, damping, friction, d, ds)
-        steerTorque = sigpro.steer_torque(components)
+            handlebarAngAccel, steerAngle, steerColumnTorque.array,
+            handlebarMass, handlebarInertia, damping, friction, d, ds,
+            returnComponents=plot, steerColumnFactor=steerColumnTorque.factor)
+        if plot is True:
+            steerTorque, components = result
+        else:
+            steerTorque = result
 
         stDict = {'units':'newton*meter',
                   'name':'SteerTorque',
@@ -1016,9 +2155,11 @@ class Run():
             print('All needed signals are not available. ' +
                   'Yaw, roll and pitch rates were not computed.')
         else:
-            omegaX = omegaX.convert_units('radian/second')
-            omegaY = omegaY.convert_units('radian/second')
-            omegaZ = omegaZ.convert_units('radian/second')
+            # the rate conversions are applied with the trigonometric factors
+            omegaX = omegaX.in_units('radian/second')
+            omegaY = omegaY.in_units('radian/second')
+            omegaZ = omegaZ.in_units('radian/second')
+            # the cosine and tangent need the angle itself in radians
             rollAngle = rollAngle.convert_units('radian')
 
             yr, rr, pr = sigpro.yaw_roll_pitch_rate(omegaX, omegaY, omegaZ, lam,
@@ -1043,8 +2184,8 @@ class Run():
             print('ForkRate or AngularRateZ is not available. ' +
                   'SteerRate was not computed.')
         else:
-            forkRate = forkRate.convert_units('radian/second')
-            omegaZ = omegaZ.convert_units('radian/second')
+            forkRate = forkRate.in_units('radian/second')
+            omegaZ = omegaZ.in_units('radian/second')
 
             steerRate = sigpro.steer_rate(forkRate, omegaZ)
             steerRate.units = 'radian/second'
@@ -1062,11 +2203,12 @@ class Run():
             print('rR or RearWheelRate is not availabe. ' +
                   'ForwardSpeed was not computed.')
         else:
-            rearWheelRate = rearWheelRate.convert_units('radian/second')
+            rearWheelRate = rearWheelRate.in_units('radian/second')
 
-            self.computedSignals['ForwardSpeed'] = -rR * rearWheelRate
-            self.computedSignals['ForwardSpeed'].units = 'meter/second'
-            self.computedSignals['ForwardSpeed'].name = 'ForwardSpeed'
+            # the conversion and the radius are applied in one multiply
+            forwardSpeed = (-rR * rearWheelRate).value()
+            forwardSpeed.units = 'meter/second'
+            self.computedSignals['ForwardSpeed'] = forwardSpeed
 
     def compute_pull_force(self):
         """
@@ -1078,9 +2220,8 @@ class Run():
         except AttributeError:
             print 'PullForce was not available. PullForce was not computed.'
         else:
+            # the force is stored in newtons, so it is converted here
             pullForce = pullForce.convert_units('newton')
-            pullForce.name = 'PullForce'
-            pullForce.units = 'newton'
             self.computedSignals[pullForce.name] = pullForce
 
     def __str__(self):
@@ -1118,7 +2259,9 @@ class Run():
             exportData = {}
             exportData.update(self.metadata)
             try:
-                exportData.update(self.taskSignals)
+                # items evaluates all of the lazy signals, so the ones that
+                # can't be computed are left out
+                exportData.update(self.taskSignals.items())
             except AttributeError:
                 try:
                     exportData.update(self.truncatedSignals)
@@ -1137,8 +2280,9 @@ class Run():
                                       ' yet.').format(filetype))
 
     def extract_task(self):
-        """Slices the computed signals such that data before the end of the
-        bump is removed and unusable trailng data is removed.
+        """Finds the start and end of the task in the computed signals such
+        that data before the end of the bump is removed and unusable trailng
+        data is removed.
 
         """
         # get the z acceleration from the VN-100
@@ -1174,45 +2318,50 @@ class Run():
             # if it isn't a pavilion run, don't clip the end
             end = -1
 
-        self.taskSignals = {}
-        for name, sig in self.computedSignals.items():
-            self.taskSignals[name] = sig[indices[2]:end]
+        # store the task indices so the task can be referenced as a slice of
+        # the computed signals
+        n = len(speed)
+        self.taskStart = indices[2]
+        if end < 0:
+            self.taskEnd = n + end
+        else:
+            self.taskEnd = min(int(end), n)
+
+    def extract_task_signal(self, name):
+        """Stores the task portion of a computed signal in the task
+        signals."""
+        if 'taskStart' not in self.__dict__:
+            self.extract_task()
+        self.taskSignals[name] = self.computedSignals[name][
+                self.taskStart:self.taskEnd]
 
-    def load_rider(self, pathToParameterData):
-        """Creates a bicycle/rider attribute which contains the physical
-        parameters for the bicycle and rider for this run."""
+    def load_rider(self, pathToParameterData, pathToParameterCache=None):
+        """Loads the physical parameters for the bicycle and rider for this
+        run. The parameters are computed once for each rider and bicycle and
+        shared by the runs, see `bicycle_rider_parameters`."""
 
         print("Loading the bicycle and rider data for " +
               "{} on {}".format(self.metadata['Rider'],
               self.metadata['Bicycle']))
 
-        # currently this isn't very generic, it only assumes that there was
-        # Luke, Jason, and Charlie riding on the instrumented bicycle.
-        rider = self.metadata['Rider']
-        if rider == 'Charlie' or rider == 'Luke':
-            # Charlie and Luke rode the bike in the same configuration
-            bicycle = 'Rigidcl'
-        elif rider == 'Jason' :
-            bicycle = 'Rigid'
-        else:
-            raise StandardError('There are no bicycle parameters ' +
-                    'for {}'.format(rider))
+        self.pathToParameterData = pathToParameterData
+        self.parameterBundle = bicycle_rider_parameters(
+                self.metadata['Rider'], pathToParameterData,
+                pathToParameterCache)
 
-        # force a recalculation (but not the period calcs, they take too long)
-        self.bicycle = bp.Bicycle(bicycle, pathToData=pathToParameterData)
+        self.bicycleRiderParameters = dict(self.parameterBundle['benchmark'])
+
+    @property
+    def bicycle(self):
+        """The BicycleParameters bicycle with the rider, it is only loaded
+        when it is used."""
         try:
-            self.bicycle.extras
+            return self._bicycle
         except AttributeError:
-            pass
-        else:
-            self.bicycle.save_parameters()
-        # force a recalculation of the human parameters
-        self.bicycle.add_rider(rider)
-        if self.bicycle.human is not None:
-            self.bicycle.save_parameters()
-
-        self.bicycleRiderParameters =\
-            bp.io.remove_uncertainties(self.bicycle.parameters['Benchmark'])
+            self._bicycle = bp.Bicycle(self.parameterBundle['bicycle'],
+                    pathToData=self.pathToParameterData)
+            self._bicycle.add_rider(self.parameterBundle['rider'])
+            return self._bicycle
 
     def plot(self, *args, **kwargs):
         '''
@@ -1366,6 +2515,487 @@ class Run():
         else:
             print "No video for this run"
 
+# the ufuncs whose result has the units of the inputs if they all match
+_sameUnitsUfuncs = set([np.add, np.subtract, np.maximum, np.minimum, np.fmax,
+    np.fmin, np.fmod, np.remainder, np.hypot, np.copysign])
+
+# the ufuncs of one input whose result has the units of the input
+_keepUnitsUfuncs = set([np.negative, np.positive, np.absolute, np.fabs,
+    np.rint, np.floor, np.ceil, np.trunc, np.conjugate])
+
+def ufunc_metadata(ufunc, inputs):
+    '''Returns the metadata of the result of a ufunc applied to signals.
+
+    Parameters
+    ----------
+    ufunc : numpy.ufunc
+        The ufunc.
+    inputs : tuple
+        The inputs to the ufunc, at least one should be a Signal.
+
+    Returns
+    -------
+    metadata : dictionary
+        The name, runid, sampleRate, source, units and offset of the result.
+
+    Raises
+    ------
+    ValueError
+        If the signals have different sample rates.
+
+    Notes
+    -----
+    The sample rate and offset are taken from the signals. The name and runid
+    are kept if all of the signals have the same one and are None otherwise.
+    The source is 'NA' if the signals come from different sources. The units
+    follow these rules:
+
+    - Negation, absolute value, rounding, etc. keep the units.
+    - Addition, subtraction, etc. keep the units if all of the signals have
+      the same units and the units are None otherwise.
+    - Multiplying or dividing by a number keeps the units, multiplying or
+      dividing two signals combines the units, e.g. 'newton*meter' or
+      'meter/second'.
+    - Powers by a number append the power, e.g. 'meter**2'.
+    - Any other ufunc, e.g. sin or exp, gives units of None.
+
+    '''
+    signals = [x for x in inputs if isinstance(x, Signal)]
+
+    sampleRates = set(x.sampleRate for x in signals if x.sampleRate is not
+            None)
+    if len(sampleRates) > 1:
+        raise ValueError('The signals have different sample rates: ' +
+                '{0}'.format(sorted(sampleRates)))
+
+    def common(attr, default):
+        values = set(getattr(x, attr) for x in signals)
+        if len(values) == 1:
+            return values.pop()
+        else:
+            return default
+
+    metadata = {'name': common('name', None),
+                'runid': common('runid', None),
+                'sampleRate': sampleRates.pop() if sampleRates else None,
+                'source': common('source', 'NA'),
+                'offset': signals[0].offset}
+
+    units = [x.units if isinstance(x, Signal) else '' for x in inputs]
+    isNumber = [not isinstance(x, Signal) for x in inputs]
+
+    if ufunc in _keepUnitsUfuncs:
+        metadata['units'] = units[0]
+    elif ufunc in _sameUnitsUfuncs:
+        metadata['units'] = common('units', None)
+    elif ufunc is np.multiply:
+        if isNumber[0] or isNumber[1]:
+            metadata['units'] = units[1] if isNumber[0] else units[0]
+        elif None in units:
+            metadata['units'] = None
+        else:
+            metadata['units'] = units[0] + '*' + units[1]
+    elif ufunc in (np.divide, np.true_divide):
+        if isNumber[1]:
+            metadata['units'] = units[0]
+        elif None in units:
+            metadata['units'] = None
+        elif isNumber[0]:
+            metadata['units'] = '1/' + units[1]
+        elif units[0] == units[1]:
+            metadata['units'] = None
+        else:
+            metadata['units'] = units[0] + '/' + units[1]
+    elif ufunc is np.power and isNumber[1] and np.isscalar(inputs[1]):
+        if units[0] is None:
+            metadata['units'] = None
+        else:
+            metadata['units'] = '{0}**{1}'.format(units[0], inputs[1])
+    elif ufunc is np.square and units[0] is not None:
+        metadata['units'] = units[0] + '**2'
+    elif ufunc is np.sqrt and units[0] is not None:
+        metadata['units'] = units[0] + '**0.5'
+    else:
+        metadata['units'] = None
+
+    return metadata
+
+# the calibration equations for the raw voltages, v, given the supply
+# voltages, s, the slopes, m, the biases, b, the intercepts, i, and the
+# supply voltages during calibration, c
+_calibrationEquations = {
+    # this is for potentiometers, where the slope is ratiometric and zero
+    # degrees is always zero volts
+    'interceptStar': lambda v, s, m, b, i, c: c / s * m * v + i,
+    # this is the typical calibration that I use for all the sensors that I
+    # calibrate myself
+    'intercept': lambda v, s, m, b, i, c: c / s * (m * v + i),
+    # this is for the accelerometers and rate gyros that are "ratiometric",
+    # but I'm still not sure this is correct
+    'bias': lambda v, s, m, b, i, c: m * (v - s / c * b),
+    }
+
+def calibrate_many(rawSignals, dtype=None):
+    '''Returns the calibrated signals.
+
+    Parameters
+    ----------
+    rawSignals : list
+        The RawSignals to calibrate, they can be from one or more runs.
+    dtype : string or dtype, optional
+        The floating point type to calibrate the signals in, e.g. 'float32'.
+        The default is the type of each raw signal.
+
+    Returns
+    -------
+    calibrated : list
+        The calibrated Signals in the same order. The signals that aren't
+        scaled are the raw signals themselves, or copies if they are cast to
+        `dtype`.
+    calibrationData : list
+        The calibration data used for each signal, None if the signal isn't
+        scaled, see `RawSignal.calibration_data`.
+
+    Notes
+    -----
+    The signals with the same calibration type and length are stacked and
+    scaled with the equation of that type with the calibration constants and
+    supply voltages as columns, so a run is calibrated with one expression
+    for each calibration type.
+
+    '''
+    calibrated = [None] * len(rawSignals)
+    calibrationData = [sig.calibration_data() for sig in rawSignals]
+
+    groups = {}
+    for i, (sig, calibData) in enumerate(zip(rawSignals, calibrationData)):
+        if calibData is None:
+            if dtype is None or sig.dtype == dtype:
+                calibrated[i] = sig
+            else:
+                calibrated[i] = sig.astype(dtype)
+        elif sig.calibrationType in _calibrationEquations:
+            groups.setdefault((sig.calibrationType, len(sig)), []).append(i)
+        else:
+            raise StandardError("None of the calibration equations worked.")
+
+    for (calibrationType, numSamples), indices in groups.items():
+        if dtype is None:
+            groupType = sigpro.float_dtype(*[rawSignals[i] for i in indices])
+        else:
+            groupType = np.dtype(dtype)
+
+        voltages = np.empty((len(indices), numSamples), dtype=groupType)
+        supplies = np.empty_like(voltages)
+        for j, i in enumerate(indices):
+            voltages[j] = rawSignals[i]
+            # the supply is either an array or a constant
+            supplies[j] = rawSignals[i].supply
+
+        def column(key):
+            return np.array([calibrationData[i][key] for i in indices],
+                    dtype=groupType)[:, np.newaxis]
+
+        scaled = _calibrationEquations[calibrationType](voltages, supplies,
+                column('slope'), column('bias'), column('offset'),
+                column('calibrationSupplyVoltage'))
+
+        for j, i in enumerate(indices):
+            calibratedSignal = Signal(scaled[j], rawSignals[i].as_dictionary())
+            calibratedSignal.name = calibrationData[i]['signal']
+            calibratedSignal.units = calibrationData[i]['units']
+            calibrated[i] = calibratedSignal
+
+    return calibrated, calibrationData
+
+def calibrate_runs(runs, dtype=None):
+    '''Returns the calibrated signals of many runs.
+
+    Parameters
+    ----------
+    runs : dictionary
+        A mapping of run ids to dictionaries of the RawSignals of each run.
+    dtype : string or dtype, optional
+        The floating point type to calibrate the signals in.
+
+    Returns
+    -------
+    calibrated : dictionary
+        A mapping of run ids to (calibratedSignals, calibrationData) tuples
+        with the same content as Run.calibratedSignals and
+        Run.calibrationData.
+
+    Notes
+    -----
+    All of the signals are calibrated together with `calibrate_many`, so the
+    runs with the same number of samples, which usually share a calibration
+    set, are scaled with one expression per calibration type.
+
+    '''
+    keys = []
+    rawSignals = []
+    for runid, signals in runs.items():
+        for sig in signals.values():
+            keys.append(runid)
+            rawSignals.append(sig)
+
+    scaled, calibrationData = calibrate_many(rawSignals, dtype=dtype)
+
+    calibrated = dict((runid, ({}, {})) for runid in runs)
+    for runid, sig, calibSig, calibData in zip(keys, rawSignals, scaled,
+            calibrationData):
+        signals, data = calibrated[runid]
+        signals[calibSig.name] = calibSig
+        if calibData is not None:
+            data[sig.name] = calibData
+
+    return calibrated
+
+def filter_signals(signals, frequency):
+    '''Returns the signals filtered by a low pass Butterworth filter.
+
+    Parameters
+    ----------
+    signals : dictionary
+        The Signals to filter.
+    frequency : float
+        The cutoff frequency in hertz.
+
+    Returns
+    -------
+    filtered : dictionary
+        The filtered Signals with the same keys.
+
+    Notes
+    -----
+    This gives the same result as calling Signal.filter for each signal, but
+    the signals with the same length and sample rate are stacked and
+    filtered together.
+
+    '''
+    # group the signals that can be filtered together
+    groups = {}
+    for k, v in signals.items():
+        groups.setdefault((len(v), v.sampleRate), []).append(k)
+
+    filtered = {}
+    for (n, sampleRate), keys in groups.items():
+        stacked = np.vstack([signals[k].spline() for k in keys])
+        stacked = sigpro.filter_many(stacked, frequency, sampleRate, axis=1)
+        for k, row in zip(keys, stacked):
+            filtered[k] = Signal(row, signals[k].as_dictionary())
+
+    return filtered
+
+# the derived parameters of each rider and bicycle combination, keyed by
+# (rider, bicycle, parameter file hash)
+_parameterBundles = {}
+# the md5 digests of the parameter files, keyed by path, with the modification
+# time and size they were computed for
+_parameterFileDigests = {}
+
+def buffer_nbytes(arrays):
+    """Returns the number of bytes of the memory used by the arrays, where
+    the arrays that are views of the same array are counted once as the size
+    of that array."""
+    buffers = {}
+    for array in arrays:
+        while isinstance(array.base, np.ndarray):
+            array = array.base
+        buffers[id(array)] = array.nbytes
+    return sum(buffers.values())
+
+def rider_bicycle(rider):
+    """Returns the name of the bicycle configuration a rider rode.
+
+    Parameters
+    ----------
+    rider : string
+        'Jason', 'Luke' or 'Charlie'.
+
+    Returns
+    -------
+    bicycle : string
+        The name of the bicycle in the BicycleParameters data.
+
+    """
+    # currently this isn't very generic, it only assumes that there was
+    # Luke, Jason, and Charlie riding on the instrumented bicycle.
+    if rider == 'Charlie' or rider == 'Luke':
+        # Charlie and Luke rode the bike in the same configuration
+        return 'Rigidcl'
+    elif rider == 'Jason':
+        return 'Rigid'
+    else:
+        raise StandardError('There are no bicycle parameters ' +
+                'for {}'.format(rider))
+
+def parameter_files_hash(pathToParameterData, bicycle, rider):
+    """Returns a hash of the parameter and raw data files of a bicycle and
+    a rider.
+
+    Parameters
+    ----------
+    pathToParameterData : string
+        The path to the BicycleParameters data directory.
+    bicycle : string
+        The name of the bicycle.
+    rider : string
+        The name of the rider.
+
+    Returns
+    -------
+    hash : string
+        The md5 hex digest of the names and contents of the files in the
+        Parameters and RawData directories of the bicycle and the rider.
+
+    """
+    md5 = hashlib.md5()
+    for directory in [os.path.join('bicycles', bicycle),
+                      os.path.join('riders', rider)]:
+        for subdirectory in ['Parameters', 'RawData']:
+            top = os.path.join(pathToParameterData, directory, subdirectory)
+            for root, dirs, files in os.walk(top):
+                dirs.sort()
+                for name in sorted(files):
+                    path = os.path.join(root, name)
+                    stat = os.stat(path)
+                    try:
+                        mtime, size, digest = _parameterFileDigests[path]
+                    except KeyError:
+                        mtime, size, digest = None, None, None
+                    if mtime != stat.st_mtime or size != stat.st_size:
+                        with open(path, 'rb') as f:
+                            digest = hashlib.md5(f.read()).hexdigest()
+                        _parameterFileDigests[path] = (stat.st_mtime,
+                                stat.st_size, digest)
+                    md5.update(os.path.relpath(path, pathToParameterData))
+                    md5.update(digest)
+    return md5.hexdigest()
+
+def compute_parameter_bundle(bicycle, rider, pathToParameterData):
+    """Returns the parameters of a bicycle and rider that the signal
+    processing needs.
+
+    Parameters
+    ----------
+    bicycle : string
+        The name of the bicycle.
+    rider : string
+        The name of the rider.
+    pathToParameterData : string
+        The path to the BicycleParameters data directory.
+
+    Returns
+    -------
+    bundle : dictionary
+        bicycle, rider : string
+            The names.
+        benchmark : dictionary
+            The nominal benchmark parameters of the bicycle and rider.
+        measured : dictionary
+            The nominal measured parameters of the bicycle, empty if there are
+            none.
+        moore : dictionary
+            The benchmark parameters converted with `benchmark_to_moore`.
+        handlebarInertia : ndarray, shape(3,3)
+            The inertia tensor of the handlebar about its center of mass in
+            the steer axis frame.
+        handlebarDistance : float
+            The distance from the handlebar center of mass to the steer axis.
+
+    Notes
+    -----
+    No parameter files are written, even if the parameters are calculated
+    from the raw data.
+
+    """
+    bicycleModel = bp.Bicycle(bicycle, pathToData=pathToParameterData)
+    bicycleModel.add_rider(rider)
+
+    benchmark = bp.io.remove_uncertainties(
+            bicycleModel.parameters['Benchmark'])
+    bundle = {'bicycle': bicycle,
+              'rider': rider,
+              'benchmark': benchmark,
+              'measured': bp.io.remove_uncertainties(
+                  bicycleModel.parameters.get('Measured', {})),
+              'moore': benchmark_to_moore(benchmark)}
+
+    # only the bicycles with a separate handlebar have these
+    if 'mG' in benchmark:
+        bundle['handlebarInertia'] = np.asarray(
+                bicycleModel.steer_assembly_moment_of_inertia(fork=False,
+                    wheel=False, nominal=True))
+        handlebarCoM = np.array([benchmark['xG'], 0., benchmark['zG']])
+        bundle['handlebarDistance'] = bp.geometry.distance_to_steer_axis(
+                benchmark['w'], benchmark['c'], benchmark['lam'],
+                handlebarCoM)
+
+    return bundle
+
+def bicycle_rider_parameters(rider, pathToParameterData,
+        pathToParameterCache=None):
+    """Returns the parameter bundle for a rider and the bicycle they rode.
+
+    Parameters
+    ----------
+    rider : string
+        The name of the rider.
+    pathToParameterData : string
+        The path to the BicycleParameters data directory.
+    pathToParameterCache : string, optional
+        A directory to store the bundles in, so they are computed once for
+        all processes. If None, the bundles are only kept in this process.
+
+    Returns
+    -------
+    bundle : dictionary
+        See `compute_parameter_bundle`. The bundle is shared and should not
+        be modified.
+
+    Notes
+    -----
+    The bundles are keyed by the rider, the bicycle and the hash of their
+    parameter files, so editing the files gives a new bundle.
+
+    """
+    bicycle = rider_bicycle(rider)
+    fileHash = parameter_files_hash(pathToParameterData, bicycle, rider)
+    key = (rider, bicycle, fileHash)
+    try:
+        return _parameterBundles[key]
+    except KeyError:
+        pass
+
+    bundle = None
+    if pathToParameterCache is not None:
+        pathToFile = os.path.join(pathToParameterCache,
+                '{}{}-{}.p'.format(rider, bicycle, fileHash))
+        try:
+            with open(pathToFile, 'rb') as f:
+                bundle = cPickle.load(f)
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            pass
+
+    if bundle is None:
+        bundle = compute_parameter_bundle(bicycle, rider, pathToParameterData)
+        if pathToParameterCache is not None:
+            try:
+                os.makedirs(pathToParameterCache)
+            except OSError:
+                if not os.path.isdir(pathToParameterCache):
+                    raise
+            # write a temporary file and rename it so that other processes
+            # never read a partial file
+            pathToTemp = pathToFile + '.{}'.format(os.getpid())
+            with open(pathToTemp, 'wb') as f:
+                cPickle.dump(bundle, f, -1)
+            os.rename(pathToTemp, pathToFile)
+
+    _parameterBundles[key] = bundle
+    return bundle
+
 def matlab_date_to_object(matDate):
     '''Returns a date time object based on a Matlab `datestr()` output.
 
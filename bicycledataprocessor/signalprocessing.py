@@ -8,14 +8,22 @@
     #set_trace = Tracer()
 
 from warnings import warn
+from collections import OrderedDict
 
 # dependencies
 import numpy as np
 from scipy.interpolate import UnivariateSpline
-from scipy.optimize import fmin
+from scipy.optimize import fmin, fminbound
+from scipy.signal import decimate, butter, filtfilt
+# sosfiltfilt is only available in SciPy >= 0.18
+try:
+    from scipy.signal import sosfiltfilt
+except ImportError:
+    sosfiltfilt = None
 import matplotlib.pyplot as plt # only for testing
 
-from dtk.process import time_vector, butterworth, normalize, subtract_mean
+from dtk.process import time_vector, normalize, subtract_mean
+from dtk.bicycle import lambda_from_abc
 
 # local dependencies
 from bdpexceptions import TimeShiftError
@@ -90,7 +98,40 @@ def find_bump(accelSignal, sampleRate, speed, wheelbase, bumpLength):
 
         return indices
 
-def split_around_nan(sig):
+def nan_segments(sig):
+    '''Returns the run length encoding of the nan values in a signal.
+
+    Parameters
+    ----------
+    sig : ndarray, shape(n,)
+        A one dimensional array that may or may not contain nan values.
+
+    Returns
+    -------
+    starts : ndarray, shape(k,)
+        The first indice of each segment.
+    stops : ndarray, shape(k,)
+        One past the last indice of each segment.
+    isNan : ndarray, shape(k,)
+        True if the segment is all nans and false if it has no nans.
+
+    Notes
+    -----
+    The segments alternate between valid and nan values and cover the whole
+    signal, i.e. sig[starts[i]:stops[i]] is segment i.
+
+    '''
+    nans = np.isnan(sig)
+    if len(nans) == 0:
+        return (np.zeros(0, dtype=int), np.zeros(0, dtype=int),
+                np.zeros(0, dtype=bool))
+    # the indices where the signal switches between nan and valid values
+    changes = np.nonzero(nans[1:] != nans[:-1])[0] + 1
+    starts = np.hstack((0, changes))
+    stops = np.hstack((changes, len(nans)))
+    return starts, stops, nans[starts]
+
+def split_around_nan(sig, segments=None):
     '''
     Returns the sections of an array not polluted with nans.
 
@@ -99,6 +140,8 @@ def split_around_nan(sig):
     sig : ndarray, shape(n,)
         A one dimensional array that may or may not contain m nan values where
         0 <= m <= n.
+    segments : tuple, optional
+        The output of nan_segments(sig) if it is already available.
 
     Returns
     -------
@@ -112,34 +155,173 @@ def split_around_nan(sig):
     sig[indices[k][0]:indices[k][1]] == arrays[k]
 
     '''
+    if segments is None:
+        segments = nan_segments(sig)
+    starts, stops, isNan = segments
+
     # if there are any nans then split the signal
-    if np.isnan(sig).any():
-        firstSplit = np.split(sig, np.nonzero(np.isnan(sig))[0])
-        arrays = []
-        for arr in firstSplit:
-            # if the array has nans, then split it again
-            if np.isnan(arr).any():
-                arrays = arrays + np.split(arr, np.nonzero(np.isnan(arr))[0] + 1)
-            # if it doesn't have nans, then just add it as is
-            else:
-                arrays.append(arr)
-        # remove any empty arrays
-        emptys = [i for i, arr in enumerate(arrays) if arr.shape[0] == 0]
-        arrays = [arr for i, arr in enumerate(arrays) if i not in emptys]
-        # build the indices list
-        indices = []
-        count = 0
-        for i, arr in enumerate(arrays):
-            count += len(arr)
-            if np.isnan(arr).any():
-                indices.append((count - 1, count))
-            else:
-                indices.append((count - len(arr), count))
+    if isNan.any():
+        # each nan value is a section of its own
+        nanIndices = np.hstack([np.arange(start, stop) for start, stop in
+            zip(starts[isNan], stops[isNan])])
+        sectionStarts = np.hstack((starts[~isNan], nanIndices))
+        sectionStops = np.hstack((stops[~isNan], nanIndices + 1))
+        order = np.argsort(sectionStarts)
+        indices = [(int(start), int(stop)) for start, stop in
+                zip(sectionStarts[order], sectionStops[order])]
+        arrays = [sig[start:stop] for start, stop in indices]
     else:
         arrays, indices = [sig], [(0, len(sig))]
 
     return indices, arrays
 
+def fill_nan_gaps(y, x=None, support=8, segments=None):
+    '''Returns the signal with the nan values replaced by cubic splines fit
+    to the samples on each side of each gap.
+
+    Parameters
+    ----------
+    y : ndarray, shape(n,)
+        The signal which may contain nans.
+    x : ndarray, shape(n,), optional
+        The increasing independent variable, e.g. time. The sample index is
+        used if it isn't given.
+    support : integer, optional
+        The number of samples on each side of a gap that the spline is fit to.
+    segments : tuple, optional
+        The output of nan_segments(y) if it is already available.
+
+    Returns
+    -------
+    filled : ndarray, shape(n,)
+        The filled signal. If `y` doesn't contain any nans then `y` itself is
+        returned, otherwise a copy of `y` with the nans replaced.
+
+    Notes
+    -----
+    This is a local version of dtk.process.spline_over_nan which fits one
+    spline through the whole signal. Only the samples near a gap affect the
+    values filled in the gap, so fitting to the neighbouring samples gives
+    nearly the same result for much less work.
+
+    '''
+    if segments is None:
+        segments = nan_segments(y)
+    starts, stops, isNan = segments
+
+    if not isNan.any():
+        return y
+
+    if x is None:
+        x = np.arange(len(y), dtype=float)
+
+    filled = np.array(y, dtype=float)
+    for start, stop in zip(starts[isNan], stops[isNan]):
+        # the valid samples around the gap, which may include other gaps
+        low = max(start - support, 0)
+        high = min(stop + support, len(y))
+        valid = ~np.isnan(y[low:high])
+        xLocal = x[low:high][valid]
+        yLocal = y[low:high][valid]
+        if len(xLocal) == 0:
+            continue
+        elif len(xLocal) == 1:
+            filled[start:stop] = yLocal[0]
+        else:
+            spline = UnivariateSpline(xLocal, yLocal,
+                    k=min(3, len(xLocal) - 1), s=0)
+            filled[start:stop] = spline(x[start:stop])
+
+    return filled
+
+# the Butterworth designs are cached by (order, normalized cutoff)
+_butterworthDesigns = {}
+
+def butterworth_design(cutoff, sampleRate, order=2):
+    '''Returns the low pass Butterworth filter design for a cutoff frequency
+    and sample rate. The designs are cached, so the same filter is only
+    designed once.
+
+    Parameters
+    ----------
+    cutoff : float
+        The filter cutoff frequency in hertz.
+    sampleRate : float
+        The sample rate of the data in hertz.
+    order : integer, optional
+        The order of the filter.
+
+    Returns
+    -------
+    b, a : ndarray
+        The numerator and denominator of the filter.
+    sos : ndarray, shape(k, 6) or None
+        The second order sections of the filter if sosfiltfilt is available.
+
+    '''
+    # Wn is the ratio of the cutoff frequency to the Nyquist frequency.
+    Wn = cutoff / (0.5 * sampleRate)
+    key = (order, Wn)
+    try:
+        return _butterworthDesigns[key]
+    except KeyError:
+        b, a = butter(order, Wn)
+        if sosfiltfilt is None:
+            sos = None
+        else:
+            sos = butter(order, Wn, output='sos')
+        _butterworthDesigns[key] = (b, a, sos)
+        return b, a, sos
+
+def filter_many(data, cutoff, sampleRate, order=2, axis=-1):
+    '''Returns the data filtered by a forward/backward pass low pass
+    Butterworth filter.
+
+    Parameters
+    ----------
+    data : ndarray, shape(n,) or shape(m, n)
+        The data to filter, e.g. several channels with the same sample rate
+        stacked in the rows of a two dimensional array.
+    cutoff : float
+        The filter cutoff frequency in hertz.
+    sampleRate : float
+        The sample rate of the data in hertz.
+    order : integer, optional
+        The order of the filter.
+    axis : integer, optional
+        The time axis of the data.
+
+    Returns
+    -------
+    filtered : ndarray
+        The filtered data.
+
+    Notes
+    -----
+    This gives the same result as dtk.process.butterworth. The data is padded
+    with the same number of samples that filtfilt uses so both the second
+    order section and the transfer function forms agree.
+
+    '''
+    b, a, sos = butterworth_design(cutoff, sampleRate, order=order)
+    padlen = 3 * max(len(a), len(b))
+    if sos is None:
+        filtered = filtfilt(b, a, data, axis=axis, padlen=padlen)
+    else:
+        filtered = sosfiltfilt(sos, data, axis=axis, padlen=padlen)
+    # the filter is computed in double precision, single precision data is
+    # returned in single precision
+    return filtered.astype(float_dtype(data), copy=False)
+
+def float_dtype(*arrays):
+    '''Returns the floating point type of the result of combining the
+    arrays, float64 if it isn't a floating point type.'''
+    dtype = np.result_type(*arrays)
+    if np.issubdtype(dtype, np.floating):
+        return dtype
+    else:
+        return np.dtype(np.float64)
+
 def steer_rate(forkRate, angularRateZ):
     '''Returns the steer rate.
 
@@ -290,6 +472,150 @@ def steer_torque(components):
 
     return np.sum(components.values(), axis=0)
 
+def fused_steer_torque(frameAngRate, frameAngAccel, frameAccel,
+        handlebarAngRate, handlebarAngAccel, steerAngle, steerColumnTorque,
+        handlebarMass, handlebarInertia, damping, friction, d, ds,
+        returnComponents=False, steerColumnFactor=1.):
+    """Returns the steer torque applied by the rider.
+
+    This gives the same result as
+    steer_torque(steer_torque_components(...)), but the sine and cosine of
+    the steer angle are computed once and the components are summed into a
+    single array with only two temporary arrays.
+
+    Parameters
+    ----------
+    frameAngRate, frameAngAccel, frameAccel, handlebarAngRate,
+    handlebarAngAccel, steerAngle, steerColumnTorque, handlebarMass,
+    handlebarInertia, damping, friction, d, ds
+        See `steer_torque_components`.
+    returnComponents : boolean, optional
+        If true the ten components of the steer torque are returned too.
+    steerColumnFactor : float, optional
+        The factor that converts the steer column torque to the units of the
+        result, e.g. from inch*pound to newton*meter. It is applied as the
+        torque is added to the result, so the converted torque isn't stored
+        in a separate array.
+
+    Returns
+    -------
+    steerTorque : ndarray, shape(n,)
+        The steer torque applied by the rider.
+    components : dictionary
+        The ten components of the steer torque, only if `returnComponents`
+        is true.
+
+    """
+    # single precision signals give a single precision result
+    dtype = float_dtype(frameAngRate, frameAngAccel, frameAccel,
+            handlebarAngRate, handlebarAngAccel, steerAngle,
+            steerColumnTorque)
+    wb1, wb2, wb3 = np.asarray(frameAngRate, dtype=dtype)
+    wb1p, wb2p, wb3p = np.asarray(frameAngAccel, dtype=dtype)
+    av1, av2, av3 = np.asarray(frameAccel, dtype=dtype)
+    wh3 = np.asarray(handlebarAngRate, dtype=dtype)
+    wh3p = np.asarray(handlebarAngAccel, dtype=dtype)
+    delta = np.asarray(steerAngle, dtype=dtype)
+    IH = handlebarInertia
+    mH = handlebarMass
+
+    sd = np.sin(delta)
+    cd = np.cos(delta)
+
+    # the frame angular rate expressed in the handlebar frame
+    tmp = wb2 * sd
+    wh1 = wb1 * cd
+    wh1 += tmp
+    np.multiply(wb1, sd, out=tmp)
+    wh2 = wb2 * cd
+    wh2 -= tmp
+
+    # the handlebar rate relative to the frame
+    relative = wh3 - wb3
+
+    if returnComponents:
+        components = {}
+        components['Hdot1'] = -(IH[0, 0] * wh1 + IH[2, 0] * wh3) * wh2
+        components['Hdot2'] = IH[1, 1] * wh2 * wh1
+        components['Hdot3'] = IH[2, 2] * wh3p
+        components['Hdot4'] = IH[2, 0] * (relative * wh2 + sd * wb2p +
+                cd * wb1p)
+        components['cross1'] = d * mH * (d * wh2 * wh1 + d * wh3p)
+        components['cross2'] = -d * mH * (-ds[0] * wb2**2 + ds[2] * wb2p -
+                (ds[0] * wb3 - ds[2] * wb1) * wb3 + av1) * sd
+        components['cross3'] = d * mH * (ds[0] * wb1 * wb2 + ds[0] * wb3p +
+                ds[2] * wb2 * wb3 - ds[2] * wb1p + av2) * cd
+        components['viscous'] = damping * relative / 2.
+        components['coulomb'] = np.sign(relative) * friction / 2.
+        components['steerColumn'] = np.multiply(steerColumnTorque,
+                steerColumnFactor, dtype=dtype)
+
+        steerTorque = np.zeros_like(delta)
+        for component in components.values():
+            steerTorque += component
+
+        return steerTorque, components
+
+    dm = d * mH
+
+    # Hdot1, Hdot2 and cross1 share the wh1 * wh2 term and Hdot1 and Hdot4
+    # share IH[2, 0] * wh2 terms that reduce to -IH[2, 0] * wb3 * wh2
+    steerTorque = wh1 * wh2
+    steerTorque *= IH[1, 1] - IH[0, 0] + d * dm
+    np.multiply(wb3, wh2, out=tmp)
+    tmp *= IH[2, 0]
+    steerTorque -= tmp
+    np.multiply(sd, wb2p, out=tmp)
+    tmp *= IH[2, 0]
+    steerTorque += tmp
+    np.multiply(cd, wb1p, out=tmp)
+    tmp *= IH[2, 0]
+    steerTorque += tmp
+    # Hdot3 and cross1
+    np.multiply(wh3p, IH[2, 2] + d * dm, out=tmp)
+    steerTorque += tmp
+
+    # cross2, wh1 is reused as a buffer
+    acc = wh1
+    np.multiply(wb2, wb2, out=acc)
+    np.multiply(wb3, wb3, out=tmp)
+    acc += tmp
+    acc *= ds[0]
+    np.multiply(wb1, wb3, out=tmp)
+    tmp += wb2p
+    tmp *= ds[2]
+    acc -= tmp
+    acc -= av1
+    acc *= sd
+    acc *= dm
+    steerTorque += acc
+
+    # cross3
+    np.multiply(wb1, wb2, out=acc)
+    acc += wb3p
+    acc *= ds[0]
+    np.multiply(wb2, wb3, out=tmp)
+    tmp -= wb1p
+    tmp *= ds[2]
+    acc += tmp
+    acc += av2
+    acc *= cd
+    acc *= dm
+    steerTorque += acc
+
+    # coulomb and viscous friction
+    np.sign(relative, out=tmp)
+    tmp *= friction / 2.
+    steerTorque += tmp
+    relative *= damping / 2.
+    steerTorque += relative
+
+    # the steer column torque is converted in the temporary array
+    np.multiply(steerColumnTorque, steerColumnFactor, out=tmp)
+    steerTorque += tmp
+
+    return steerTorque
+
 def rear_wheel_contact_rate(rearRadius, rearWheelRate, yawAngle):
     """Returns the longitudinal and lateral components of the velocity of the
     rear wheel contact in the ground plane.
@@ -315,6 +641,154 @@ def rear_wheel_contact_rate(rearRadius, rearWheelRate, yawAngle):
     lateral = -rearWheelRate * rearRadius * np.sin(yawAngle)
     return longitudinal, lateral
 
+def pitch_from_roll_and_steer_many(q4, q7, rF, rR, d1, d2, d3, guess=None,
+        tol=1e-12, maxiter=50):
+    """Returns the pitch angles of the bicycle frame for arrays of roll and
+    steer angles.
+
+    Parameters
+    ----------
+    q4 : ndarray, shape(n,)
+        The roll angles.
+    q7 : ndarray, shape(n,)
+        The steer angles.
+    rF, rR, d1, d2, d3 : float
+        The geometry, see `dtk.bicycle.pitch_from_roll_and_steer`.
+    guess : float, optional
+        A guess for the pitch angle, the default is the pitch angle for zero
+        roll and steer.
+    tol : float, optional
+        The solution is accepted when every pitch angle changes by less than
+        this in an iteration.
+    maxiter : integer, optional
+        The maximum number of iterations.
+
+    Returns
+    -------
+    q5 : ndarray, shape(n,)
+        The pitch angles.
+
+    Raises
+    ------
+    RuntimeError
+        If the solution doesn't converge.
+
+    Notes
+    -----
+    This uses the secant method with the same starting points as
+    `scipy.optimize.newton`, which `dtk.bicycle.pitch_from_roll_and_steer`
+    uses for each angle, but iterates on all of the angles at once.
+
+    """
+    q4 = np.asarray(q4, dtype=float)
+    q7 = np.asarray(q7, dtype=float)
+
+    # the roll and steer terms don't change during the iterations
+    s4 = np.sin(q4)
+    c4 = np.cos(q4)
+    s4s7 = s4 * np.sin(q7)
+    c4c7 = c4 * np.cos(q7)
+    c4c4 = c4 * c4
+
+    def pitch_constraint(q5):
+        s5 = np.sin(q5)
+        c5 = np.cos(q5)
+        a = s4s7 - s5 * c4c7
+        r = np.sqrt(c4c4 * c5 * c5 + a * a)
+        return (d2 * c4 * c5 + rF * c4c4 * c5 * c5 / r + a * (d3 + rF * a /
+            r) - rR * c4 - d1 * s5 * c4)
+
+    if guess is None:
+        # guess based on steer and roll being both zero
+        guess = lambda_from_abc(rF, rR, d1, d3, d2)
+
+    p0 = np.ones_like(q4) * guess
+    if guess >= 0:
+        p1 = p0 * (1 + 1e-4) + 1e-4
+    else:
+        p1 = p0 * (1 + 1e-4) - 1e-4
+    f0 = pitch_constraint(p0)
+    f1 = pitch_constraint(p1)
+
+    for i in range(maxiter):
+        df = f1 - f0
+        # the angles with equal constraint values have converged
+        moving = df != 0.
+        step = np.zeros_like(p1)
+        step[moving] = f1[moving] * (p1[moving] - p0[moving]) / df[moving]
+        p0, f0 = p1, f1
+        p1 = p1 - step
+        if np.all(np.abs(step) < tol):
+            return p1
+        f1 = pitch_constraint(p1)
+
+    raise RuntimeError('Failed to converge after {0} iterations.'.format(
+        maxiter))
+
+def front_contact_many(q1, q2, q3, q4, q7, d1, d2, d3, rr, rf, guess=None):
+    """Returns the locations in the ground plane of the front wheel contact
+    point for arrays of the coordinates.
+
+    Parameters
+    ----------
+    q1, q2 : ndarray, shape(n,)
+        The location of the rear wheel contact point.
+    q3, q4, q7 : ndarray, shape(n,)
+        The yaw, roll and steer angles.
+    d1, d2, d3, rr, rf : float
+        The geometry, see `dtk.bicycle.front_contact`.
+    guess : float, optional
+        A guess for the pitch angle.
+
+    Returns
+    -------
+    q9 : ndarray, shape(n,)
+        The location of the front wheel contact point with respect to the
+        inertial origin along the 1 axis.
+    q10 : ndarray, shape(n,)
+        The location of the front wheel contact point with respect to the
+        inertial origin along the 2 axis.
+
+    Notes
+    -----
+    This gives the same result as np.vectorize(dtk.bicycle.front_contact).
+    The pitch angle is always solved in double precision, the rest is
+    computed in the precision of the coordinates.
+
+    """
+    dtype = float_dtype(q1, q2, q3, q4, q7)
+    q1, q2, q3, q4, q7 = [np.asarray(x, dtype=dtype) for x in
+            (q1, q2, q3, q4, q7)]
+
+    q5 = pitch_from_roll_and_steer_many(q4.astype(np.float64),
+            q7.astype(np.float64), rf, rr, d1, d2, d3,
+            guess=guess).astype(dtype)
+
+    s3, c3 = np.sin(q3), np.cos(q3)
+    s4, c4 = np.sin(q4), np.cos(q4)
+    s5, c5 = np.sin(q5), np.cos(q5)
+    s7, c7 = np.sin(q7), np.cos(q7)
+
+    a = s4 * s7 - s5 * c4 * c7
+    r = np.sqrt(c4**2 * c5**2 + a**2)
+    # the distance from the front wheel center to the contact point along
+    # the steer axis direction and the wheel plane
+    front = d3 + rf * a / r
+    c4c5r = rf * c4 * c5 / r
+    s4s5c7 = s4 * s5 * c7
+    s7c4 = s7 * c4
+
+    u = s5 * c3 + s3 * s4 * c5
+    v = s3 * s5 - s4 * c3 * c5
+
+    q9 = q1 + (d2 * u + d1 * (c3 * c5 - s3 * s4 * s5) + c4c5r * u + (c3 *
+        c5 * c7 - s3 * (s7c4 + s4s5c7)) * front - rr * s3 * s4)
+
+    q10 = q2 + (rr * s4 * c3 + d1 * (s3 * c5 + s4 * s5 * c3) + d2 * v +
+        c4c5r * v + (s3 * c5 * c7 + c3 * (s7c4 + s4s5c7)) * front)
+
+    return q9, q10
+
 def sync_error(tau, signal1, signal2, time):
     '''Returns the error between two signal time histories.
 
@@ -366,33 +840,91 @@ def sync_error(tau, signal1, signal2, time):
 
     return error
 
-def find_timeshift(niAcc, vnAcc, sampleRate, speed, plotError=False):
-    '''Returns the timeshift, tau, of the VectorNav [VN] data relative to the
-    National Instruments [NI] data.
+def sync_error_many(taus, signal1, signal2, time):
+    '''Returns the error between two signal time histories for several time
+    shifts. This gives the same results as calling `sync_error` for each
+    time shift.
+
+    Parameters
+    ----------
+    taus : array_like, shape(k,)
+        The time shifts.
+    signal1 : ndarray, shape(n,)
+        The signal that will be interpolated.
+    signal2 : ndarray, shape(n,)
+        The signal that will be shifted to syncronize with signal 1.
+    time : ndarray, shape(n,)
+        The time vector for the two signals, it must be increasing.
+
+    Returns
+    -------
+    errors : ndarray, shape(k,)
+        Error between the two signals for each tau.
+
+    '''
+    taus = np.atleast_1d(np.asarray(taus, dtype=float))
+
+    # make sure tau isn't too large
+    maxTau = np.max(np.abs(taus))
+    if maxTau >= time[-1]:
+        raise TimeShiftError(('abs(tau), {0}, must be less than or equal to ' +
+                         '{1}').format(str(maxTau), str(time[-1])))
+
+    n = len(time)
+    errors = np.zeros_like(taus)
+
+    # evaluate the time shifts in blocks of about 1e5 samples, small blocks
+    # stay in the cache and are faster than one large block
+    blockSize = max(1, int(1e5 / n))
+    for start in range(0, len(taus), blockSize):
+        tau = taus[start:start + blockSize, np.newaxis]
+        shiftedTime = time + tau
+
+        # interpolate signal 1 at all of the shifted times at once, the
+        # shifted times are sorted in each row so the interpolation can reuse
+        # the previous search location
+        difference = np.interp(shiftedTime.ravel(), time,
+                signal1).reshape(shiftedTime.shape)
+        difference -= signal2
+
+        # only keep the samples where the two signals overlap, see sync_error
+        overlap = np.where(tau > 0, shiftedTime < time[-1],
+                shiftedTime > time[0])
+        difference[~overlap] = 0.
+
+        errors[start:start + blockSize] = np.sqrt(np.einsum('ij,ij->i',
+            difference, difference))
+
+    return errors
+
+def timeshift_sections(niAcc, vnAcc, sampleRate, speed, vnSegments=None):
+    '''Returns the normalized sections of the NI and VN accelerometer
+    signals around the bump which are used to find the time shift.
 
     Parameters
     ----------
     niAcc : ndarray, shape(n, )
         The acceleration of the NI accelerometer in its local Y direction.
     vnAcc : ndarray, shape(n, )
-        The acceleration of the VN-100 in its local Z direction. Should be the
-        same length as NIacc and contains the same signal albiet time shifted.
-        The VectorNav signal should be leading the NI signal.
+        The acceleration of the VN-100 in its local Z direction.
     sampleRate : integer or float
-        Sample rate of the signals. This should be the same for each signal.
+        Sample rate of the signals.
     speed : float
         The approximate forward speed of the bicycle.
+    vnSegments : tuple, optional
+        The output of nan_segments(vnAcc) if it is already available.
 
     Returns
     -------
-    tau : float
-        The timeshift.
-
-    Notes
-    -----
-    The Z direction for `VNacc` is assumed to be aligned with the steer axis
-    and pointing down and the Y direction for the NI accelerometer should be
-    aligned with the steer axis and pointing up.
+    niBumpSec : ndarray, shape(m, )
+        The mean subtracted and normalized NI signal around the bump.
+    vnBumpSec : ndarray, shape(m, )
+        The mean subtracted and normalized VN signal around the bump. This
+        section does not contain any nans.
+    timeBumpSec : ndarray, shape(m, )
+        The time of the bump section.
+    guess : float
+        A guess of the time shift based on the bump locations.
 
     '''
     # raise an error if the signals are not the same length
@@ -401,7 +933,7 @@ def find_timeshift(niAcc, vnAcc, sampleRate, speed, plotError=False):
         raise TimeShiftError('Signals are not the same length!')
 
     # make a time vector
-    time = time_vector(N, sampleRate)
+    time = time_base(N, sampleRate)
 
     # the signals are opposite sign of each other, so fix that
     niSig = -niAcc
@@ -412,17 +944,16 @@ def find_timeshift(niAcc, vnAcc, sampleRate, speed, plotError=False):
     bumpLength = 1.
     cutoff = 30.
     # filter the NI Signal
-    filNiSig = butterworth(niSig, cutoff, sampleRate)
+    filNiSig = filter_many(niSig, cutoff, sampleRate)
     # find the bump in the filtered NI signal
     niBump =  find_bump(filNiSig, sampleRate, speed, wheelbase, bumpLength)
 
-    # remove the nan's in the VN signal and the corresponding time
-    v = vnSig[np.nonzero(np.isnan(vnSig) == False)]
-    t = time[np.nonzero(np.isnan(vnSig) == False)]
-    # fit a spline through the data
-    vn_spline = UnivariateSpline(t, v, k=3, s=0)
-    # and filter it
-    filVnSig = butterworth(vn_spline(time), cutoff, sampleRate)
+    if vnSegments is None:
+        vnSegments = nan_segments(vnSig)
+
+    # fill the nan's in the VN signal with splines and filter it
+    filVnSig = filter_many(fill_nan_gaps(vnSig, time, segments=vnSegments),
+            cutoff, sampleRate)
     # and find the bump in the filtered VN signal
     vnBump = find_bump(filVnSig, sampleRate, speed, wheelbase, bumpLength)
 
@@ -433,15 +964,15 @@ def find_timeshift(niAcc, vnAcc, sampleRate, speed, plotError=False):
         guess = (niBump[1] - vnBump[1]) / float(sampleRate)
 
     # Since vnSig may have nans we should only use contiguous data around
-    # around the bump. The first step is to split vnSig into sections bounded
+    # around the bump. The first step is to find the sections of vnSig bounded
     # by the nans and then selected the section in which the bump falls. Then
     # we select a similar area in niSig to run the time shift algorithm on.
     if vnBump is None:
         bumpLocation = 800 # just a random guess so things don't crash
     else:
         bumpLocation = vnBump[1]
-    indices, arrays = split_around_nan(vnSig)
-    for pair in indices:
+    starts, stops, isNan = vnSegments
+    for pair in zip(starts, stops):
         if pair[0] <= bumpLocation < pair[1]:
             bSec = pair
 
@@ -456,13 +987,115 @@ def find_timeshift(niAcc, vnAcc, sampleRate, speed, plotError=False):
     if len(niBumpSec) < 200:
         warn('The bump section is only {} samples wide.'.format(str(len(niBumpSec))))
 
+    return niBumpSec, vnBumpSec, timeBumpSec, guess
+
+def find_timeshift(niAcc, vnAcc, sampleRate, speed, plotError=False,
+        method='landscape', fullOutput=False, vnSegments=None):
+    '''Returns the timeshift, tau, of the VectorNav [VN] data relative to the
+    National Instruments [NI] data.
+
+    Parameters
+    ----------
+    niAcc : ndarray, shape(n, )
+        The acceleration of the NI accelerometer in its local Y direction.
+    vnAcc : ndarray, shape(n, )
+        The acceleration of the VN-100 in its local Z direction. Should be the
+        same length as NIacc and contains the same signal albiet time shifted.
+        The VectorNav signal should be leading the NI signal.
+    sampleRate : integer or float
+        Sample rate of the signals. This should be the same for each signal.
+    speed : float
+        The approximate forward speed of the bicycle.
+    plotError : boolean, optional
+        If true the error landscape (or the cross correlation) is plotted.
+    method : string, optional, {'landscape', 'xcorr', 'multires'}
+        'landscape' evaluates the sync error over a grid of time shifts and
+        then minimizes it from the best grid point and the bump guess.
+        'xcorr' finds the peak of the cross correlation of the bump sections
+        and refines it with a bounded minimization of the sync error.
+        'multires' searches the sync error of decimated bump sections and
+        then refines the result at the full sample rate near the coarse
+        minimum.
+    fullOutput : boolean, optional
+        If true a dictionary with diagnostic information is also returned.
+    vnSegments : tuple, optional
+        The output of nan_segments(vnAcc) if it is already available.
+
+    Returns
+    -------
+    tau : float
+        The timeshift.
+    info : dictionary
+        Only if fullOutput is true. It contains the 'method', the bump
+        'guess' and a list of 'levels'. The 'multires' method has one
+        dictionary per resolution in the levels with the 'sampleRate', the
+        'taus' searched, their 'errors' and the best 'tau', the other methods
+        have no levels.
+
+    Notes
+    -----
+    The Z direction for `VNacc` is assumed to be aligned with the steer axis
+    and pointing down and the Y direction for the NI accelerometer should be
+    aligned with the steer axis and pointing up.
+
+    '''
+    niBumpSec, vnBumpSec, timeBumpSec, guess = timeshift_sections(niAcc,
+            vnAcc, sampleRate, speed, vnSegments=vnSegments)
+
+    if method == 'landscape':
+        tau = landscape_timeshift(niBumpSec, vnBumpSec, timeBumpSec, guess,
+                plotError=plotError)
+    elif method == 'xcorr':
+        tau = xcorr_timeshift(niBumpSec, vnBumpSec, timeBumpSec, sampleRate,
+                plotError=plotError)
+    elif method == 'multires':
+        tau, levels = multires_timeshift(niBumpSec, vnBumpSec, timeBumpSec,
+                sampleRate, plotError=plotError, fullOutput=True)
+    else:
+        raise ValueError('{0} is not a valid time shift method.'.format(method))
+
+    print "This is what came out of the minimization:", tau
+
+    if not (0.05 < tau < 2.0):
+        raise TimeShiftError('This tau, {} s, is probably wrong'.format(str(tau)))
+
+    if fullOutput:
+        info = {'method': method, 'guess': guess, 'levels': []}
+        if method == 'multires':
+            info['levels'] = levels
+        return tau, info
+    else:
+        return tau
+
+def landscape_timeshift(niBumpSec, vnBumpSec, timeBumpSec, guess,
+        plotError=False):
+    '''Returns the time shift which minimizes the sync error starting from
+    the minimum of an error landscape and from the guess.
+
+    Parameters
+    ----------
+    niBumpSec : ndarray, shape(m, )
+        The normalized NI signal around the bump.
+    vnBumpSec : ndarray, shape(m, )
+        The normalized VN signal around the bump.
+    timeBumpSec : ndarray, shape(m, )
+        The time of the bump section.
+    guess : float
+        A guess of the time shift.
+    plotError : boolean, optional
+        If true the error landscape is plotted.
+
+    Returns
+    -------
+    tau : float
+        The timeshift.
+
+    '''
     # set up the error landscape, error vs tau
     # The NI lags the VectorNav and the time shift is typically between 0 and
     # 1 seconds
     tauRange = np.linspace(0., 2., num=500)
-    error = np.zeros_like(tauRange)
-    for i, val in enumerate(tauRange):
-        error[i] = sync_error(val, niBumpSec, vnBumpSec, timeBumpSec)
+    error = sync_error_many(tauRange, niBumpSec, vnBumpSec, timeBumpSec)
 
     if plotError:
         plt.figure()
@@ -495,13 +1128,366 @@ def find_timeshift(niAcc, vnAcc, sampleRate, speed, plotError=False):
         ###tau = tau0
         ###print "Bad minimizer!! Using the guess, %f, instead." % tau
 
-    print "This is what came out of the minimization:", tau
+    return tau[0]
 
-    if not (0.05 < tau < 2.0):
-        raise TimeShiftError('This tau, {} s, is probably wrong'.format(str(tau)))
+def xcorr_timeshift(niBumpSec, vnBumpSec, timeBumpSec, sampleRate,
+        maxShift=2., plotError=False):
+    '''Returns the time shift found from the cross correlation of the bump
+    sections refined to a fraction of a sample with the sync error.
+
+    Parameters
+    ----------
+    niBumpSec : ndarray, shape(m, )
+        The normalized NI signal around the bump.
+    vnBumpSec : ndarray, shape(m, )
+        The normalized VN signal around the bump.
+    timeBumpSec : ndarray, shape(m, )
+        The time of the bump section.
+    sampleRate : float
+        The sample rate of the signals.
+    maxShift : float, optional
+        The largest time shift in seconds that is searched.
+    plotError : boolean, optional
+        If true the cross correlation is plotted.
+
+    Returns
+    -------
+    tau : float
+        The timeshift.
+
+    Notes
+    -----
+    The NI signal lags the VN signal, so the correlation is only computed for
+    NI delays between zero and `maxShift`. The peak of the correlation is only
+    accurate to a sample, so the sync error is evaluated at the samples around
+    it and then minimized between the neighbours of the best sample.
+
+    '''
+    m = len(niBumpSec)
+
+    # the largest delay in samples, which must leave some overlap
+    maxLag = min(int(maxShift * sampleRate), m - 2)
+
+    # c[k] = sum(ni[i + k] * vn[i]), zero padded to avoid circular wrapping
+    nfft = 2**int(np.ceil(np.log2(2 * m)))
+    corr = np.fft.irfft(np.fft.rfft(niBumpSec, nfft) *
+            np.conj(np.fft.rfft(vnBumpSec, nfft)), nfft)[:maxLag + 1]
+    # normalize by the overlap so long shifts aren't penalized
+    corr = corr / np.arange(m, m - maxLag - 1, -1)
+
+    if plotError:
+        plt.figure()
+        plt.plot(np.arange(maxLag + 1) / float(sampleRate), corr)
+        plt.xlabel('tau')
+        plt.ylabel('correlation')
+        plt.show()
+
+    peak = np.argmax(corr)
+
+    # the correlation peak and the sync error minimum may not be on the same
+    # sample, so check the samples around the peak
+    lags = np.arange(max(peak - 3, 0), min(peak + 3, maxLag) + 1)
+    errors = sync_error_many(lags / float(sampleRate), niBumpSec, vnBumpSec,
+        timeBumpSec)
+    best = lags[np.argmin(errors)]
+
+    print "The peak of the cross correlation is at %f" % (peak /
+            float(sampleRate))
+
+    low = max(best - 1, 0) / float(sampleRate)
+    high = min(best + 1, maxLag) / float(sampleRate)
+    tau = fminbound(sync_error, low, high, args=(niBumpSec, vnBumpSec,
+        timeBumpSec), xtol=1e-8)
 
     return tau
 
+def multires_timeshift(niBumpSec, vnBumpSec, timeBumpSec, sampleRate,
+        factor=4, maxShift=2., plotError=False, fullOutput=False):
+    '''Returns the time shift found by searching the sync error of decimated
+    bump sections and refining the result at the full sample rate.
+
+    Parameters
+    ----------
+    niBumpSec : ndarray, shape(m, )
+        The normalized NI signal around the bump.
+    vnBumpSec : ndarray, shape(m, )
+        The normalized VN signal around the bump.
+    timeBumpSec : ndarray, shape(m, )
+        The time of the bump section.
+    sampleRate : float
+        The sample rate of the signals.
+    factor : integer, optional
+        The decimation factor of the coarse level.
+    maxShift : float, optional
+        The largest time shift in seconds that is searched.
+    plotError : boolean, optional
+        If true the error of both levels is plotted.
+    fullOutput : boolean, optional
+        If true the results of each level are also returned.
+
+    Returns
+    -------
+    tau : float
+        The timeshift.
+    levels : list
+        Only if fullOutput is true. A dictionary for the coarse and the fine
+        level with the 'sampleRate', the 'taus' searched, their 'errors' and
+        the best 'tau'.
+
+    Notes
+    -----
+    The signals are low pass filtered before they are decimated so the
+    coarse level doesn't alias. Both signals are filtered the same way so the
+    phase lag of the filter doesn't change the time shift. The fine level
+    only searches the full rate samples within two coarse samples of the
+    coarse minimum and then minimizes the sync error between the neighbours of
+    the best sample.
+
+    '''
+    m = len(niBumpSec)
+
+    # the coarse level
+    coarseRate = sampleRate / float(factor)
+    niCoarse = decimate(niBumpSec, factor)
+    vnCoarse = decimate(vnBumpSec, factor)
+    timeCoarse = timeBumpSec[0] + np.arange(len(niCoarse)) / coarseRate
+
+    maxCoarse = min(int(maxShift * coarseRate), len(niCoarse) - 2)
+    coarseTaus = np.arange(maxCoarse + 1) / coarseRate
+    # the time shift can't reach the end of the time vector
+    coarseTaus = coarseTaus[coarseTaus < timeCoarse[-1]]
+    coarseErrors = sync_error_many(coarseTaus, niCoarse, vnCoarse, timeCoarse)
+    coarseTau = coarseTaus[np.argmin(coarseErrors)]
+
+    print "The minimum of the coarse sync error is at %f" % coarseTau
+
+    # the fine level, two coarse samples on either side of the coarse minimum
+    maxLag = min(int(maxShift * sampleRate), m - 2)
+    center = int(round(coarseTau * sampleRate))
+    lags = np.arange(max(center - 2 * factor, 0),
+            min(center + 2 * factor, maxLag) + 1)
+    fineTaus = lags / float(sampleRate)
+    fineErrors = sync_error_many(fineTaus, niBumpSec, vnBumpSec, timeBumpSec)
+    best = lags[np.argmin(fineErrors)]
+
+    low = max(best - 1, 0) / float(sampleRate)
+    high = min(best + 1, maxLag) / float(sampleRate)
+    tau = fminbound(sync_error, low, high, args=(niBumpSec, vnBumpSec,
+        timeBumpSec), xtol=1e-8)
+
+    if plotError:
+        plt.figure()
+        plt.plot(coarseTaus, coarseErrors, '.-', fineTaus, fineErrors, '.-')
+        plt.xlabel('tau')
+        plt.ylabel('error')
+        plt.legend(('{:1.0f} hz'.format(coarseRate),
+            '{:1.0f} hz'.format(sampleRate)))
+        plt.show()
+
+    if fullOutput:
+        levels = [{'sampleRate': coarseRate, 'taus': coarseTaus,
+                   'errors': coarseErrors, 'tau': coarseTau},
+                  {'sampleRate': sampleRate, 'taus': fineTaus,
+                   'errors': fineErrors, 'tau': tau}]
+        return tau, levels
+    else:
+        return tau
+
+# the most recently used time vectors keyed by (numSamples, sampleRate,
+# offset)
+_timeBases = OrderedDict()
+_maxTimeBases = 64
+
+def time_base(numSamples, sampleRate, offset=0.):
+    '''Returns the time vector for a signal. The vectors are cached and read
+    only, so all of the signals with the same number of samples, sample rate
+    and offset share one array.
+
+    Parameters
+    ----------
+    numSamples : integer
+        The number of samples in the signal.
+    sampleRate : float
+        The sample rate of the signal in hertz.
+    offset : float, optional
+        The time of the first sample of the signal.
+
+    Returns
+    -------
+    time : ndarray, shape(numSamples,)
+        The read only time vector, the same as
+        time_vector(numSamples, sampleRate, start_time=offset).
+
+    '''
+    key = (int(numSamples), float(sampleRate), float(offset))
+    try:
+        # move the time vector to the end so it is the most recently used
+        time = _timeBases.pop(key)
+    except KeyError:
+        time = time_vector(numSamples, sampleRate, start_time=offset)
+        time.flags.writeable = False
+        if len(_timeBases) >= _maxTimeBases:
+            # drop the least recently used time vector
+            _timeBases.popitem(last=False)
+    _timeBases[key] = time
+    return time
+
+def time_window(t0, t1, sampleRate, numSamples, offset=0.):
+    '''Returns the indices of the samples of a signal that fall in a time
+    window.
+
+    Parameters
+    ----------
+    t0 : float or None
+        The start time of the window in seconds. If None the window starts at
+        the first sample.
+    t1 : float or None
+        The end time of the window in seconds, the sample at t1 is included.
+        If None the window ends at the last sample.
+    sampleRate : float
+        The sample rate of the signal in hertz.
+    numSamples : integer
+        The number of samples in the signal.
+    offset : float, optional
+        The time of the first sample of the signal.
+
+    Returns
+    -------
+    start : integer
+        The index of the first sample in the window.
+    stop : integer
+        One more than the index of the last sample in the window, such that
+        signal[start:stop] is the windowed signal.
+
+    '''
+    # a small tolerance keeps samples that are exactly on the window edges
+    eps = 1e-9
+
+    if t0 is None:
+        start = 0
+    else:
+        start = int(np.ceil((t0 - offset) * sampleRate - eps))
+
+    if t1 is None:
+        stop = numSamples
+    else:
+        stop = int(np.floor((t1 - offset) * sampleRate + eps)) + 1
+
+    start = min(max(start, 0), numSamples)
+    stop = min(max(stop, start), numSamples)
+
+    return start, stop
+
+def derivative_many(data, sampleRate):
+    '''
+    Returns the time derivatives of signals.
+
+    Parameters
+    ----------
+    data : ndarray, shape(n,) or shape(k, n)
+        The signals, one per row.
+    sampleRate : float
+        The sample rate of the signals in hertz.
+
+    Returns
+    -------
+    derivatives : ndarray, shape(n,) or shape(k, n)
+        The time derivatives.
+
+    Raises
+    ------
+    ValueError
+        If the signals have less than two samples.
+
+    Notes
+    -----
+    This is the same as dtk.process.derivative(time, y,
+    method='combination') for each signal: central differences for the
+    interior samples and second order one sided differences for the first
+    and last samples. The stencils are applied to all of the signals at once.
+    Signals with two samples don't fit the stencils, so both samples get the
+    first order difference.
+
+    '''
+    data = np.asarray(data)
+    data = data.astype(float_dtype(data), copy=False)
+    numSamples = data.shape[-1]
+    if numSamples < 2:
+        raise ValueError('The derivative needs at least two samples, ' +
+                'the signals have {0}.'.format(numSamples))
+
+    derivatives = np.empty_like(data)
+    if numSamples == 2:
+        derivatives[...] = (data[..., 1:] - data[..., :1]) * sampleRate
+        return derivatives
+
+    halfRate = sampleRate / 2.
+    np.subtract(data[..., 2:], data[..., :-2], out=derivatives[..., 1:-1])
+    derivatives[..., 0] = (-3. * data[..., 0] + 4. * data[..., 1] -
+            data[..., 2])
+    derivatives[..., -1] = (3. * data[..., -1] - 4. * data[..., -2] +
+            data[..., -3])
+    derivatives *= halfRate
+
+    return derivatives
+
+def integrate_many(data, sampleRate, initialCondition=0., detrend=False,
+        order=2, offset=0.):
+    '''
+    Returns the cumulative integrals of signals with the trapezoidal rule.
+
+    Parameters
+    ----------
+    data : ndarray, shape(n,) or shape(k, n)
+        The signals to integrate, one per row.
+    sampleRate : float
+        The sample rate of the signals in hertz.
+    initialCondition : float or ndarray, shape(k,), optional
+        The value of the integrals at the first sample.
+    detrend : boolean, optional
+        If true a polynomial in time is fit to each integral with linear
+        least squares and subtracted to remove the drift.
+    order : integer, optional
+        The order of the drift polynomial.
+    offset : float, optional
+        The time of the first sample, the polynomial is a function of the
+        time.
+
+    Returns
+    -------
+    integrated : ndarray, shape(n,) or shape(k, n)
+        The integrals.
+    coefficients : ndarray, shape(order + 1,) or shape(k, order + 1)
+        The coefficients of the drift polynomials, highest power first as in
+        numpy.polyfit. None if `detrend` is false.
+
+    '''
+    data = np.asarray(data, dtype=float)
+    dt = 1. / sampleRate
+
+    integrated = np.empty_like(data)
+    integrated[..., 0] = 0.
+    # the trapezoidal rule with even spacing is a cumulative sum
+    np.cumsum(data[..., 1:] + data[..., :-1], axis=-1,
+            out=integrated[..., 1:])
+    integrated *= dt / 2.
+    initialCondition = np.asarray(initialCondition, dtype=float)
+    if initialCondition.ndim > 0:
+        # one initial condition per signal
+        initialCondition = initialCondition[:, np.newaxis]
+    integrated += initialCondition
+
+    coefficients = None
+    if detrend is True:
+        time = time_base(data.shape[-1], sampleRate, offset=offset)
+        vandermonde = np.vander(time, order + 1)
+        # all of the signals are fit in one solve
+        coefficients = np.linalg.lstsq(vandermonde, integrated.T,
+                rcond=-1)[0].T
+        integrated -= np.dot(coefficients, vandermonde.T)
+
+    return integrated, coefficients
+
 def truncate_data(signal, tau):
     '''
     Returns the truncated vectors with respect to the timeshift tau.
@@ -519,7 +1505,7 @@ def truncate_data(signal, tau):
         The truncated time signal.
 
     '''
-    t = time_vector(len(signal), signal.sampleRate)
+    t = time_base(len(signal), signal.sampleRate)
 
     # shift the ni data cause it is the cleaner signal
     tni = t - tau
@@ -531,12 +1517,104 @@ def truncate_data(signal, tau):
     if signal.source == 'NI':
         truncated = np.interp(tcom, tni, signal)
     elif signal.source == 'VN':
-        truncated = signal[np.nonzero(tvn <= tcom[-1])]
+        # the common interval is the start of the VN time, so this is a view
+        truncated = signal[:len(tcom)]
     else:
         raise ValueError('No source was defined in this signal.')
 
     return truncated
 
+def truncation_weights(numSamples, sampleRate, tau):
+    '''
+    Returns the indices and weights that linearly interpolate the NI data at
+    the times of the truncated signals, see `truncate_data`.
+
+    Parameters
+    ----------
+    numSamples : integer
+        The number of samples in the signals.
+    sampleRate : float
+        The sample rate of the signals in hertz.
+    tau : float
+        The time shift.
+
+    Returns
+    -------
+    indices : ndarray, shape(m,)
+        The index of the sample before each truncated sample.
+    weights : ndarray, shape(m,)
+        The weight of the sample after each truncated sample, such that the
+        truncated signal is y[indices] + weights * (y[indices + 1] -
+        y[indices]).
+
+    '''
+    t = time_base(numSamples, sampleRate)
+    tni = t - tau
+    tcom = t[:np.searchsorted(t, tni[-1])]
+
+    indices = np.searchsorted(tni, tcom, side='right') - 1
+    np.clip(indices, 0, numSamples - 2, out=indices)
+    weights = (tcom - tni[indices]) / (tni[indices + 1] - tni[indices])
+    # np.interp holds the first and last values outside of the data
+    np.clip(weights, 0., 1., out=weights)
+
+    return indices, weights
+
+def truncate_many(data, sources, sampleRate, tau):
+    '''
+    Returns the truncated signals with respect to the time shift tau.
+
+    Parameters
+    ----------
+    data : ndarray, shape(k, n)
+        The signals from the NIData or the VNavData, one per row.
+    sources : sequence of str, len(k)
+        The source of each signal, 'NI' or 'VN'.
+    sampleRate : float
+        The sample rate of the signals in hertz.
+    tau : float
+        The time shift.
+
+    Returns
+    -------
+    truncated : ndarray, shape(k, m)
+        The truncated signals.
+
+    Notes
+    -----
+    This is the same as calling `truncate_data` for each signal, but the
+    interpolation weights are computed once for all of the NI signals.
+
+    The VN rows are copied into the result, unlike `truncate_data` which
+    returns a view of a VN signal. The result is a single array so that the
+    truncated signals can be stored as the rows of a SignalBundle, and the
+    copy costs one pass over the VN rows, less than the interpolation of the
+    NI rows.
+
+    '''
+    sources = np.asarray(sources)
+    if not np.all((sources == 'NI') | (sources == 'VN')):
+        raise ValueError('No source was defined in this signal.')
+
+    indices, weights = truncation_weights(data.shape[1], sampleRate, tau)
+
+    truncated = np.empty((data.shape[0], len(indices)),
+            dtype=float_dtype(data))
+    weights = weights.astype(truncated.dtype)
+
+    vn = np.nonzero(sources == 'VN')[0]
+    truncated[vn] = data[vn, :len(indices)]
+
+    ni = np.nonzero(sources == 'NI')[0]
+    niData = data[ni]
+    before = niData[:, indices]
+    after = niData[:, indices + 1]
+    after -= before
+    after *= weights
+    truncated[ni] = before + after
+
+    return truncated
+
 def yaw_roll_pitch_rate(angularRateX, angularRateY, angularRateZ,
                         lam, rollAngle=0.):
     '''Returns the bicycle frame yaw, roll and pitch rates based on the body
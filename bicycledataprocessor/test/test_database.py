@@ -1,5 +1,12 @@
 import os
-from bicycledataprocessor import database
+import shutil
+import tempfile
+
+import numpy as np
+import tables
+from bicycledataprocessor import database, main
+from bicycledataprocessor.main import Signal, RawSignal, Run, Sensor
+from bicycledataprocessor.bdpexceptions import TaskWriterError
 from numpy.random import randint
 from numpy import ones
 import numpy.testing as npt
@@ -74,3 +81,449 @@ def test_get_run_data():
             assert v == matDat[k]
 
         #print('{} in {} matches'.format(k, runID))
+
+def test_run_array_cache():
+
+    class Node(object):
+        def __init__(self, data):
+            self.data = data
+            self.shape = data.shape
+        def read(self, start=None, stop=None):
+            return self.data[start:stop].copy()
+
+    class Database(object):
+        def __init__(self):
+            self.nodes = {'/rawData/00105/FiveVolts': Node(ones(10)),
+                          '/rawData/00105/SteerAngle': Node(ones(10))}
+        def getNode(self, where, name=None):
+            return self.nodes[where + '/' + name]
+
+    cache = database.RunArrayCache(Database())
+    first = cache.read('/rawData/00105', 'FiveVolts', 0, 10)
+    assert cache.read('/rawData/00105', 'FiveVolts', 0, 10) is first
+    # the shared arrays can't be modified in place
+    npt.assert_raises(ValueError, first.__setitem__, 0, 2.)
+    npt.assert_raises(ValueError, first.view().__iadd__, 1.)
+    cache.read('/rawData/00105', 'SteerAngle', 0, 10)
+    cache.read('/rawData/00105', 'FiveVolts', 2, 5)
+    assert cache.readCounts == {'/rawData/00105/FiveVolts': 2,
+                                '/rawData/00105/SteerAngle': 1}
+
+def test_task_dependencies():
+    calibration = {'calibrationID': 'A00001', 'slope': 2., 'bias': 0.5,
+            'offset': 0.1, 'calibrationSupplyVoltage': 5.,
+            'runSupplyVoltage': 5., 'runSupplyVoltageSource': 'na',
+            'timeStamp': '21-Mar-2011 14:45:54'}
+    # enough sensors that the ids would not fit in a fixed length column
+    calibrations = dict(('Sensor{:02d}WithALongName'.format(i),
+        dict(calibration)) for i in range(30))
+    corruption = {'runid': [105], 'corrupt': [False], 'warning': [True],
+            'knee': [False], 'handlebar': [False], 'trailer': [False]}
+
+    dependencies = database.task_dependencies(105, calibrations, corruption)
+    assert len(dependencies['CalibrationIDs']) == 32
+    assert dependencies['CalibratedSensors'].split(';') == \
+        sorted(calibrations.keys())
+    assert dependencies['CodeVersion'] == database.processing_version()
+
+    calibrations['Sensor29WithALongName']['calibrationID'] = 'A00002'
+    changed = database.task_dependencies(105, calibrations, corruption)
+    assert changed['CalibrationIDs'] != dependencies['CalibrationIDs']
+    assert changed['CorruptionHash'] == dependencies['CorruptionHash']
+
+def make_signal(name, units, data, runid='00105'):
+    return Signal(data, {'name': name,
+                         'runid': runid,
+                         'sampleRate': 200.,
+                         'source': 'NA',
+                         'units': units})
+
+def make_task(runid=105, numSamples=40, taskStart=10, taskEnd=30):
+    """Returns the task signals, metadata and computed signals of a run as
+    Run stores them."""
+    runid = database.run_id_string(runid)
+    time = np.arange(numSamples) / 200.
+    computed = {'ForwardSpeed': make_signal('ForwardSpeed', 'meter/second',
+                    5. + np.sin(time), runid=runid),
+                'SteerAngle': make_signal('SteerAngle', 'radian',
+                    np.cos(time), runid=runid)}
+    task = dict((k, v[taskStart:taskEnd]) for k, v in computed.items())
+    task['YawAngle'] = make_signal('YawAngle', 'radian',
+            np.linspace(0., 1., taskEnd - taskStart), runid=runid)
+    meta = {'RunID': int(runid),
+            'Duration': time[taskEnd - taskStart - 1],
+            'FilterFrequency': np.nan,
+            'MeanSpeed': 5.,
+            'StdSpeed': 0.1,
+            'Tau': 0.05,
+            'TaskStart': taskStart,
+            'TaskEnd': taskEnd,
+            'CalibrationIDs': 'a' * 32,
+            'CalibrationHash': 'b' * 32,
+            'CorruptionHash': 'c' * 32,
+            'CodeVersion': database.processing_version(),
+            'CalibratedSensors': 'SteerAngleSensor'}
+    return task, meta, computed
+
+def make_task_database(directory):
+    """Returns a DataSet with an empty task table in the directory."""
+    dataset = database.DataSet(pathToDatabase=os.path.join(directory,
+        'test.h5'))
+    dataset.open(mode='w')
+    dataset.close()
+    dataset.create_task_table()
+    return dataset
+
+class TaskRun(Run):
+    # a run that only loads the task signals of an open database
+    def __init__(self, dataset, runid, window=None):
+        dataset.open()
+        try:
+            taskTable = dataset.database.root.taskTable
+            runGroup = dataset.database.root.taskData._f_getChild(runid)
+            self.load_task_signals(dataset.database, runGroup,
+                    database.get_row_num(runid, taskTable), window=window)
+        finally:
+            dataset.close()
+
+def test_add_task_signals():
+    directory = tempfile.mkdtemp()
+    try:
+        dataset = make_task_database(directory)
+        task, meta, computed = make_task()
+        dataset.add_task_signals(task, meta, computed)
+
+        dataset.open()
+        root = dataset.database.root
+        row = root.taskTable[0]
+        assert row['RunID'] == 105
+        assert (row['TaskStart'], row['TaskEnd']) == (10, 30)
+        # the task slices of the computed signals are stored as a range
+        assert sorted(x.name for x in
+                root.computedData._f_getChild('00105')._f_walkNodes(
+                    'Array')) == ['ForwardSpeed', 'SteerAngle']
+        taskGroup = root.taskData._f_getChild('00105')
+        assert [x.name for x in taskGroup._f_walkNodes('Array')] == \
+            ['YawAngle']
+        assert taskGroup._f_getAttr('CalibratedSensors') == \
+            'SteerAngleSensor'
+        npt.assert_allclose(root.computedData._f_getChild('00105')
+                ._f_getChild('SteerAngle').read(), computed['SteerAngle'])
+        dataset.close()
+    finally:
+        shutil.rmtree(directory)
+
+def test_load_task_signals():
+    directory = tempfile.mkdtemp()
+    try:
+        dataset = make_task_database(directory)
+        task, meta, computed = make_task()
+        dataset.add_task_signals(task, meta, computed)
+
+        run = TaskRun(dataset, '00105')
+        assert run.topSig == 'task'
+        assert (run.taskStart, run.taskEnd) == (10, 30)
+        assert sorted(run.computedSignals.keys()) == ['ForwardSpeed',
+                'SteerAngle']
+        assert sorted(run.taskSignals.keys()) == ['ForwardSpeed',
+                'SteerAngle', 'YawAngle']
+        for k, v in computed.items():
+            npt.assert_allclose(run.computedSignals[k], v)
+        for k, v in task.items():
+            npt.assert_allclose(run.taskSignals[k], v)
+            assert run.taskSignals[k].units == v.units
+        assert run.taskSignals.offset == 0.
+
+        # the task slices are views of the computed signals
+        assert np.may_share_memory(run.taskSignals.data,
+                run.computedSignals.data)
+        run.taskSignals['SteerAngle'][0] = 10.
+        assert run.computedSignals['SteerAngle'][10] == 10.
+        # adding a computed signal doesn't overwrite the task only signals
+        run.computedSignals['Other'] = make_signal('Other', 'meter',
+                np.ones(40))
+        npt.assert_allclose(run.taskSignals['YawAngle'], task['YawAngle'])
+
+        # only the window of the task is read
+        run = TaskRun(dataset, '00105', window=(0.02, 0.05))
+        assert run.taskSignals.numSamples == 7
+        assert run.computedSignals.numSamples == 7
+        npt.assert_allclose(run.taskSignals.offset, 0.02)
+        npt.assert_allclose(run.computedSignals.offset, (10 + 4) / 200.)
+        for k, v in task.items():
+            npt.assert_allclose(run.taskSignals[k], v[4:11])
+        npt.assert_allclose(run.computedSignals['ForwardSpeed'],
+                computed['ForwardSpeed'][14:21])
+        npt.assert_allclose(run.taskSignals.time(),
+                np.arange(4, 11) / 200.)
+    finally:
+        shutil.rmtree(directory)
+
+def assert_task_stored(dataset, runid, task, computed):
+    run = TaskRun(dataset, database.run_id_string(runid))
+    assert sorted(run.taskSignals.keys()) == sorted(task.keys())
+    for k, v in task.items():
+        npt.assert_allclose(run.taskSignals[k], v)
+    for k, v in computed.items():
+        npt.assert_allclose(run.computedSignals[k], v)
+
+def test_add_task_signals_many():
+    directory = tempfile.mkdtemp()
+    try:
+        dataset = make_task_database(directory)
+        runs = dict((runid, make_task(runid=runid, numSamples=30 + runid %
+            100)) for runid in [105, 106, 107])
+        dataset.add_task_signals_many([runs[105], runs[106]])
+        # the signals can also be given as they are queued by the writer
+        task, meta, computed = runs[107]
+        dataset.add_task_signals_many([(database.split_task_signals(task),
+            meta, database.split_task_signals(computed))])
+
+        dataset.open()
+        assert sorted(dataset.database.root.taskTable.col('RunID')) == \
+            [105, 106, 107]
+        dataset.close()
+        for runid, (task, meta, computed) in runs.items():
+            assert_task_stored(dataset, runid, task, computed)
+
+        # storing a run again replaces it
+        task, meta, computed = make_task(runid=106, taskStart=5, taskEnd=20)
+        dataset.add_task_signals_many([(task, meta, computed)])
+        dataset.open()
+        taskTable = dataset.database.root.taskTable
+        assert sorted(taskTable.col('RunID')) == [105, 106, 107]
+        row = taskTable[database.get_row_num(106, taskTable)]
+        assert (row['TaskStart'], row['TaskEnd']) == (5, 20)
+        dataset.close()
+        assert_task_stored(dataset, 106, task, computed)
+    finally:
+        shutil.rmtree(directory)
+
+def test_task_signal_writer():
+    directory = tempfile.mkdtemp()
+    try:
+        dataset = make_task_database(directory)
+        runs = dict((runid, make_task(runid=runid)) for runid in
+            [105, 106, 107])
+        writer = database.TaskSignalWriter(dataset, batchSize=2)
+        with writer:
+            for runid in sorted(runs.keys()):
+                writer.submit(*runs[runid])
+        assert writer.written == 3
+        assert writer.process.exitcode == 0
+        for runid, (task, meta, computed) in runs.items():
+            assert_task_stored(dataset, runid, task, computed)
+
+        # a failed write is raised in the parent when the writer is closed
+        broken = database.DataSet(pathToDatabase=os.path.join(directory,
+            'broken.h5'))
+        broken.open(mode='w')
+        broken.close()
+        writer = database.TaskSignalWriter(broken)
+        writer.start()
+        writer.submit(*runs[105])
+        try:
+            writer.close()
+        except TaskWriterError as e:
+            assert 'NoSuchNodeError' in str(e)
+        else:
+            raise AssertionError('The writer failure was not raised.')
+        assert writer.written == 0
+    finally:
+        shutil.rmtree(directory)
+
+class RunInfo(tables.IsDescription):
+    # the run table columns the dependency tracking reads
+    RunID = tables.Int32Col(dflt=0)
+    DateTime = tables.StringCol(20)
+    NISampleRate = tables.Int32Col(dflt=200)
+    VNavSampleRate = tables.Int32Col(dflt=100)
+
+def write_corruption(path, corrupt=()):
+    with open(path, 'w') as f:
+        f.write('RunID,Corrupt,Warning,Knee,Handlebar,Trailer,Reason\n')
+        for runid in corrupt:
+            f.write('{},TRUE,FALSE,1;2,,,Bad data\n'.format(runid))
+
+def make_stale_database(directory):
+    """Returns a DataSet with task signals stored for runs 105, 106 and 107,
+    where 107 was stored with an older version of the code."""
+    dataset = make_task_database(directory)
+    dataset.pathToCorruption = os.path.join(directory, 'corruption.csv')
+    write_corruption(dataset.pathToCorruption)
+
+    dataset.open(mode='a')
+    runTable = dataset.database.createTable('/', 'runTable', RunInfo)
+    for runid, date in [(105, '22-Mar-2011 10:00:00'),
+                        (106, '02-Apr-2011 10:00:00'),
+                        (107, '03-Apr-2011 10:00:00')]:
+        runTable.row['RunID'] = runid
+        runTable.row['DateTime'] = date
+        runTable.row.append()
+    runTable.flush()
+    calibrationTable = dataset.database.createTable('/', 'calibrationTable',
+            dataset._calibration_table_class())
+    for calibrationID, date in [('A0001', '21-Mar-2011 09:00:00'),
+                                ('A0002', '01-Apr-2011 09:00:00')]:
+        calibrationTable.row['name'] = 'SteerAngleSensor'
+        calibrationTable.row['calibrationID'] = calibrationID
+        calibrationTable.row['timeStamp'] = date
+        calibrationTable.row['slope'] = 2.
+        calibrationTable.row.append()
+    calibrationTable.flush()
+
+    # the dependencies the runs are processed with
+    sensor = Sensor('SteerAngleSensor', calibrationTable)
+    corruption = dataset.load_corruption_data()
+    tasks = []
+    for runid in [105, 106, 107]:
+        task, meta, computed = make_task(runid=runid)
+        date = main.matlab_date_to_object(database.get_cell(runTable,
+            'DateTime', database.get_row_num(runid, runTable)))
+        meta.update(database.task_dependencies(runid, {'SteerAngleSensor':
+            sensor.get_data_for_date(date)}, corruption))
+        if runid == 106:
+            meta['FilterFrequency'] = 15.
+        elif runid == 107:
+            meta['CodeVersion'] = 'old'
+        tasks.append((task, meta, computed))
+    dataset.close()
+
+    dataset.add_task_signals_many(tasks)
+
+    return dataset
+
+def test_stale_runs():
+    directory = tempfile.mkdtemp()
+    try:
+        dataset = make_stale_database(directory)
+        assert dataset.stale_runs() == ['00107']
+
+        # new corruption records
+        write_corruption(dataset.pathToCorruption, corrupt=[105])
+        assert dataset.stale_runs() == ['00105', '00107']
+        write_corruption(dataset.pathToCorruption)
+
+        # a changed calibration only affects the runs that use it
+        dataset.open(mode='a')
+        calibrationTable = dataset.database.root.calibrationTable
+        for row in calibrationTable.where('calibrationID == "A0002"'):
+            row['slope'] = 3.
+            row.update()
+        calibrationTable.flush()
+        dataset.close()
+        assert dataset.stale_runs() == ['00106', '00107']
+    finally:
+        shutil.rmtree(directory)
+
+def test_reprocess_stale():
+
+    calls = []
+
+    class StaleRun(object):
+        # records the reprocessing instead of loading the raw data
+        def __init__(self, runID, dataset, pathToParameterData=None,
+                forceRecalc=False, filterFreq=None, store=True):
+            calls.append((runID, forceRecalc, filterFreq, store))
+            if runID == '00107':
+                raise ValueError('No raw data.')
+
+    directory = tempfile.mkdtemp()
+    originalRun = main.Run
+    main.Run = StaleRun
+    try:
+        dataset = make_stale_database(directory)
+        write_corruption(dataset.pathToCorruption, corrupt=[106])
+        assert dataset.reprocess_stale(store='writer') == ['00106']
+        assert calls == [('00106', True, 15., 'writer'),
+                         ('00107', True, None, 'writer')]
+    finally:
+        main.Run = originalRun
+        shutil.rmtree(directory)
+
+def make_raw_database(directory):
+    """Returns a DataSet with the raw, computed and task signals of run 105."""
+    dataset = make_task_database(directory)
+    dataset.add_task_signals(*make_task())
+
+    dataset.open(mode='a')
+    runTable = dataset.database.createTable('/', 'runTable', RunInfo)
+    runTable.row['RunID'] = 105
+    runTable.row['DateTime'] = '22-Mar-2011 10:00:00'
+    runTable.row.append()
+    runTable.flush()
+    signalTable = dataset.database.createTable('/', 'signalTable',
+            dataset._signal_table_class())
+    for signal, source in [('SteerPotentiometer', 'NI'),
+                           ('AccelerationX', 'VN')]:
+        signalTable.row['signal'] = signal
+        signalTable.row['source'] = source
+        signalTable.row['calibration'] = 'none'
+        signalTable.row['units'] = 'volt'
+        signalTable.row['isRaw'] = True
+        signalTable.row.append()
+    signalTable.flush()
+    dataset.database.createTable('/', 'calibrationTable',
+            dataset._calibration_table_class())
+    dataset.database.createGroup('/', 'rawData')
+    runGroup = dataset.database.createGroup('/rawData', '00105')
+    dataset.database.createArray(runGroup, 'SteerPotentiometer',
+            np.arange(20.))
+    dataset.database.createArray(runGroup, 'AccelerationX', np.arange(10.))
+    dataset.close()
+
+    return dataset
+
+def test_read_signal():
+    directory = tempfile.mkdtemp()
+    try:
+        dataset = make_raw_database(directory)
+        task, meta, computed = make_task()
+
+        raw = dataset.read_signal(105, 'SteerPotentiometer')
+        assert isinstance(raw, RawSignal)
+        assert raw.offset == 0.
+        npt.assert_allclose(raw, np.arange(20.))
+
+        # the windows include the samples on their edges
+        for stage, expected in [('raw', np.arange(20.)),
+                                ('computed', computed['SteerAngle']),
+                                ('task', task['SteerAngle']),
+                                ('task', task['YawAngle'])]:
+            name = 'SteerPotentiometer' if stage == 'raw' else expected.name
+            for t0, t1, inSamples in [(0.02, 0.05, False), (4, 11, True),
+                                      (0.0175, 0.0525, False)]:
+                signal = dataset.read_signal(105, name, t0, t1, stage=stage,
+                        inSamples=inSamples)
+                assert signal.name == name
+                npt.assert_allclose(signal, expected[4:11])
+                npt.assert_allclose(signal.offset, 0.02)
+            npt.assert_allclose(dataset.read_signal(105, name, t0=0.05,
+                stage=stage), expected[10:])
+            npt.assert_allclose(dataset.read_signal(105, name, t1=5,
+                stage=stage, inSamples=True), expected[:5])
+
+            # the bounds are clipped to the stored samples
+            for t0, t1, inSamples in [(None, None, False), (-1., 10., False),
+                                      (-3, 100, True)]:
+                signal = dataset.read_signal(105, name, t0, t1, stage=stage,
+                        inSamples=inSamples)
+                npt.assert_allclose(signal, expected)
+                assert signal.offset == 0.
+            for t0, t1, inSamples in [(0.05, 0.02, False), (11, 4, True),
+                                      (5, 5, True), (10., 11., False)]:
+                assert len(dataset.read_signal(105, name, t0, t1,
+                    stage=stage, inSamples=inSamples)) == 0
+
+        # the raw samples are windowed with their own sample rate
+        raw = dataset.read_signal(105, 'AccelerationX', 0.02, 0.05)
+        npt.assert_allclose(raw, [2., 3., 4., 5.])
+        npt.assert_allclose(raw.offset, 0.02)
+        raw = dataset.read_signal(105, 'AccelerationX', 2, 6, inSamples=True)
+        npt.assert_allclose(raw, [2., 3., 4., 5.])
+        npt.assert_allclose(raw.offset, 0.02)
+
+        npt.assert_raises(ValueError, dataset.read_signal, 105, 'SteerAngle',
+                stage='filtered')
+    finally:
+        shutil.rmtree(directory)
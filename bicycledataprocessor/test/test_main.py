@@ -0,0 +1,543 @@
+import os
+import time
+import shutil
+import tempfile
+
+import numpy as np
+import numpy.testing as npt
+from scipy import io
+from dtk.bicycle import benchmark_parameters, benchmark_to_moore
+
+from bicycledataprocessor import main
+from bicycledataprocessor.main import (Signal, RawSignal, SignalBundle,
+                                       SignalNode, LazySignals,
+                                       calibrate_many, calibrate_runs,
+                                       bicycle_rider_parameters,
+                                       parameter_files_hash)
+
+def make_signal(name, units, sampleRate=200., source='NI', data=None):
+    if data is None:
+        data = np.arange(1., 6.)
+    metadata = {'name': name,
+                'runid': '00104',
+                'sampleRate': sampleRate,
+                'source': source,
+                'units': units}
+    return Signal(data, metadata)
+
+def test_signal_ufunc_metadata():
+    force = make_signal('PullForce', 'newton')
+    arm = make_signal('Arm', 'meter', source='VN')
+
+    scaled = 2. * force
+    assert isinstance(scaled, Signal)
+    assert scaled.name == 'PullForce'
+    assert scaled.units == 'newton'
+    assert scaled.source == 'NI'
+    assert scaled.sampleRate == 200.
+    npt.assert_allclose(scaled, 2. * np.arange(1., 6.))
+
+    torque = force * arm
+    assert torque.units == 'newton*meter'
+    assert torque.name is None
+    assert torque.source == 'NA'
+    assert (force / arm).units == 'newton/meter'
+    assert (1. / arm).units == '1/meter'
+    assert (arm**2).units == 'meter**2'
+    assert (-arm).units == 'meter'
+    assert (force + force).units == 'newton'
+    assert (force + arm).units is None
+    assert np.sin(arm).units is None
+
+    # reductions and comparisons give plain arrays
+    assert not isinstance(force.mean(), Signal)
+    assert not isinstance(force.max(), Signal)
+    assert not isinstance(force > 2., Signal)
+
+    # different sample rates can't be combined
+    slow = make_signal('Slow', 'newton', sampleRate=100.)
+    npt.assert_raises(ValueError, np.add, force, slow)
+
+def test_signal_ufunc_out():
+    force = make_signal('PullForce', 'newton')
+    data = force.view(np.ndarray)
+    result = np.multiply(force, 2., out=force)
+    assert result is force
+    assert result.units == 'newton'
+    npt.assert_allclose(data, 2. * np.arange(1., 6.))
+
+def test_signal_spline_after_assignment():
+    sig = make_signal('Angle', 'degree', data=np.arange(20.))
+    assert sig.spline() is sig
+    sig[5] = np.nan
+    splined = sig.spline()
+    assert splined is not sig
+    npt.assert_allclose(splined, np.arange(20.))
+    # changes made through a view are seen too
+    sig[:10][7] = np.nan
+    assert np.isnan(sig[7])
+    npt.assert_allclose(sig.spline(), np.arange(20.))
+    sig[5] = 5.
+    sig[7] = 7.
+    assert sig.spline() is sig
+
+def test_signal_bundle():
+    bundle = SignalBundle()
+    for i in range(10):
+        bundle['Signal{0}'.format(i)] = make_signal('Signal{0}'.format(i),
+                'degree', data=np.arange(5.) + i)
+    assert len(bundle) == 10
+    assert bundle.keys()[:2] == ['Signal0', 'Signal1']
+    assert bundle.data.shape == (10, 5)
+    # there is room for more signals
+    assert bundle.nbytes == 16 * 5 * 8
+    assert 'Signal3' in bundle
+    assert bundle.get('Missing') is None
+
+    sig = bundle['Signal3']
+    assert isinstance(sig, Signal)
+    assert sig.name == 'Signal3'
+    assert sig.units == 'degree'
+    assert sig.sampleRate == 200.
+    npt.assert_allclose(sig, np.arange(5.) + 3)
+    # the signals are views of the rows
+    sig[0] = 10.
+    assert bundle.data[3, 0] == 10.
+
+    # replacing a signal copies it into its row
+    bundle['Signal3'] = make_signal('Signal3', 'meter')
+    assert len(bundle) == 10
+    assert bundle['Signal3'].units == 'meter'
+    npt.assert_allclose(bundle.data[3], np.arange(1., 6.))
+
+    npt.assert_raises(ValueError, bundle.__setitem__, 'Short',
+            make_signal('Short', 'meter', data=np.ones(3)))
+    npt.assert_raises(ValueError, bundle.__setitem__, 'Slow',
+            make_signal('Slow', 'meter', sampleRate=100.))
+
+    converted = bundle.convert_units({'Signal0': 'radian'})
+    npt.assert_allclose(converted['Signal0'], np.deg2rad(np.arange(5.)))
+    assert converted['Signal0'].units == 'radian'
+    npt.assert_allclose(converted['Signal1'], bundle['Signal1'])
+    assert bundle['Signal0'].units == 'degree'
+
+    sliced = bundle.slice(1, 4)
+    assert sliced.numSamples == 3
+    npt.assert_allclose(sliced['Signal1'], [2., 3., 4.])
+    windowed = bundle.window(0.01, None)
+    assert windowed.numSamples == 3
+    assert windowed.offset == 0.01
+    npt.assert_allclose(windowed.time(), [0.01, 0.015, 0.02])
+
+def test_signal_bundle_filter():
+    time = np.arange(1000) / 200.
+    signals = {}
+    for i in range(3):
+        data = np.sin((i + 1) * time) + 0.1 * np.cos(80. * time)
+        signals['Signal{0}'.format(i)] = make_signal('Signal{0}'.format(i),
+                'meter', data=data)
+    signals['Signal1'][100:105] = np.nan
+    filtered = SignalBundle(signals).filter(15.)
+    for k, v in signals.items():
+        npt.assert_allclose(filtered[k], v.filter(15.), atol=1e-10)
+
+    # the gaps are found again after the signals change in place
+    signals['Signal0'][200:203] = np.nan
+    signals['Signal1'][100:105] = signals['Signal2'][100:105]
+    filtered = main.filter_signals(signals, 15.)
+    assert not np.isnan(filtered['Signal0']).any()
+    for k, v in signals.items():
+        npt.assert_allclose(filtered[k], v.filter(15.), atol=1e-10)
+
+def test_signal_bundle_truncated():
+    time = np.arange(400) / 200.
+    signals = {'Ni': make_signal('Ni', 'meter', data=np.sin(time)),
+               'Vn': make_signal('Vn', 'meter', source='VN',
+                   data=np.cos(time))}
+    signals['Vn'][50] = np.nan
+    truncated = SignalBundle.truncated(signals, 0.123)
+    for k, v in signals.items():
+        expected = v.truncate(0.123).spline()
+        assert truncated[k].source == v.source
+        npt.assert_allclose(truncated[k], expected)
+
+    signals['Ni'] = make_signal('Ni', 'meter', data=np.sin(time[:-1]))
+    npt.assert_raises(ValueError, SignalBundle.truncated, signals, 0.123)
+
+def test_signal_bundle_time_derivative():
+    time = np.arange(100) / 200.
+    bundle = SignalBundle({'Rate': make_signal('Rate', 'radian/second',
+        data=np.sin(time))})
+    derivatives = bundle.time_derivative()
+    assert derivatives.names == ['RateDot']
+    assert derivatives.units == ['radian/second/second']
+    npt.assert_allclose(derivatives['RateDot'],
+            bundle['Rate'].time_derivative())
+
+def test_lazy_signals():
+    calls = []
+
+    def double():
+        calls.append('double')
+        signals['Double'] = 2. * signals['Base']
+
+    def base():
+        calls.append('base')
+        signals['Base'] = make_signal('Base', 'meter')
+
+    def squares():
+        calls.append('squares')
+        signals['Square'] = signals['Base']**2
+        signals['Fourth'] = signals['Double']**2
+
+    nodes = [SignalNode('double', double, ['Double'], ['test.Base']),
+             SignalNode('base', base, ['Base'], ['raw.Base']),
+             SignalNode('squares', squares, ['Square', 'Fourth'],
+                 ['test.Base', 'test.Double'])]
+    signals = LazySignals('test', nodes)
+
+    assert sorted(signals.keys()) == ['Base', 'Double', 'Fourth', 'Square']
+    assert 'Square' in signals
+    assert calls == []
+
+    # the inputs are evaluated first
+    npt.assert_allclose(signals['Double'], 2. * np.arange(1., 6.))
+    assert calls == ['base', 'double']
+    assert signals['Double'].units == 'meter'
+    assert signals.computed == ['base', 'double']
+    signals['Base']
+    assert calls == ['base', 'double']
+
+    assert signals.dependencies('Fourth') == set(['test.Base',
+        'test.Double', 'raw.Base'])
+
+    # the bundle attributes evaluate everything
+    assert signals.sampleRate == 200.
+    assert calls == ['base', 'double', 'squares']
+    assert len(signals.timings) == 3
+    assert 'squares' in signals.report()
+
+    npt.assert_raises(KeyError, signals.__getitem__, 'Missing')
+
+def test_lazy_signals_missing_input():
+    truncated = SignalBundle({'Rate': make_signal('Rate', 'radian/second')})
+
+    def speed():
+        signals['Speed'] = 2. * truncated['Rate']
+
+    def force():
+        signals['Force'] = 2. * truncated['PullForce']
+
+    def double():
+        signals['Double'] = 2. * signals['Force']
+
+    nodes = [SignalNode('speed', speed, ['Speed'], ['truncated.Rate']),
+             SignalNode('force', force, ['Force'], ['truncated.PullForce']),
+             SignalNode('double', double, ['Double'], ['test.Force'])]
+    signals = LazySignals('test', nodes, upstream={'truncated': truncated})
+    # the signals that can't be computed aren't listed before evaluation
+    assert signals.keys() == ['Speed']
+    assert 'Force' not in signals
+    assert 'Double' not in signals
+    assert signals.computed == []
+    assert dict(signals.items()).keys() == ['Speed']
+
+    # the missing input skips its node and the nodes that depend on it
+    signals.evaluate_all()
+    assert signals.keys() == ['Speed']
+    assert 'Force' not in signals
+    assert signals.skipped.keys() == ['force', 'double']
+    assert signals.skipped['double'] == ['test.Force']
+    assert signals.computed == ['speed']
+    assert 'skipped' in signals.report()
+    assert signals.bundle().keys() == ['Speed']
+    npt.assert_raises(KeyError, signals.__getitem__, 'Double')
+
+def test_lazy_signals_timings():
+    def base():
+        time.sleep(0.05)
+        signals['Base'] = make_signal('Base', 'meter')
+
+    def double():
+        # an input that isn't declared is evaluated while double runs
+        signals['Double'] = 2. * signals['Base']
+
+    def quadruple():
+        signals['Quadruple'] = 2. * signals['Double']
+
+    signals = LazySignals('test', [
+        SignalNode('base', base, ['Base'], []),
+        SignalNode('double', double, ['Double'], []),
+        SignalNode('quadruple', quadruple, ['Quadruple'], ['test.Double'])])
+    signals['Quadruple']
+    assert signals.computed == ['base', 'double', 'quadruple']
+    # each time excludes the nodes evaluated during it
+    assert signals.timings['base'] >= 0.05
+    assert signals.timings['double'] < 0.04
+    assert signals.timings['quadruple'] < 0.04
+
+def test_lazy_signals_filter():
+    time = np.arange(400) / 200.
+    noisy = make_signal('Noisy', 'meter', data=np.sin(time) + 0.1 *
+            np.sin(80. * time))
+
+    def double():
+        signals['Double'] = 2. * noisy
+
+    def base():
+        signals['Base'] = noisy
+
+    signals = LazySignals('test', [
+        SignalNode('double', double, ['Double'], []),
+        SignalNode('base', base, ['Base'], [])])
+    signals['Double']
+    assert signals.filter(10.) is signals
+    # the computed signals are filtered now and the others as they are
+    # computed
+    npt.assert_allclose(signals['Double'], 2. * noisy.filter(10.))
+    npt.assert_allclose(signals['Base'], noisy.filter(10.))
+
+def test_signal_bundle_single_precision():
+    bundle = SignalBundle({'Angle': make_signal('Angle', 'degree',
+        data=np.arange(5., dtype=np.float32))})
+    assert bundle.data.dtype == np.float32
+    # added signals are stored in the precision of the bundle
+    bundle['Other'] = make_signal('Other', 'degree')
+    assert bundle['Other'].dtype == np.float32
+    assert bundle.convert_units({'Angle': 'radian'}).data.dtype == np.float32
+    assert bundle.astype(np.float64).data.dtype == np.float64
+
+class FakeSensor(object):
+    def __init__(self, data):
+        self.data = data
+
+    def get_data_for_date(self, runDate):
+        return self.data
+
+def make_raw_signal(name, calibrationType, supply, runid='00104',
+        numSamples=5):
+    raw = make_signal(name, 'volt', data=np.linspace(0.5, 2.5,
+        numSamples)).view(RawSignal)
+    raw.runid = runid
+    raw.calibrationType = calibrationType
+    raw.supply = supply
+    raw.sensor = FakeSensor({'signal': name + 'Scaled',
+                             'units': 'meter',
+                             'slope': 2.,
+                             'bias': 0.5,
+                             'offset': 0.1,
+                             'calibrationSupplyVoltage': 5.})
+    return raw
+
+def test_calibrate_many():
+    supply = np.linspace(4.9, 5.1, 5)
+    raw = [make_raw_signal('Intercept', 'intercept', supply),
+           make_raw_signal('InterceptStar', 'interceptStar', 5.05),
+           make_raw_signal('Bias', 'bias', supply),
+           make_raw_signal('Other', 'intercept', 5.),
+           make_raw_signal('None', 'none', 5.)]
+    voltage = np.linspace(0.5, 2.5, 5)
+
+    calibrated, calibrationData = calibrate_many(raw)
+
+    npt.assert_allclose(calibrated[0], 5. / supply * (2. * voltage + 0.1))
+    npt.assert_allclose(calibrated[1], 5. / 5.05 * 2. * voltage + 0.1)
+    npt.assert_allclose(calibrated[2], 2. * (voltage - supply / 5. * 0.5))
+    npt.assert_allclose(calibrated[3], 2. * voltage + 0.1)
+    assert calibrated[4] is raw[4]
+    assert calibrationData[4] is None
+    assert calibrated[0].name == 'InterceptScaled'
+    assert calibrated[0].units == 'meter'
+    assert calibrated[0].sampleRate == 200.
+
+    # calibrating one signal at a time gives the same result
+    for sig, result in zip(raw, calibrated):
+        npt.assert_allclose(sig.scale(), result)
+
+    single, calibrationData = calibrate_many(raw, dtype='float32')
+    assert all(x.dtype == np.float32 for x in single)
+
+def test_calibrate_runs():
+    runs = {}
+    for runid, numSamples in [('00001', 5), ('00002', 5), ('00003', 7)]:
+        runs[runid] = dict((x.name, x) for x in [
+            make_raw_signal('Intercept', 'intercept', 5., runid=runid,
+                numSamples=numSamples),
+            make_raw_signal('None', 'none', 5., runid=runid,
+                numSamples=numSamples)])
+
+    calibrated = calibrate_runs(runs)
+
+    assert sorted(calibrated.keys()) == ['00001', '00002', '00003']
+    for runid, (signals, calibrationData) in calibrated.items():
+        assert sorted(signals.keys()) == ['InterceptScaled', 'None']
+        assert calibrationData.keys() == ['Intercept']
+        assert signals['InterceptScaled'].runid == runid
+        npt.assert_allclose(signals['InterceptScaled'],
+                runs[runid]['Intercept'].scale())
+
+class BareRun(main.Run):
+    # a run with the given stages and nothing loaded from a database
+    def __init__(self, keep=None, topSig='task', **stages):
+        self.keep = keep
+        self.topSig = topSig
+        for stage, signals in stages.items():
+            setattr(self, stage + 'Signals', signals)
+
+def test_run_nbytes():
+    supply = np.linspace(4.9, 5.1, 5)
+    raw = dict((x.name, x) for x in [
+        make_raw_signal('Intercept', 'intercept', supply),
+        make_raw_signal('Bias', 'bias', supply[:]),
+        make_raw_signal('None', 'none', 5.)])
+    calibrated = {'Angle': make_signal('Angle', 'degree')}
+    truncated = SignalBundle(calibrated)
+    run = BareRun(raw=raw, calibrated=calibrated, truncated=truncated)
+
+    nbytes = run.nbytes
+    assert sorted(nbytes.keys()) == ['calibrated', 'raw', 'truncated']
+    # the supply voltages are shared, so they are counted once
+    assert nbytes['raw'] == 4 * 5 * 8
+    assert nbytes['calibrated'] == 5 * 8
+    assert nbytes['truncated'] == truncated.nbytes
+
+    assert main.buffer_nbytes([supply, supply[1:], supply[::2]]) == 5 * 8
+    assert main.buffer_nbytes([supply, supply.copy()]) == 2 * 5 * 8
+
+def test_run_release_stage():
+    def make_run(keep, topSig='task'):
+        truncated = SignalBundle({'Rate': make_signal('Rate',
+            'radian/second')})
+        nodes = [SignalNode('double', double, ['Double'], ['truncated.Rate'])]
+        run = BareRun(keep=keep, topSig=topSig,
+                calibrated={'Rate': make_signal('Rate', 'degree/second')},
+                truncated=truncated,
+                computed=LazySignals('computed', nodes,
+                    upstream={'truncated': truncated}))
+        return run
+
+    def double():
+        run.computedSignals['Double'] = 2. * run.truncatedSignals['Rate']
+
+    # everything is kept by default
+    run = make_run(None)
+    run.release_stage('calibrated')
+    assert hasattr(run, 'calibratedSignals')
+
+    run = make_run(('computed',))
+    run.release_stage('calibrated')
+    assert not hasattr(run, 'calibratedSignals')
+    # a stage that has already been released is skipped
+    run.release_stage('calibrated')
+    # the lazy signals that depend on a released stage are computed first
+    run.release_stage('truncated')
+    assert not hasattr(run, 'truncatedSignals')
+    assert isinstance(run.computedSignals, SignalBundle)
+    npt.assert_allclose(run.computedSignals['Double'], 2. * np.arange(1., 6.))
+
+    run = make_run(('computed',), topSig='truncated')
+    run.release_stage('truncated')
+    assert isinstance(run.truncatedSignals, SignalBundle)
+    run.release_stage('computed')
+    assert isinstance(run.computedSignals, LazySignals)
+
+def test_run_missing_input():
+    truncated = SignalBundle(dict((name, make_signal(name, 'degree')) for
+        name in ['RollAngle', 'SteerAngle']))
+    run = BareRun(truncated=truncated)
+    run.metadata = {'RunID': 104}
+    run.compute_signals()
+
+    # the signals of the nodes with missing inputs aren't listed
+    assert sorted(run.computedSignals.keys()) == ['RollAngle', 'SteerAngle']
+    assert 'PullForce' not in run.computedSignals
+    assert run.computedSignals.computed == []
+
+    exported = {}
+    exported.update(run.computedSignals)
+    npt.assert_allclose(exported['RollAngle'], np.deg2rad(np.arange(1., 6.)))
+
+    # the export leaves out the signals that can't be computed
+    run.taskSignals = LazySignals('task', [
+        SignalNode('roll', lambda: run.taskSignals.__setitem__('Roll',
+            2. * run.computedSignals['RollAngle']), ['Roll'],
+            ['computed.RollAngle']),
+        SignalNode('force', lambda: run.taskSignals.__setitem__('Force',
+            2. * run.computedSignals['PullForce']), ['Force'],
+            ['computed.PullForce'])],
+        upstream={'computed': run.computedSignals})
+    directory = tempfile.mkdtemp()
+    try:
+        run.export('mat', directory=directory)
+        data = io.loadmat(os.path.join(directory, '00104.mat'))
+    finally:
+        shutil.rmtree(directory)
+    assert 'Roll' in data
+    assert 'Force' not in data
+    npt.assert_allclose(data['Roll'].flatten(),
+            2. * np.deg2rad(np.arange(1., 6.)))
+
+def write_parameter_file(path, parameters):
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        for k, v in sorted(parameters.items()):
+            f.write('{} = {}+/-0.0\n'.format(k, v))
+
+def make_parameter_data(directory):
+    bicycle = benchmark_parameters()
+    del bicycle['lambda']
+    # a separate handlebar, as for the instrumented bicycle
+    for k in ['m', 'x', 'z', 'Ixx', 'Iyy', 'Izz', 'Ixz']:
+        bicycle[k[0] + 'G' + k[1:]] = bicycle[k[0] + 'H' + k[1:]]
+    write_parameter_file(os.path.join(directory, 'bicycles', 'Rigid',
+        'Parameters', 'RigidBenchmark.txt'), bicycle)
+    write_parameter_file(os.path.join(directory, 'bicycles', 'Rigid',
+        'RawData', 'RigidMeasured.txt'), {'ds1': 0.5, 'ds3': 0.2})
+    rider = {'mB': 70., 'xB': 0.3, 'yB': 0., 'zB': -1.1, 'IBxx': 7.,
+             'IByy': 8., 'IBzz': 2., 'IBxz': 1.}
+    write_parameter_file(os.path.join(directory, 'riders', 'Jason',
+        'Parameters', 'JasonRigidBenchmark.txt'), rider)
+
+def test_bicycle_rider_parameters():
+    directory = tempfile.mkdtemp()
+    try:
+        data = os.path.join(directory, 'data')
+        cache = os.path.join(directory, 'cache')
+        make_parameter_data(data)
+        files = sorted(os.walk(data))
+
+        bundle = bicycle_rider_parameters('Jason', data, cache)
+        assert bundle['bicycle'] == 'Rigid'
+        assert bundle['rider'] == 'Jason'
+        npt.assert_allclose(bundle['benchmark']['mB'], 85. + 70.)
+        assert bundle['measured'] == {'ds1': 0.5, 'ds3': 0.2}
+        assert bundle['moore'] == benchmark_to_moore(bundle['benchmark'])
+        assert bundle['handlebarInertia'].shape == (3, 3)
+        assert bundle['handlebarDistance'] > 0.
+
+        # no parameter files are written
+        assert sorted(os.walk(data)) == files
+        assert len(os.listdir(cache)) == 1
+
+        # the bundle is shared in the process and read from the disk cache
+        assert bicycle_rider_parameters('Jason', data, cache) is bundle
+        main._parameterBundles.clear()
+        loaded = bicycle_rider_parameters('Jason', data, cache)
+        assert loaded is not bundle
+        assert loaded['moore'] == bundle['moore']
+
+        # new parameters give a new bundle
+        fileHash = parameter_files_hash(data, 'Rigid', 'Jason')
+        write_parameter_file(os.path.join(data, 'bicycles', 'Rigid',
+            'RawData', 'RigidMeasured.txt'), {'ds1': 0.65, 'ds3': 0.2})
+        assert parameter_files_hash(data, 'Rigid', 'Jason') != fileHash
+        assert bicycle_rider_parameters('Jason', data,
+                cache)['measured']['ds1'] == 0.65
+        assert len(os.listdir(cache)) == 2
+
+        npt.assert_raises(StandardError, bicycle_rider_parameters, 'Nobody',
+                data)
+    finally:
+        main._parameterBundles.clear()
+        shutil.rmtree(directory)
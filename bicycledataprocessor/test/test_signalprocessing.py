@@ -0,0 +1,276 @@
+import numpy as np
+import numpy.testing as npt
+import dtk.process as process
+from bicycledataprocessor import signalprocessing as sigpro
+from bicycledataprocessor.main import Signal
+
+def test_time_window():
+    # 10 samples at 10 hertz, 0.0 to 0.9 seconds
+    assert sigpro.time_window(None, None, 10., 10) == (0, 10)
+    assert sigpro.time_window(0.3, 0.7, 10., 10) == (3, 8)
+    assert sigpro.time_window(0.25, 0.75, 10., 10) == (3, 8)
+    assert sigpro.time_window(-1., 0.1, 10., 10) == (0, 2)
+    assert sigpro.time_window(0.5, 5., 10., 10) == (5, 10)
+    assert sigpro.time_window(2., 3., 10., 10) == (10, 10)
+    # the signal starts at 1 second
+    assert sigpro.time_window(1.3, 1.7, 10., 10, offset=1.) == (3, 8)
+
+def test_xcorr_timeshift():
+    sampleRate = 200.
+    time = np.arange(1000) / sampleRate
+
+    def accel(t):
+        bump = 5. * np.exp(-((t - 1.) / 0.05)**2) * np.sin(40. * (t - 1.))
+        return bump + 0.3 * np.sin(2. * np.pi * 1.3 * t)
+
+    for tau in [0.06, 0.3137, 0.9]:
+        vn = accel(time)
+        ni = accel(time - tau)
+        landscape = sigpro.landscape_timeshift(ni, vn, time, 0.3)
+        xcorr = sigpro.xcorr_timeshift(ni, vn, time, sampleRate)
+        npt.assert_allclose(xcorr, tau, atol=1e-4)
+        npt.assert_allclose(xcorr, landscape, atol=1e-4)
+
+def test_multires_timeshift():
+    sampleRate = 200.
+    time = np.arange(1000) / sampleRate
+
+    def accel(t):
+        bump = 5. * np.exp(-((t - 1.) / 0.05)**2) * np.sin(40. * (t - 1.))
+        return bump + 0.3 * np.sin(2. * np.pi * 1.3 * t)
+
+    for tau in [0.06, 0.3137, 1.7]:
+        vn = accel(time)
+        ni = accel(time - tau)
+        multires, levels = sigpro.multires_timeshift(ni, vn, time,
+                sampleRate, fullOutput=True)
+        npt.assert_allclose(multires, tau, atol=1e-4)
+        assert [level['sampleRate'] for level in levels] == [50., 200.]
+        assert abs(levels[0]['tau'] - tau) <= 1. / 50.
+
+def test_sync_error_many():
+    time = np.linspace(0., 5., num=1001)
+    signal1 = np.sin(3. * time) + 0.1 * np.cos(17. * time)
+    signal2 = np.sin(3. * (time - 0.2))
+    taus = np.hstack((np.linspace(-2., 2., num=57), 0., 0.35))
+    expected = [sigpro.sync_error(tau, signal1, signal2, time) for tau in
+            taus]
+    npt.assert_allclose(sigpro.sync_error_many(taus, signal1, signal2, time),
+            expected, rtol=1e-12)
+
+def test_fill_nan_gaps():
+    time = np.arange(2000) / 200.
+    signal = np.sin(3. * time) + 0.2 * np.sin(11. * time)
+
+    # no nans returns the input
+    assert sigpro.fill_nan_gaps(signal, time) is signal
+
+    withNans = signal.copy()
+    withNans[[0, 50, 51, 52, 700, 1999]] = np.nan
+    withNans[1200:1210] = np.nan
+    filled = sigpro.fill_nan_gaps(withNans, time)
+    assert not np.isnan(filled).any()
+    assert np.isnan(withNans[50])
+    npt.assert_allclose(filled, signal, atol=1e-3)
+    # the spline through the whole signal gives nearly the same result
+    npt.assert_allclose(filled, process.spline_over_nan(time, withNans),
+            atol=1e-6)
+
+def test_nan_segments():
+    nan = np.nan
+    sig = np.array([nan, 1., 2., nan, nan, 3., 4., 5., nan])
+    starts, stops, isNan = sigpro.nan_segments(sig)
+    npt.assert_equal(starts, [0, 1, 3, 5, 8])
+    npt.assert_equal(stops, [1, 3, 5, 8, 9])
+    npt.assert_equal(isNan, [True, False, True, False, True])
+
+    starts, stops, isNan = sigpro.nan_segments(np.ones(4))
+    npt.assert_equal(starts, [0])
+    npt.assert_equal(stops, [4])
+    npt.assert_equal(isNan, [False])
+
+def test_split_around_nan():
+    nan = np.nan
+    sig = np.array([nan, 1., 2., nan, nan, 3., 4., 5., nan])
+    indices, arrays = sigpro.split_around_nan(sig)
+    assert indices == [(0, 1), (1, 3), (3, 4), (4, 5), (5, 8), (8, 9)]
+    for (start, stop), arr in zip(indices, arrays):
+        npt.assert_equal(arr, sig[start:stop])
+
+    sig = np.ones(4)
+    indices, arrays = sigpro.split_around_nan(sig)
+    assert indices == [(0, 4)]
+    assert arrays[0] is sig
+
+def test_filter_many():
+    sampleRate = 200.
+    time = np.arange(3000) / sampleRate
+    data = np.vstack([np.sin(f * time) + 0.1 * np.sin(70. * f * time) for f
+        in [1., 2., 3.]])
+    for order in [2, 4]:
+        expected = np.vstack([process.butterworth(row, 15., sampleRate,
+            order=order) for row in data])
+        npt.assert_allclose(sigpro.filter_many(data, 15., sampleRate,
+            order=order, axis=1), expected, rtol=1e-10, atol=1e-10)
+        npt.assert_allclose(sigpro.filter_many(data.T, 15., sampleRate,
+            order=order, axis=0), expected.T, rtol=1e-10, atol=1e-10)
+    # the design is cached
+    assert (sigpro.butterworth_design(15., sampleRate) is
+            sigpro.butterworth_design(15., sampleRate))
+
+def test_time_base():
+    time = sigpro.time_base(100, 200., offset=1.)
+    npt.assert_equal(time, process.time_vector(100, 200., start_time=1.))
+    assert sigpro.time_base(100, 200, offset=1) is time
+    assert not time.flags.writeable
+    assert sigpro.time_base(100, 200.) is not time
+    # the least recently used time vectors are dropped
+    for n in range(sigpro._maxTimeBases):
+        sigpro.time_base(n, 10.)
+    assert len(sigpro._timeBases) == sigpro._maxTimeBases
+    assert sigpro.time_base(100, 200., offset=1.) is not time
+
+def test_truncate_many():
+    sampleRate = 200.
+    time = np.arange(1000) / sampleRate
+    data = np.vstack((np.sin(time), np.cos(3. * time), time**2))
+    sources = ['NI', 'VN', 'NI']
+    metadata = {'runid': '00104', 'sampleRate': sampleRate, 'units': 'meter'}
+    for tau in [0.1234, 0.005, -0.05]:
+        truncated = sigpro.truncate_many(data, sources, sampleRate, tau)
+        for row, source, result in zip(data, sources, truncated):
+            metadata.update({'name': 'Test', 'source': source})
+            expected = sigpro.truncate_data(Signal(row, metadata), tau)
+            assert result.shape == expected.shape
+            npt.assert_allclose(result, expected, rtol=1e-12, atol=1e-12)
+
+    npt.assert_raises(ValueError, sigpro.truncate_many, data, ['NI', 'VN',
+        'NA'], sampleRate, 0.1)
+
+def test_fused_steer_torque():
+    np.random.seed(3)
+    n = 500
+    frameAngRate = np.random.randn(3, n)
+    frameAngAccel = np.random.randn(3, n)
+    frameAccel = np.random.randn(3, n)
+    handlebarAngRate = np.random.randn(n)
+    handlebarAngAccel = np.random.randn(n)
+    steerAngle = 0.3 * np.random.randn(n)
+    steerColumnTorque = np.random.randn(n)
+    handlebarInertia = np.array([[0.1, 0., 0.02],
+                                 [0., 0.12, 0.],
+                                 [0.02, 0., 0.05]])
+    args = (frameAngRate, frameAngAccel, frameAccel, handlebarAngRate,
+            handlebarAngAccel, steerAngle, steerColumnTorque, 2.5,
+            handlebarInertia, 0.3475, 0.0861, 0.03, np.array([-0.4, 0., 0.6]))
+
+    components = sigpro.steer_torque_components(*args)
+    expected = sigpro.steer_torque(components)
+
+    npt.assert_allclose(sigpro.fused_steer_torque(*args), expected,
+            rtol=1e-12, atol=1e-12)
+
+    steerTorque, fusedComponents = sigpro.fused_steer_torque(*args,
+            returnComponents=True)
+    npt.assert_allclose(steerTorque, expected, rtol=1e-12, atol=1e-12)
+    assert sorted(fusedComponents.keys()) == sorted(components.keys())
+    for k, v in components.items():
+        npt.assert_allclose(fusedComponents[k], v, rtol=1e-12, atol=1e-12)
+
+    # the steer column torque converted with the factor
+    factor = 0.0254 * 4.44822162
+    converted = list(args)
+    converted[6] = factor * steerColumnTorque
+    expected = sigpro.steer_torque(sigpro.steer_torque_components(*converted))
+    npt.assert_allclose(sigpro.fused_steer_torque(*args,
+        steerColumnFactor=factor), expected, rtol=1e-12, atol=1e-12)
+    steerTorque, fusedComponents = sigpro.fused_steer_torque(*args,
+            returnComponents=True, steerColumnFactor=factor)
+    npt.assert_allclose(steerTorque, expected, rtol=1e-12, atol=1e-12)
+    npt.assert_allclose(fusedComponents['steerColumn'], converted[6])
+
+def test_front_contact_many():
+    from dtk.bicycle import front_contact
+    np.random.seed(5)
+    n = 200
+    q1 = np.random.randn(n)
+    q2 = np.random.randn(n)
+    q3 = np.random.randn(n)
+    q4 = 0.2 * np.random.randn(n)
+    q7 = 0.3 * np.random.randn(n)
+    # the benchmark bicycle in Moore's coordinates
+    geometry = (0.9534570696121849, 0.2676445084476887, 0.03207142672761929,
+            0.3, 0.35)
+
+    q9, q10 = sigpro.front_contact_many(q1, q2, q3, q4, q7, *geometry)
+    expected9, expected10 = np.vectorize(front_contact)(q1, q2, q3, q4, q7,
+            *geometry)
+
+    npt.assert_allclose(q9, expected9, rtol=1e-12, atol=1e-12)
+    npt.assert_allclose(q10, expected10, rtol=1e-12, atol=1e-12)
+
+def test_integrate_many():
+    from scipy.integrate import cumtrapz
+    from scipy.optimize import curve_fit
+    sampleRate = 200.
+    time = np.arange(2000) / sampleRate
+    data = np.vstack((np.cos(time) + 0.1 * time, np.sin(3. * time) - 0.2))
+
+    integrated, coefficients = sigpro.integrate_many(data, sampleRate,
+            initialCondition=np.array([1., 2.]))
+    assert coefficients is None
+    for row, initial, result in zip(data, [1., 2.], integrated):
+        expected = np.hstack((0., cumtrapz(row, x=time))) + initial
+        npt.assert_allclose(result, expected, rtol=1e-10, atol=1e-10)
+
+    def line(x, a, b, c):
+        return a * x**2 + b * x + c
+
+    integrated, coefficients = sigpro.integrate_many(data, sampleRate,
+            detrend=True)
+    assert coefficients.shape == (2, 3)
+    for row, coeffs, result in zip(data, coefficients, integrated):
+        grated = np.hstack((0., cumtrapz(row, x=time)))
+        popt, pcov = curve_fit(line, time, grated)
+        npt.assert_allclose(coeffs, popt, rtol=1e-6, atol=1e-8)
+        npt.assert_allclose(result, grated - line(time, *popt), atol=1e-6)
+
+    # a single signal and a higher order drift
+    integrated, coefficients = sigpro.integrate_many(data[0], sampleRate,
+            detrend=True, order=3)
+    assert integrated.shape == (2000,)
+    assert coefficients.shape == (4,)
+
+def test_derivative_many():
+    sampleRate = 200.
+    time = process.time_vector(500, sampleRate)
+    data = np.vstack((np.sin(time), np.cos(4. * time), time**3))
+
+    derivatives = sigpro.derivative_many(data, sampleRate)
+    for row, result in zip(data, derivatives):
+        expected = process.derivative(time, row, method='combination')
+        npt.assert_allclose(result, expected, rtol=1e-9, atol=1e-9)
+
+    npt.assert_allclose(sigpro.derivative_many(data[0], sampleRate),
+            derivatives[0])
+
+    # too short for the stencils
+    npt.assert_allclose(sigpro.derivative_many(data[:, :2], sampleRate),
+            np.repeat((data[:, 1:2] - data[:, :1]) * sampleRate, 2, axis=1))
+    npt.assert_allclose(sigpro.derivative_many([1., 3.], 2.), [4., 4.])
+    npt.assert_raises(ValueError, sigpro.derivative_many, data[:, :1],
+            sampleRate)
+
+def test_single_precision():
+    sampleRate = 200.
+    time = np.arange(1000) / sampleRate
+    data = np.vstack((np.sin(time), np.cos(3. * time))).astype(np.float32)
+
+    assert sigpro.filter_many(data, 15., sampleRate).dtype == np.float32
+    assert sigpro.derivative_many(data, sampleRate).dtype == np.float32
+    truncated = sigpro.truncate_many(data, ['NI', 'VN'], sampleRate, 0.1)
+    assert truncated.dtype == np.float32
+    npt.assert_allclose(truncated, sigpro.truncate_many(
+        data.astype(np.float64), ['NI', 'VN'], sampleRate, 0.1), atol=1e-6)
+    # integration is always done in double precision
+    assert sigpro.integrate_many(data, sampleRate)[0].dtype == np.float64
@@ -0,0 +1,142 @@
+from math import pi
+
+import numpy as np
+import numpy.testing as npt
+
+from bicycledataprocessor.main import Signal
+from bicycledataprocessor.units import (UnitRegistry, Quantity, registry,
+                                        conversion_factor)
+
+def make_signal(name, units, data=None):
+    if data is None:
+        data = np.arange(1., 6.)
+    metadata = {'name': name,
+                'runid': '00104',
+                'sampleRate': 200.,
+                'source': 'NI',
+                'units': units}
+    return Signal(data, metadata)
+
+def test_parse():
+    factor, dimensions = registry.parse('meter/second/second')
+    assert factor == 1.
+    assert dimensions == (('length', 1.), ('time', -2.))
+
+    factor, dimensions = registry.parse('inch*pound')
+    npt.assert_allclose(factor, 0.0254 * 4.44822162)
+    assert dimensions == registry.parse('newton*meter')[1]
+
+    assert registry.parse('meter**2/second') == registry.parse(
+            'meter*meter/second')
+    assert registry.parse('1/second')[1] == registry.parse('hertz')[1]
+    assert registry.parse('unitless') == (1., ())
+
+    npt.assert_raises(KeyError, registry.parse, 'furlong')
+    npt.assert_raises(KeyError, registry.parse, 'meter**two')
+    npt.assert_raises(KeyError, registry.parse, None)
+
+def test_conversion_factor():
+    npt.assert_allclose(conversion_factor('degree', 'radian'), pi / 180.)
+    npt.assert_allclose(conversion_factor('degree/second/second',
+        'radian/second/second'), pi / 180.)
+    npt.assert_allclose(conversion_factor('radian/second', 'degree/second'),
+            180. / pi)
+    npt.assert_allclose(conversion_factor('inch*pound', 'newton*meter'),
+            25.4 / 1000. * 4.44822162)
+    npt.assert_allclose(conversion_factor('feet/second', 'meter/second'),
+            0.3048)
+    npt.assert_allclose(conversion_factor('mile/hour', 'meter/second'),
+            0.44704)
+    assert conversion_factor('volts', 'volts') == 1.
+
+    npt.assert_raises(KeyError, conversion_factor, 'meter', 'second')
+    npt.assert_raises(KeyError, conversion_factor, 'degree', 'meter')
+
+    units = UnitRegistry()
+    units.define('meter', 1., {'length': 1})
+    units.define('furlong', 201.168, {'length': 1})
+    npt.assert_allclose(units.factor('furlong', 'meter'), 201.168)
+    npt.assert_raises(KeyError, units.factor, 'furlong', 'inch')
+
+def test_quantity():
+    data = np.arange(1., 6.)
+    rate = make_signal('ForkRate', 'degree/second', data=data)
+    other = make_signal('AngularRateZ', 'degree/second', data=2. * data)
+
+    quantity = rate.in_units('radian/second')
+    assert isinstance(quantity, Quantity)
+    assert quantity.array is rate
+    npt.assert_allclose(quantity.factor, pi / 180.)
+
+    # numbers only change the factor
+    scaled = -2. * quantity / 4.
+    assert isinstance(scaled, Quantity)
+    assert scaled.array is rate
+    npt.assert_allclose(scaled.factor, -pi / 360.)
+    value = scaled.value()
+    assert isinstance(value, Signal)
+    assert value.units == 'radian/second'
+    npt.assert_allclose(value, -pi / 360. * data)
+    # the original signal is not changed
+    assert rate.units == 'degree/second'
+    npt.assert_allclose(rate, data)
+
+    # arrays and other quantities apply the factors
+    difference = quantity - other.in_units('radian/second')
+    assert isinstance(difference, Signal)
+    assert difference.units == 'radian/second'
+    npt.assert_allclose(difference, -pi / 180. * data)
+
+    product = np.cos(data) * quantity
+    assert isinstance(product, Signal)
+    npt.assert_allclose(product, pi / 180. * data * np.cos(data))
+
+    npt.assert_allclose(quantity / data, pi / 180. * np.ones(5))
+    npt.assert_allclose(1. + quantity, 1. + pi / 180. * data)
+    npt.assert_allclose(quantity + quantity, pi / 90. * data)
+
+    # sums with the same and different factors
+    otherQuantity = other.in_units('radian/second')
+    npt.assert_allclose(quantity - 3. * otherQuantity, -5. * pi / 180. * data)
+    npt.assert_allclose(-quantity - otherQuantity, -3. * pi / 180. * data)
+    npt.assert_allclose(2. * quantity + 3. * otherQuantity,
+            8. * pi / 180. * data)
+    npt.assert_allclose(0. * quantity + otherQuantity, pi / 90. * data)
+    npt.assert_allclose(quantity + data, (1. + pi / 180.) * data)
+    npt.assert_allclose(data - quantity, (1. - pi / 180.) * data)
+    npt.assert_allclose(1. - quantity, 1. - pi / 180. * data)
+    npt.assert_allclose(rate.in_units('degree/second') - data, 0. * data)
+    assert (quantity - otherQuantity).units == 'radian/second'
+    # the inputs are not changed
+    npt.assert_allclose(rate, data)
+    npt.assert_allclose(other, 2. * data)
+
+    # a matching unit has no factor
+    same = rate.in_units('degree/second')
+    assert same.factor == 1.
+    npt.assert_allclose(same.value(), data)
+
+    npt.assert_raises(KeyError, rate.in_units, 'meter')
+
+    # quantities in different units can't be summed
+    angle = make_signal('SteerAngle', 'degree', data=data)
+    torque = make_signal('SteerTubeTorque', 'inch*pound', data=data)
+    npt.assert_raises(ValueError, angle.in_units('degree').__add__,
+            torque.in_units('newton*meter'))
+    npt.assert_raises(ValueError, angle.in_units('radian').__rsub__,
+            torque.in_units('newton*meter'))
+    npt.assert_raises(ValueError, quantity.__sub__, rate.in_units(
+        'degree/second'))
+    npt.assert_raises(ValueError, (0. * quantity).__add__,
+            torque.in_units('newton*meter'))
+
+def test_convert_units():
+    speed = make_signal('Speed', 'mile/hour')
+    converted = speed.convert_units('meter/second')
+    assert converted.units == 'meter/second'
+    npt.assert_allclose(converted, 0.44704 * np.arange(1., 6.))
+    assert speed.convert_units('mile/hour') is not None
+
+    single = make_signal('Angle', 'degree',
+            data=np.arange(1., 6., dtype=np.float32))
+    assert single.in_units('radian').value().dtype == np.float32
@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+
+# built in imports
+import re
+from math import pi
+
+# dependencies
+import numpy as np
+
+class UnitRegistry(object):
+    """
+    A collection of units that can parse composite units, e.g.
+    'meter/second/second' or 'inch*pound', and compute the factors that
+    convert between units with the same dimensions.
+
+    Composite units are the names of the units joined with '*' and '/' and
+    optionally raised to a power with '**', e.g. 'newton*meter**2/second'.
+    Each '/' divides by the next unit only, so 'meter/second/second' is
+    meter per second squared. The unit '1' is dimensionless, e.g. '1/second'.
+
+    """
+
+    def __init__(self):
+        self.units = {}
+        self._parsed = {}
+        self._factors = {}
+
+    def define(self, name, factor, dimensions):
+        """
+        Adds a unit to the registry.
+
+        Parameters
+        ----------
+        name : str
+            The name of the unit, e.g. 'inch'.
+        factor : float
+            The value of one of the unit in the base units of its dimensions,
+            e.g. 0.0254 for an inch.
+        dimensions : dictionary
+            The exponent of each base dimension, e.g. {'length': 1}.
+
+        """
+        self.units[name] = (float(factor), dict(dimensions))
+        self._parsed.clear()
+        self._factors.clear()
+
+    def parse(self, units):
+        """
+        Returns the factor to the base units and the dimensions of a unit.
+
+        Parameters
+        ----------
+        units : str
+            A simple or composite unit.
+
+        Returns
+        -------
+        factor : float
+            The value of one of the unit in base units.
+        dimensions : tuple
+            The sorted (dimension, exponent) pairs of the unit.
+
+        Raises
+        ------
+        KeyError
+            If a unit isn't in the registry or the string can't be parsed.
+
+        """
+        try:
+            return self._parsed[units]
+        except KeyError:
+            pass
+
+        if not isinstance(units, basestring):
+            raise KeyError('{0} are not valid units.'.format(units))
+
+        tokens = re.split(r'(\*\*|\*|/)', units.replace(' ', ''))
+        factor = 1.
+        dimensions = {}
+        sign = 1.
+        i = 0
+        while i < len(tokens):
+            name = tokens[i]
+            power = 1.
+            if i + 2 < len(tokens) and tokens[i + 1] == '**':
+                try:
+                    power = float(tokens[i + 2])
+                except ValueError:
+                    raise KeyError('{0} are not valid units.'.format(units))
+                i += 2
+            if name == '1':
+                unitFactor, unitDimensions = 1., {}
+            else:
+                try:
+                    unitFactor, unitDimensions = self.units[name]
+                except KeyError:
+                    raise KeyError('{0} is not a unit in the registry.'.format(
+                        name))
+            factor *= unitFactor**(sign * power)
+            for dimension, exponent in unitDimensions.items():
+                dimensions[dimension] = (dimensions.get(dimension, 0.) +
+                        sign * power * exponent)
+            i += 1
+            if i < len(tokens):
+                if tokens[i] == '*':
+                    sign = 1.
+                elif tokens[i] == '/':
+                    sign = -1.
+                else:
+                    raise KeyError('{0} are not valid units.'.format(units))
+                i += 1
+
+        dimensions = tuple(sorted((k, v) for k, v in dimensions.items() if v
+            != 0.))
+        self._parsed[units] = (factor, dimensions)
+        return factor, dimensions
+
+    def factor(self, fromUnits, toUnits):
+        """
+        Returns the factor that converts a value from one unit to another.
+
+        Parameters
+        ----------
+        fromUnits : str
+            The units of the value.
+        toUnits : str
+            The desired units.
+
+        Returns
+        -------
+        factor : float
+            The value in `toUnits` is the value in `fromUnits` times this.
+
+        Raises
+        ------
+        KeyError
+            If the units can't be parsed or have different dimensions.
+
+        """
+        key = (fromUnits, toUnits)
+        try:
+            return self._factors[key]
+        except KeyError:
+            pass
+        if fromUnits == toUnits:
+            factor = 1.
+        else:
+            fromFactor, fromDimensions = self.parse(fromUnits)
+            toFactor, toDimensions = self.parse(toUnits)
+            if fromDimensions != toDimensions:
+                raise KeyError(('Conversion from {0} to {1} is not possible ' +
+                    'or not defined.').format(fromUnits, toUnits))
+            factor = fromFactor / toFactor
+        self._factors[key] = factor
+        return factor
+
+registry = UnitRegistry()
+
+# pound is the pound force
+_force = {'mass': 1, 'length': 1, 'time': -2}
+for _name, _factor, _dimensions in [
+        ('meter', 1., {'length': 1}),
+        ('inch', 0.0254, {'length': 1}),
+        ('feet', 0.3048, {'length': 1}),
+        ('foot', 0.3048, {'length': 1}),
+        ('mile', 1609.344, {'length': 1}),
+        ('kilogram', 1., {'mass': 1}),
+        ('second', 1., {'time': 1}),
+        ('minute', 60., {'time': 1}),
+        ('hour', 3600., {'time': 1}),
+        ('hertz', 1., {'time': -1}),
+        ('radian', 1., {'angle': 1}),
+        ('degree', pi / 180., {'angle': 1}),
+        ('newton', 1., _force),
+        ('pound', 4.44822162, _force),
+        ('kelvin', 1., {'temperature': 1}),
+        ('volt', 1., {'voltage': 1}),
+        ('volts', 1., {'voltage': 1}),
+        ('unitless', 1., {})]:
+    registry.define(_name, _factor, _dimensions)
+
+def conversion_factor(fromUnits, toUnits):
+    """Returns the factor that converts a value from one unit to another with
+    the default registry, see `UnitRegistry.factor`."""
+    return registry.factor(fromUnits, toUnits)
+
+class Quantity(object):
+    """
+    An array in some units with a conversion factor that hasn't been applied
+    yet.
+
+    Multiplying or dividing by numbers and negating only change the factor.
+    Arithmetic with arrays or other quantities applies the factors to the
+    new result in place, so a chain of conversions and scalings ending in
+    one such operation costs one extra pass over the result and no extra
+    arrays. Adding or subtracting quantities with the same factor, e.g.
+    a * f - b * f, is computed as (a - b) * f. Different factors cost one
+    more pass. Only quantities in the same units can be added or
+    subtracted. Quantities can't be passed to numpy functions, use `value()`
+    first.
+
+    Attributes
+    ----------
+    array : ndarray
+        The data in the original units.
+    factor : float
+        The factor that converts the data to `units`.
+    units : str
+        The units of the quantity.
+
+    """
+
+    # ndarray arithmetic with a quantity uses the quantity's methods
+    __array_ufunc__ = None
+
+    def __init__(self, array, factor=1., units=None):
+        self.array = array
+        self.factor = factor
+        self.units = units
+
+    def __len__(self):
+        return len(self.array)
+
+    def __repr__(self):
+        return 'Quantity({0} * {1}, {2})'.format(self.factor,
+                self.array.__class__.__name__, self.units)
+
+    def _labelled(self):
+        # a view of the array with the quantity's units, so the metadata of
+        # signals computed from it has the right units
+        labelled = self.array.view()
+        if hasattr(labelled, 'units'):
+            labelled.units = self.units
+        return labelled
+
+    def value(self):
+        """Returns the array in the units of the quantity."""
+        labelled = self._labelled()
+        if self.factor == 1.:
+            return labelled
+        else:
+            return labelled * self.factor
+
+    def _scale(self, factor):
+        return Quantity(self.array, self.factor * factor, self.units)
+
+    def _apply(self, result, factor):
+        # applies a factor to a newly computed result in place
+        if factor != 1.:
+            result *= factor
+        return result
+
+    def __neg__(self):
+        return self._scale(-1.)
+
+    def __pos__(self):
+        return self
+
+    def __mul__(self, other):
+        if np.isscalar(other):
+            return self._scale(other)
+        elif isinstance(other, Quantity):
+            return self._apply(self._labelled() * other._labelled(),
+                    self.factor * other.factor)
+        else:
+            return self._apply(self._labelled() * other, self.factor)
+
+    def __rmul__(self, other):
+        if np.isscalar(other):
+            return self._scale(other)
+        else:
+            return self._apply(other * self._labelled(), self.factor)
+
+    def __truediv__(self, other):
+        if np.isscalar(other):
+            return self._scale(1. / other)
+        elif isinstance(other, Quantity):
+            return self._apply(self._labelled() / other._labelled(),
+                    self.factor / other.factor)
+        else:
+            return self._apply(self._labelled() / other, self.factor)
+
+    def __rtruediv__(self, other):
+        return self._apply(other / self._labelled(), 1. / self.factor)
+
+    __div__ = __truediv__
+    __rdiv__ = __rtruediv__
+
+    def _sum(self, other, sign):
+        # self + sign * other with the factors applied to the new result
+        if isinstance(other, Quantity) and other.units != self.units:
+            raise ValueError(('A quantity in {0} can not be added to one in ' +
+                '{1}, convert them to the same units first.').format(
+                    other.units, self.units))
+        elif isinstance(other, Quantity) and self.factor == 0.:
+            # keeps the nans of self
+            return self.value() + (other * sign).value()
+        elif isinstance(other, Quantity):
+            ratio = sign * other.factor / self.factor
+            if ratio == 1.:
+                result = self._labelled() + other._labelled()
+            elif ratio == -1.:
+                result = self._labelled() - other._labelled()
+            else:
+                # the ratio is applied in the array that holds the result
+                result = other._labelled() * ratio
+                np.add(self._labelled(), result, out=result)
+            return self._apply(result, self.factor)
+        elif self.factor == 1.:
+            if sign == 1.:
+                return self._labelled() + other
+            else:
+                return self._labelled() - other
+        else:
+            # the scaled copy is new, so it can be added to in place
+            result = self._labelled() * self.factor
+            if sign == 1.:
+                result += other
+            else:
+                result -= other
+            return result
+
+    def __add__(self, other):
+        return self._sum(other, 1.)
+
+    def __radd__(self, other):
+        return self._sum(other, 1.)
+
+    def __sub__(self, other):
+        return self._sum(other, -1.)
+
+    def __rsub__(self, other):
+        # other - self is -self + other, the sign is applied with the factor
+        return (-self)._sum(other, 1.)
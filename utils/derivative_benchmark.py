@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+# This compares the time derivatives of a stage of signals computed one at a
+# time with dtk.process.derivative to the derivatives of the stacked signals
+# computed with derivative_many, which is what Signal.time_derivative,
+# SignalBundle.time_derivative and Run.compute_steer_torque use.
+
+import sys
+sys.path.append('..')
+
+import timeit
+
+import numpy as np
+import dtk.process as process
+
+from bicycledataprocessor import signalprocessing as sigpro
+
+sampleRate = 200.
+numSamples = 12000
+numSignals = 4
+
+time = process.time_vector(numSamples, sampleRate)
+data = np.vstack([np.sin((i + 1) * time) + 0.1 *
+    np.random.randn(numSamples) for i in range(numSignals)])
+
+def one_at_a_time():
+    return np.vstack([process.derivative(time, row, method='combination')
+        for row in data])
+
+def stacked():
+    return sigpro.derivative_many(data, sampleRate)
+
+maxDiff = np.max(np.abs(one_at_a_time() - stacked()))
+
+number = 5
+singleTime = timeit.timeit(one_at_a_time, number=number) / number
+batchTime = timeit.timeit(stacked, number=number) / number
+
+print('{} signals with {} samples'.format(numSignals, numSamples))
+print('Maximum difference: {:1.2e}'.format(maxDiff))
+print('One at a time: {:1.5f} s'.format(singleTime))
+print('Stacked: {:1.5f} s'.format(batchTime))
+print('Speedup: {:1.1f}'.format(singleTime / batchTime))
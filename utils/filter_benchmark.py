@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+# This compares filtering a stage of signals one at a time, with the filter
+# designed for every signal (dtk.process.butterworth) and with the cached
+# design (Signal.filter), to filtering the stacked signals with
+# filter_signals, which is what Run.filter_top_signals does.
+
+import sys
+sys.path.append('..')
+
+import timeit
+
+import numpy as np
+import dtk.process as process
+
+from bicycledataprocessor.main import Signal, filter_signals
+
+sampleRate = 200.
+numSamples = 12000
+numSignals = 30
+filterFreq = 15.
+
+time = np.arange(numSamples) / sampleRate
+signals = {}
+for i in range(numSignals):
+    data = np.sin((i + 1) * time) + 0.1 * np.random.randn(numSamples)
+    meta = {'name': 'Signal{}'.format(i), 'runid': '00000',
+            'sampleRate': sampleRate, 'source': 'NI', 'units': 'meter'}
+    signals[meta['name']] = Signal(data, meta)
+
+def redesigned():
+    return dict((k, process.butterworth(v.spline(), filterFreq, sampleRate))
+            for k, v in signals.items())
+
+def one_at_a_time():
+    return dict((k, v.filter(filterFreq)) for k, v in signals.items())
+
+def stacked():
+    return filter_signals(signals, filterFreq)
+
+single = one_at_a_time()
+batch = stacked()
+maxDiff = max(np.max(np.abs(np.asarray(single[k]) - np.asarray(batch[k])))
+    for k in signals.keys())
+
+number = 10
+redesignedTime = timeit.timeit(redesigned, number=number) / number
+singleTime = timeit.timeit(one_at_a_time, number=number) / number
+batchTime = timeit.timeit(stacked, number=number) / number
+
+print('{} signals with {} samples'.format(numSignals, numSamples))
+print('Maximum difference: {:1.2e}'.format(maxDiff))
+print('One at a time, redesigned: {:1.4f} s'.format(redesignedTime))
+print('One at a time, cached design: {:1.4f} s'.format(singleTime))
+print('Stacked: {:1.4f} s'.format(batchTime))
+print('Speedup: {:1.1f}'.format(redesignedTime / batchTime))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+# This processes every run in the database in double and single precision
+# and reports the error of the single precision task signals relative to the
+# range of the double precision ones, the memory used by the stages and the
+# processing time.
+
+import sys
+sys.path.append('..')
+
+import time
+
+import numpy as np
+from tables import NoSuchNodeError
+
+import bicycledataprocessor as bdp
+from bicycledataprocessor.database import run_id_string
+from bicycledataprocessor.bdpexceptions import TimeShiftError
+
+dataset = bdp.DataSet()
+dataset.open()
+runIDs = [run_id_string(row['RunID']) for row in
+        dataset.database.root.runTable.iterrows()]
+dataset.close()
+
+precisions = ['float64', 'float32']
+
+errors = {}
+nbytes = dict((p, []) for p in precisions)
+durations = dict((p, []) for p in precisions)
+
+for runid in runIDs:
+    runs = {}
+    runDurations = {}
+    for precision in precisions:
+        start = time.time()
+        try:
+            run = bdp.Run(runid, dataset, forceRecalc=True, store=False,
+                    precision=precision)
+        except (TimeShiftError, NoSuchNodeError, IndexError, KeyError) as e:
+            print('Skipping run {}: {}'.format(runid, e))
+            break
+        if not hasattr(run, 'taskSignals'):
+            # the maneuver isn't processed beyond the calibrated signals
+            print('Skipping run {}: it has no task signals.'.format(runid))
+            break
+        # evaluate all of the lazy signals
+        run.taskSignals.items()
+        runDurations[precision] = time.time() - start
+        runs[precision] = run
+
+    # only the runs that were processed in both precisions are compared
+    if len(runs) < len(precisions):
+        continue
+    for precision in precisions:
+        durations[precision].append(runDurations[precision])
+        nbytes[precision].append(sum(runs[precision].nbytes.values()))
+
+    double = runs['float64'].taskSignals
+    single = runs['float32'].taskSignals
+    for name in double.keys():
+        reference = np.asarray(double[name])
+        span = np.nanmax(reference) - np.nanmin(reference)
+        if span == 0.:
+            span = 1.
+        error = np.nanmax(np.abs(np.asarray(single[name], dtype=np.float64)
+            - reference)) / span
+        errors.setdefault(name, []).append(error)
+
+print('=' * 79)
+print('{} runs'.format(len(durations['float64'])))
+print('Maximum error relative to the signal range')
+print('-' * 79)
+for name in sorted(errors.keys()):
+    print('{:<30} median {:1.2e} max {:1.2e}'.format(name,
+        np.median(errors[name]), np.max(errors[name])))
+print('-' * 79)
+for precision in precisions:
+    print('{}: mean {:1.1f} MB per run, mean {:1.2f} s per run'.format(
+        precision, np.mean(nbytes[precision]) / 1e6,
+        np.mean(durations[precision])))
+print('Throughput ratio: {:1.2f}'.format(np.sum(durations['float64']) /
+    np.sum(durations['float32'])))
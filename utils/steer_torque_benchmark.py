@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+
+# This compares computing the rider applied steer torque from the ten
+# separate components (steer_torque_components and steer_torque) to the fused
+# evaluation (fused_steer_torque), which is what Run.compute_steer_torque
+# does.
+
+import sys
+sys.path.append('..')
+
+import timeit
+
+import numpy as np
+
+from bicycledataprocessor import signalprocessing as sigpro
+
+numSamples = 12000
+
+frameAngRate = np.random.randn(3, numSamples)
+frameAngAccel = np.random.randn(3, numSamples)
+frameAccel = np.random.randn(3, numSamples)
+handlebarAngRate = np.random.randn(numSamples)
+handlebarAngAccel = np.random.randn(numSamples)
+steerAngle = 0.3 * np.random.randn(numSamples)
+steerColumnTorque = np.random.randn(numSamples)
+handlebarInertia = np.array([[0.1, 0., 0.02],
+                             [0., 0.12, 0.],
+                             [0.02, 0., 0.05]])
+args = (frameAngRate, frameAngAccel, frameAccel, handlebarAngRate,
+        handlebarAngAccel, steerAngle, steerColumnTorque, 2.5,
+        handlebarInertia, 0.3475, 0.0861, 0.03, np.array([-0.4, 0., 0.6]))
+
+def components():
+    return sigpro.steer_torque(sigpro.steer_torque_components(*args))
+
+def fused():
+    return sigpro.fused_steer_torque(*args)
+
+def fused_with_components():
+    return sigpro.fused_steer_torque(*args, returnComponents=True)
+
+maxDiff = np.max(np.abs(components() - fused()))
+
+number = 100
+componentsTime = timeit.timeit(components, number=number) / number
+fusedTime = timeit.timeit(fused, number=number) / number
+withTime = timeit.timeit(fused_with_components, number=number) / number
+
+print('{} samples'.format(numSamples))
+print('Maximum difference: {:1.2e}'.format(maxDiff))
+print('Components: {:1.5f} s'.format(componentsTime))
+print('Fused: {:1.5f} s'.format(fusedTime))
+print('Fused with components: {:1.5f} s'.format(withTime))
+print('Speedup: {:1.1f}'.format(componentsTime / fusedTime))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+# This compares the time shift found with the cross correlation and the multi
+# resolution methods to the one found with the error landscape method for
+# every run in the database and reports the agreement and the speedup.
+
+import sys
+sys.path.append('..')
+
+import time
+
+import numpy as np
+from tables import NoSuchNodeError
+
+import bicycledataprocessor as bdp
+from bicycledataprocessor.main import RawSignal
+from bicycledataprocessor.database import (RunArrayCache, get_cell,
+                                           run_id_string)
+from bicycledataprocessor import signalprocessing as sigpro
+from bicycledataprocessor.bdpexceptions import TimeShiftError
+
+dataset = bdp.DataSet()
+dataset.open()
+
+runTable = dataset.database.root.runTable
+runIDs = [run_id_string(row['RunID']) for row in runTable.iterrows()]
+
+methods = ['landscape', 'xcorr', 'multires']
+
+results = {}
+
+for rownum, runid in enumerate(runIDs):
+    print('Run {}'.format(runid))
+    cache = RunArrayCache(dataset.database)
+    try:
+        niAcc = RawSignal(runid, 'AccelerometerAccelerationY',
+                dataset.database, cache=cache).scale()
+        vnAcc = RawSignal(runid, 'AccelerationZ', dataset.database,
+                cache=cache).scale()
+    except (NoSuchNodeError, IndexError):
+        # the run has no raw data or no accelerometer signals
+        print('Skipping, the accelerometer signals could not be loaded.')
+        continue
+    sampleRate = get_cell(runTable, 'NISampleRate', rownum)
+    speed = get_cell(runTable, 'Speed', rownum)
+
+    taus = []
+    durations = []
+    for method in methods:
+        start = time.time()
+        try:
+            tau = sigpro.find_timeshift(niAcc, vnAcc, sampleRate, speed,
+                    method=method)
+        except TimeShiftError:
+            tau = np.nan
+        durations.append(time.time() - start)
+        taus.append(tau)
+
+    results[runid] = taus + durations
+
+dataset.close()
+
+if len(results) == 0:
+    sys.exit('The time shift could not be computed for any run.')
+
+runs = sorted(results.keys())
+data = np.array([results[r] for r in runs])
+taus = data[:, :len(methods)]
+durations = data[:, len(methods):]
+landscape = taus[:, 0]
+landscapeTime = durations[:, 0]
+
+# one sample at 200 hertz
+sample = 1. / 200.
+
+print('=' * 79)
+print('{} runs'.format(len(runs)))
+print('landscape failed for {} runs, mean time per run {:1.3f} s'.format(
+    np.isnan(landscape).sum(), landscapeTime.mean()))
+
+for i, method in enumerate(methods[1:]):
+    tau = taus[:, i + 1]
+    bothFound = ~np.isnan(landscape) & ~np.isnan(tau)
+    difference = np.abs(landscape - tau)[bothFound]
+    print('-' * 79)
+    print('{} failed for {} runs, both methods found tau for {}'.format(
+        method, np.isnan(tau).sum(), bothFound.sum()))
+    print('Absolute difference in tau: median {:1.2e} s, max {:1.2e} s'.format(
+        np.median(difference), np.max(difference)))
+    print('Runs that differ by more than a sample: {}'.format(
+        [r for r, d in zip(np.array(runs)[bothFound], difference) if d >
+            sample]))
+    print('Mean time per run {:1.3f} s, speedup {:1.1f}'.format(
+        durations[:, i + 1].mean(), landscapeTime.sum() /
+        durations[:, i + 1].sum()))
+
+np.savetxt('timeshift_study.txt', data, header=' '.join(methods +
+    [m + 'Time' for m in methods]))